@@ -210,8 +210,9 @@ async def hard_gate_callback(context=None, **kwargs):
         print(f"Callback error (hard_gate): {e}")
 
 from app.tools_base import (
-    retrieve_docs, read_excel, read_csv, analyze_excel_summary, list_excel_sheets
+    read_excel, read_csv, analyze_excel_summary, list_excel_sheets
 )
+from app.retrieval_tools_async import retrieve_docs
 
 # --- OBSERVABILITY TRACE ---
 # Imported from app.observability
@@ -498,7 +499,7 @@ from app.archive import (
 )
 
 
-from app.archive_tools import save_to_archive, search_archive, get_archived_content
+from app.archive_tools_async import save_to_archive, search_archive, get_archived_content
 
 # Arkistoagentti
 arkisto_def = get_agent_def("arkisto")
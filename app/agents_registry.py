@@ -9,8 +9,9 @@ Used by:
 """
 
 from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from app.tool_ids import ToolId
+from app.context_packer import DEFAULT_CONTEXT_TOKEN_BUDGET
 
 class AgentMetadata(BaseModel):
     id: str
@@ -21,6 +22,8 @@ class AgentMetadata(BaseModel):
     prompt_pack_versions: List[str]
     is_enabled: bool = True
     icon: Optional[str] = None
+    # Max tokens of retrieve_docs context per call (app.context_packer)
+    context_token_budget: int = Field(default=DEFAULT_CONTEXT_TOKEN_BUDGET, gt=0)
 
 # Taxonomy Categories
 LEADERSHIP = "leadership"
@@ -149,6 +152,7 @@ SAMHA_AGENT_REGISTRY: Dict[str, AgentMetadata] = {
         description="Etsii tietoa monipuolisesti (RAG + Web).",
         allowed_tools=RESEARCH_TOOLS,
         prompt_pack_versions=["org_pack_v1"],
+        context_token_budget=8000,
     ),
 
     # OUTPUT
@@ -159,6 +163,7 @@ SAMHA_AGENT_REGISTRY: Dict[str, AgentMetadata] = {
         description="Markkinointi, some-sisällöt ja kuvien generointi.",
         allowed_tools=CREATIVE_TOOLS + BASIC_TOOLS,
         prompt_pack_versions=["org_pack_v1", "writer_pack_v1"],
+        context_token_budget=2000,
     ),
     "kirjoittaja": AgentMetadata(
         id="kirjoittaja",
@@ -191,6 +196,7 @@ SAMHA_AGENT_REGISTRY: Dict[str, AgentMetadata] = {
         description="Arvioi raportteja ja hakemuksia kriittisesti hyödyntäen virallisia oppaita.",
         allowed_tools=RESEARCH_TOOLS,
         prompt_pack_versions=["org_pack_v1"],
+        context_token_budget=6000,
     ),
 
     # QA / POLICY
@@ -220,6 +226,14 @@ def get_agent_def(agent_id: str) -> AgentMetadata:
         raise ValueError(f"Agent ID '{agent_id}' not found in registry.")
     return SAMHA_AGENT_REGISTRY[agent_id]
 
+def get_context_token_budget(agent_id: str) -> int:
+    """
+    retrieve_docs-kontekstin budjetti. Vaiheagentit perivät pääagentin
+    budjetin ("koulutus_draft" → "koulutus"); tuntematon saa oletuksen.
+    """
+    agent = SAMHA_AGENT_REGISTRY.get(agent_id) or SAMHA_AGENT_REGISTRY.get(agent_id.split("_")[0])
+    return agent.context_token_budget if agent else DEFAULT_CONTEXT_TOKEN_BUDGET
+
 def get_all_agents() -> List[AgentMetadata]:
     return list(SAMHA_AGENT_REGISTRY.values())
 
@@ -26,7 +26,7 @@ from app.advanced_tools import process_meeting_transcript, generate_data_chart,
 from app.pdf_tools import read_pdf_content, get_pdf_metadata
 
 # Import Archive tools
-from app.archive_tools import save_to_archive, search_archive, get_archived_content
+from app.archive_tools_async import save_to_archive, search_archive, get_archived_content
 
 # Import Prompt Packs
 from app.prompt_packs import ORG_PACK_V1, FINANCE_PACK_V1, CRITICAL_REFLECTION_PACK_V1, WRITER_PACK_V1, SOTE_PACK_V1, YHDENVERTAISUUS_PACK_V1
@@ -36,10 +36,11 @@ from app.retrievers import get_retriever, get_compressor
 
 
 from app.tools_base import (
-    retrieve_docs, read_excel, read_csv, analyze_excel_summary, list_excel_sheets,
+    read_excel, read_csv, analyze_excel_summary, list_excel_sheets,
     python_interpreter,
     LLM as _BASE_LLM, LLM_TALOUS as _BASE_LLM_TALOUS, LONG_OUTPUT_CONFIG as _BASE_LONG_CONFIG
 )
+from app.retrieval_tools_async import retrieve_docs
 
 # =============================================================================
 # CONFIGURATION
@@ -4,7 +4,13 @@ Samha Knowledge + Output Archive
 SQLite-pohjainen arkisto agentin tuotoksille.
 - Tallentaa: hakemukset, raportit, artikkelit, koulutusrungot
 - Metadata: trace_id, agent, packs, tags, status
-- Haku: suodattava + full-text (otsikko, tiivistelmä, tagit)
+- Haku: suodattava + full-text (otsikko, tiivistelmä, tagit, sisältö), bm25-järjestys
+- Yhteydet: prosessikohtainen WAL-pool (app.archive_db)
+- Tallennus: JSON-tiedosto per kirjaus ("file") tai pakattu BLOB-sarake ("inline")
+- Dedup (valinnainen): sisältö kerran blobs-taulussa sha256-osoitteella,
+  versiot viittaavat siihen; gc_blobs() poistaa viittaamattomat
+- Deltaketjut (valinnainen): versio tallennetaan deltana edellisestä,
+  täysi snapshot joka DELTA_SNAPSHOT_INTERVAL. versio; diff() versioiden välillä
 
 Käyttö:
     from app.archive import ArchiveService
@@ -14,15 +20,44 @@ Käyttö:
     results = archive.search(document_type="hakemus", program="stea")
 """
 
+import base64
+import difflib
+import hashlib
 import json
 import os
 import sqlite3
-from datetime import datetime, timezone
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
 from pathlib import Path
-from typing import List, Optional, Literal
-from pydantic import BaseModel, Field, computed_field
+from typing import (
+    TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Literal, Sequence, Tuple, Union, get_args
+)
+from pydantic import BaseModel, Field, ValidationError, computed_field
 import uuid
 
+try:
+    from google.api_core.exceptions import NotFound as GCSNotFound
+except ImportError:  # google-cloud-storage not installed: local archive only
+    GCSNotFound = None
+
+from app.archive_cache import ArtifactCache, cache_from_env
+from app.archive_codec import ArchiveCodec, train_dictionary as train_zstd_dictionary
+from app.archive_db import SQLitePool, get_pool
+from app.archive_fts import (
+    FTS_PREFIX,
+    FTS_RANK,
+    FTS_TOKENIZE,
+    build_fts_query,
+    split_compounds,
+)
+from app.archive_spool import UploadSpool
+from app.archive_vectors import Embedder, VectorIndex, embedder_from_env, embedding_text
+
+if TYPE_CHECKING:  # app.archive_backends imports this module
+    from app.archive_backends import BlockingArchiveBackend
+
 
 # =============================================================================
 # ENUMS / LITERALS
@@ -57,6 +92,36 @@ ArchiveStatus = Literal[
 
 QADecision = Literal["approve", "needs_revision", "reject"]
 
+SearchOrder = Literal[
+    "relevance",    # bm25 kun query on annettu, muuten created_at
+    "created_at"    # Uusin ensin (keyset-sivutus)
+]
+
+CountMode = Literal[
+    "exact",        # COUNT(*) joka kutsulla
+    "cached",       # COUNT(*) välimuistista, vanhenee kirjoituksessa tai TTL:n jälkeen
+    "none"          # Ei laskentaa (total_count=None)
+]
+
+TagMode = Literal[
+    "all",          # Kaikki annetut tagit (AND)
+    "any"           # Mikä tahansa annetuista tageista (OR)
+]
+
+SearchMode = Literal[
+    "keyword",      # FTS5 (bm25)
+    "vector",       # Upotusten kosinisamankaltaisuus (vaatii embedderin)
+    "hybrid"        # Molemmat, yhdistetty RRF:llä
+]
+
+ArchiveStorage = Literal[
+    "file",         # JSON-tiedosto per kirjaus (artifacts/<id>.json)
+    "inline"        # Pakattu JSON entries.content_blob -sarakkeessa
+]
+
+# blobs row: (hash, codec, data, path, size, base, depth)
+BlobRow = Tuple[str, Optional[str], Optional[bytes], Optional[str], int, Optional[str], int]
+
 
 # =============================================================================
 # ARCHIVE ENTRY MODEL
@@ -131,6 +196,7 @@ class ArchiveSearchQuery(BaseModel):
     project: Optional[Project] = None
     status: Optional[ArchiveStatus] = None
     tags: Optional[List[str]] = None
+    tag_mode: TagMode = Field("all", description="all = kaikki tagit (AND), any = jokin (OR)")
     agent_name: Optional[str] = None
     
     # Date range
@@ -138,22 +204,172 @@ class ArchiveSearchQuery(BaseModel):
     date_to: Optional[datetime] = None
     
     # Options
-    latest_only: bool = Field(False, description="Vain uusin per title")
+    latest_only: bool = Field(False, description="Vain uusin versio per lineage (parent_id-ketju)")
     approved_only: bool = Field(False, description="Vain qa_decision=approve")
     
     # Full-text search
-    query: Optional[str] = Field(None, description="Hakusana: otsikko, tiivistelmä, tagit")
+    query: Optional[str] = Field(
+        None,
+        description='Hakusana: otsikko, tiivistelmä, tagit, sisältö. Tukee "fraaseja" ja prefix*'
+    )
+    order_by: SearchOrder = Field("relevance", description="relevance | created_at")
+    mode: SearchMode = Field(
+        "keyword", description="keyword | vector | hybrid (vector/hybrid vaativat embedderin)"
+    )
     
     # Pagination
     limit: int = Field(20, ge=1, le=100)
     offset: int = Field(0, ge=0)
+    cursor: Optional[str] = Field(
+        None, description="Edellisen sivun next_cursor (keyset, korvaa offsetin)"
+    )
+    count_mode: CountMode = Field("exact", description="exact | cached | none")
+
+
+class ArchiveEntryView(BaseModel):
+    """
+    Kevyt hakutulosrivi (projektio): vain pyydetyt metadatasarakkeet
+    suoraan SQLitestä, ilman sisältöä tai artifactin latausta.
+    """
+    id: str
+    trace_id: Optional[str] = None
+    title: Optional[str] = None
+    summary: Optional[str] = None
+    document_type: Optional[str] = None
+    program: Optional[str] = None
+    project: Optional[str] = None
+    tags: Optional[List[str]] = None
+    audience: Optional[str] = None
+    language: Optional[str] = None
+    channel: Optional[str] = None
+    status: Optional[str] = None
+    qa_decision: Optional[str] = None
+    qa_report_id: Optional[str] = None
+    agent_name: Optional[str] = None
+    prompt_packs: Optional[List[str]] = None
+    version: Optional[int] = None
+    parent_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    word_count: Optional[int] = None
+
+
+# Metadata columns that can be projected without loading the entry body
+PROJECTION_FIELDS = frozenset(ArchiveEntryView.model_fields)
 
 
 class ArchiveSearchResult(BaseModel):
     """Hakutulos."""
-    entries: List[ArchiveEntry]
-    total_count: int
+    entries: List[Union[ArchiveEntry, ArchiveEntryView]]
+    total_count: Optional[int]
     query: ArchiveSearchQuery
+    next_cursor: Optional[str] = Field(None, description="Seuraavan sivun kursori")
+    snippets: Dict[str, str] = Field(
+        default_factory=dict, description="Tekstihaun osumakohdat: entry id → snippet"
+    )
+
+
+def encode_cursor(created_at: str, entry_id: str) -> str:
+    """Keyset-kursori (created_at, id) URL-turvallisena merkkijonona."""
+    raw = json.dumps([created_at, entry_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def content_hash(content: str) -> str:
+    """Sisällön osoite (sha256): sama teksti → sama blob kaikille versioille."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def normalize_tag(tag: str) -> str:
+    """Tagien vertailumuoto: "  STEA " → "stea"."""
+    return tag.strip().lower()
+
+
+def lineage_roots(
+    entries: Sequence[ArchiveEntry], stored_root: Callable[[str], Optional[str]]
+) -> Dict[str, str]:
+    """
+    Tallennuserän root_id:t: id → lineagen juuri.
+
+    Erän sisäiset vanhemmat lasketaan järjestyksestä riippumatta;
+    stored_root(parent_id) antaa tallennetun vanhemman juuren (None = ei ole).
+    """
+    parents = {entry.id: entry.parent_id for entry in entries}
+    roots: Dict[str, str] = {}
+    for entry in entries:
+        top, seen = entry.id, {entry.id}
+        while parents.get(top) in parents and parents[top] not in seen:
+            top = parents[top]
+            seen.add(top)
+        root_id = top
+        if parents[top] and parents[top] not in parents:
+            root_id = stored_root(parents[top]) or top
+        roots[entry.id] = root_id
+    return roots
+
+
+def next_version(existing: ArchiveEntry, updates: dict) -> ArchiveEntry:
+    """update():n uusi versio: uusi id, version + 1, parent_id = existing.id."""
+    new_data = existing.model_dump()
+    new_data.update(updates)
+    new_data["version"] = existing.version + 1
+    new_data["parent_id"] = existing.id
+    new_data["id"] = f"art_{datetime.now().strftime('%Y%m%d')}_{uuid.uuid4().hex[:6]}"
+    new_data["updated_at"] = datetime.now(timezone.utc)
+    return ArchiveEntry(**new_data)
+
+
+# Fields patch_metadata() may change in place (no new version/artifact)
+PATCHABLE_FIELDS = frozenset({
+    "title", "summary", "tags", "audience", "language", "channel",
+    "status", "qa_decision", "qa_report_id", "program", "project",
+})
+
+
+def validate_patch(fields: dict) -> dict:
+    """
+    patch_metadata():n kentät mallin validoinnilla (Literal-arvot,
+    tiivistelmän pituus, ...). Palauttaa validoidut arvot.
+    
+    Raises:
+        ValueError: kenttä ei ole PATCHABLE_FIELDS-joukossa tai arvo ei kelpaa
+    """
+    unknown = set(fields) - PATCHABLE_FIELDS
+    if unknown:
+        raise ValueError(
+            f"Not patchable: {sorted(unknown)} (use update() for a new version)"
+        )
+    scratch = ArchiveEntry.model_construct()
+    patch = {}
+    for name, value in fields.items():
+        try:
+            ArchiveEntry.__pydantic_validator__.validate_assignment(scratch, name, value)
+        except ValidationError as e:
+            raise ValueError(f"Invalid value for {name}: {e}") from e
+        patch[name] = getattr(scratch, name)
+    return patch
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid archive cursor: {cursor!r}") from e
+    return created_at, entry_id
+
+
+def next_page(
+    query: ArchiveSearchQuery, result: ArchiveSearchResult
+) -> Optional[ArchiveSearchQuery]:
+    """iter_searchin seuraava sivu: keyset-kursori, vektori/hybridi offsetilla. None = loppu."""
+    if query.mode != "keyword" and query.query:
+        # The fused candidate set has no cursor but is bounded (SEMANTIC_CANDIDATES)
+        if len(result.entries) < query.limit:
+            return None
+        return query.model_copy(update={"offset": query.offset + query.limit})
+    if result.next_cursor is None:
+        return None
+    return query.model_copy(update={"cursor": result.next_cursor})
 
 
 # =============================================================================
@@ -163,86 +379,758 @@ class ArchiveSearchResult(BaseModel):
 class ArchiveService:
     """SQLite-pohjainen arkistopalvelu."""
     
-    def __init__(self, db_path: str = "./archive/samha_archive.db"):
+    def __init__(
+        self,
+        db_path: str = "./archive/samha_archive.db",
+        pool: Optional[SQLitePool] = None,
+        storage: ArchiveStorage = "file",
+        dedup: bool = False,
+        delta_chains: bool = False,
+        embedder: Optional[Embedder] = None,
+        cold_dir: Optional[Union[str, Path]] = None,
+    ):
+        """
+        Args:
+            dedup: sisältö (content) tallennetaan kerran blobs-tauluun
+                sha256-osoitteella; kirjauksen oma artifact/BLOB sisältää
+                vain metadatan. Vanhat rivit (content_hash NULL) toimivat ennallaan.
+            delta_chains: uuden version sisältö tallennetaan deltana
+                parent_id-version sisällöstä (vaatii dedupin, kytketään päälle).
+            embedder: upotusmalli (embed_documents/embed_query) semanttiselle
+                haulle; kirjaukset upotetaan save():ssa. None = vain FTS.
+            cold_dir: move_to_cold():n kohdehakemisto (oletus <arkisto>/cold),
+                esim. halvemmalle levylle liitetty polku.
+        """
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         self.artifacts_dir = self.db_path.parent / "artifacts"
         self.artifacts_dir.mkdir(parents=True, exist_ok=True)
+        self.cold_dir = Path(cold_dir) if cold_dir else self.db_path.parent / "cold"
+        self.storage = storage
+        self.dedup = dedup or delta_chains
+        self.delta_chains = delta_chains
+        self._pool = pool or get_pool(self.db_path)
+        self._count_cache: Dict[tuple, Tuple[int, float, int]] = {}
+        self._count_lock = threading.Lock()
+        self.embedder = embedder
+        self._vectors = VectorIndex(self._pool)
         self._init_db()
     
     def _init_db(self):
         """Luo taulut jos ei ole."""
-        with sqlite3.connect(self.db_path) as conn:
+        self._pool.write(self._create_schema)
+        self._codec = ArchiveCodec(self._load_dictionaries())
+    
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id TEXT PRIMARY KEY,
+                trace_id TEXT,
+                title TEXT NOT NULL,
+                summary TEXT,
+                document_type TEXT NOT NULL,
+                program TEXT DEFAULT 'muu',
+                project TEXT DEFAULT 'muu',
+                tags TEXT,  -- space-separated for FTS
+                audience TEXT,
+                language TEXT DEFAULT 'fi',
+                channel TEXT,
+                status TEXT DEFAULT 'draft',
+                qa_decision TEXT,
+                qa_report_id TEXT,
+                agent_name TEXT NOT NULL,
+                prompt_packs TEXT,  -- JSON array
+                version INTEGER DEFAULT 1,
+                parent_id TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                word_count INTEGER,
+                artifact_path TEXT  -- path to JSON file
+            )
+        """)
+        self._add_missing_columns(conn, "entries", {
+            "content_blob": "BLOB",  # compressed entry JSON (inline storage)
+            "codec": "TEXT",         # zstd | zstd:<dict_id> | zlib
+            "root_id": "TEXT",       # first version of the lineage (parent_id chain)
+            "is_latest": "INTEGER NOT NULL DEFAULT 1",  # lineage head
+            "content_hash": "TEXT",  # shared body in blobs (dedup)
+            "meta_patch": "TEXT",    # JSON of patch_metadata() fields newer than the artifact
+            "change_seq": "INTEGER", # bumped by triggers on every insert/update (exports)
+            "tier": "TEXT",          # NULL = hot, 'cold' = moved by move_to_cold()
+        })
+        
+        # Content-addressed bodies shared by versions and identical saves.
+        # Either compressed here (codec, data) or an external object (path).
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                codec TEXT,
+                data BLOB,
+                path TEXT,
+                size INTEGER NOT NULL,
+                last_used TEXT NOT NULL
+            )
+        """)
+        self._add_missing_columns(conn, "blobs", {
+            "base": "TEXT",                      # delta: blob this one is encoded against
+            "depth": "INTEGER NOT NULL DEFAULT 0",  # deltas since the last full snapshot
+        })
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_base ON blobs(base)")
+        
+        # Trained zstd dictionaries for inline storage
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS codec_dicts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                data BLOB NOT NULL,
+                sample_count INTEGER,
+                created_at TEXT NOT NULL
+            )
+        """)
+        
+        self._create_fts(conn)
+        self._create_tag_index(conn)
+        self._create_stats(conn)
+        self._create_change_log(conn)
+        VectorIndex.create_schema(conn)
+        
+        # Indexes
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_document_type ON entries(document_type)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_program ON entries(program)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_project ON entries(project)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_status ON entries(status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_content_hash ON entries(content_hash)")
+        # (created_at, id) serves both ORDER BY and keyset pagination
+        conn.execute("DROP INDEX IF EXISTS idx_created_at")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_created_id ON entries(created_at, id)")
+        
+        # Lineage heads: latest_only searches scan only this partial index
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_root ON entries(root_id)")
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_latest ON entries(created_at, id)
+            WHERE is_latest = 1
+        """)
+        if conn.execute("SELECT 1 FROM entries WHERE root_id IS NULL LIMIT 1").fetchone():
+            self._backfill_lineage(conn)
+    
+    def _create_fts(self, conn: sqlite3.Connection) -> None:
+        """
+        Full-text search: FTS5-taulu rowid = entries.rowid.
+        
+        Triggerit pitävät otsikon, tiivistelmän ja tagit synkronissa; sisältö
+        ja yhdyssanaosat kirjoitetaan save():ssa samassa transaktiossa.
+        """
+        existing = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'entries_fts'"
+        ).fetchone()
+        if existing and "content='entries'" in existing["sql"]:
+            # Legacy external-content table: rowids never matched entries
+            conn.execute("DROP TABLE entries_fts")
+            existing = None
+        
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+                title,
+                summary,
+                tags,
+                content,
+                compounds,
+                tokenize = '{FTS_TOKENIZE}',
+                prefix = '{FTS_PREFIX}'
+            )
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS entries_fts_ai AFTER INSERT ON entries BEGIN
+                INSERT INTO entries_fts (rowid, title, summary, tags)
+                VALUES (new.rowid, new.title, new.summary, new.tags);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS entries_fts_ad AFTER DELETE ON entries BEGIN
+                DELETE FROM entries_fts WHERE rowid = old.rowid;
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS entries_fts_au
+            AFTER UPDATE OF title, summary, tags ON entries BEGIN
+                UPDATE entries_fts
+                SET title = new.title, summary = new.summary, tags = new.tags
+                WHERE rowid = new.rowid;
+            END
+        """)
+        
+        if existing is None:
+            conn.execute(
+                "INSERT INTO entries_fts (entries_fts, rank) VALUES ('rank', ?)",
+                (FTS_RANK,)
+            )
+            # Metadata is indexed right away; bodies need rebuild_fts()
             conn.execute("""
-                CREATE TABLE IF NOT EXISTS entries (
-                    id TEXT PRIMARY KEY,
-                    trace_id TEXT,
-                    title TEXT NOT NULL,
-                    summary TEXT,
-                    document_type TEXT NOT NULL,
-                    program TEXT DEFAULT 'muu',
-                    project TEXT DEFAULT 'muu',
-                    tags TEXT,  -- space-separated for FTS
-                    audience TEXT,
-                    language TEXT DEFAULT 'fi',
-                    channel TEXT,
-                    status TEXT DEFAULT 'draft',
-                    qa_decision TEXT,
-                    qa_report_id TEXT,
-                    agent_name TEXT NOT NULL,
-                    prompt_packs TEXT,  -- JSON array
-                    version INTEGER DEFAULT 1,
-                    parent_id TEXT,
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL,
-                    word_count INTEGER,
-                    artifact_path TEXT  -- path to JSON file
-                )
+                INSERT INTO entries_fts (rowid, title, summary, tags)
+                SELECT rowid, title, summary, tags FROM entries
             """)
-            
-            # Full-text search virtual table
-            conn.execute("""
-                CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
-                    id,
-                    title,
-                    summary,
-                    tags,
-                    content='entries',
-                    content_rowid='rowid'
-                )
+    
+    def _create_tag_index(self, conn: sqlite3.Connection) -> None:
+        """
+        Normalisoitu tagitaulu: yksi rivi per (kirjaus, tagi).
+        
+        Pääavain (tag, entry_id) on kattava indeksi tagisuodatukselle ja
+        facet-laskennalle; rivit poistuvat kirjauksen mukana (CASCADE).
+        """
+        existing = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'entry_tags'"
+        ).fetchone()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entry_tags (
+                tag TEXT NOT NULL,
+                entry_id TEXT NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+                PRIMARY KEY (tag, entry_id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entry_tags_entry ON entry_tags(entry_id)"
+        )
+        if existing is None:
+            rows = conn.execute(
+                "SELECT id, tags FROM entries WHERE tags IS NOT NULL AND tags != ''"
+            ).fetchall()
+            self._index_tags(conn, [(row["id"], row["tags"].split()) for row in rows])
+    
+    # entry_stats dimensions: name -> SQL expression over a trigger row
+    STATS_DIMENSIONS = {
+        "total": "''",
+        "document_type": "{row}.document_type",
+        "status": "{row}.status",
+        "program": "{row}.program",
+        "project": "{row}.project",
+        "agent_name": "{row}.agent_name",
+        "day": "substr({row}.created_at, 1, 10)",
+    }
+    
+    def _stats_sql(self, row: str, sign: int) -> str:
+        """Triggerin lauseet: rivin lisäys (+1) tai poisto (-1) laskureihin."""
+        words = f"COALESCE({row}.word_count, 0)"
+        statements = []
+        for dimension, expr in self.STATS_DIMENSIONS.items():
+            value = f"COALESCE({expr.format(row=row)}, '')"
+            if sign > 0:
+                statements.append(f"""
+                    INSERT INTO entry_stats (dimension, value, entries, words)
+                    VALUES ('{dimension}', {value}, 1, {words})
+                    ON CONFLICT(dimension, value) DO UPDATE SET
+                        entries = entries + 1, words = words + excluded.words;
+                """)
+            else:
+                statements.append(f"""
+                    UPDATE entry_stats SET entries = entries - 1, words = words - {words}
+                    WHERE dimension = '{dimension}' AND value = {value};
+                """)
+        return "".join(statements)
+    
+    def _create_stats(self, conn: sqlite3.Connection) -> None:
+        """
+        Materialisoidut laskurit get_stats():lle: (dimensio, arvo) → kirjaukset, sanat.
+        
+        Triggerit pitävät laskurit ajan tasalla jokaisessa INSERT/UPDATE/DELETE:ssä,
+        joten tilastokysely lukee vain muutaman rivin arkiston koosta riippumatta.
+        """
+        existing = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'entry_stats'"
+        ).fetchone()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entry_stats (
+                dimension TEXT NOT NULL,
+                value TEXT NOT NULL,
+                entries INTEGER NOT NULL,
+                words INTEGER NOT NULL,
+                PRIMARY KEY (dimension, value)
+            ) WITHOUT ROWID
+        """)
+        counted = "document_type, status, program, project, agent_name, created_at, word_count"
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS entry_stats_ai AFTER INSERT ON entries BEGIN
+                {self._stats_sql("new", 1)}
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS entry_stats_ad AFTER DELETE ON entries BEGIN
+                {self._stats_sql("old", -1)}
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS entry_stats_au AFTER UPDATE OF {counted} ON entries BEGIN
+                {self._stats_sql("old", -1)}
+                {self._stats_sql("new", 1)}
+            END
+        """)
+        if existing is None:
+            self._rebuild_stats(conn)
+    
+    def _rebuild_stats(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM entry_stats")
+        for dimension, expr in self.STATS_DIMENSIONS.items():
+            value = f"COALESCE({expr.format(row='entries')}, '')"
+            conn.execute(f"""
+                INSERT INTO entry_stats (dimension, value, entries, words)
+                SELECT '{dimension}', {value}, COUNT(*), COALESCE(SUM(word_count), 0)
+                FROM entries GROUP BY {value}
             """)
+    
+    def rebuild_stats(self) -> None:
+        """Laske tilastolaskurit uudelleen entries-taulusta (korjaus/migraatio)."""
+        self._pool.write(self._rebuild_stats)
+    
+    def _create_change_log(self, conn: sqlite3.Connection) -> None:
+        """
+        Muutosnumerot inkrementaalisille vienneille (archive_export).
+        
+        Jokainen INSERT/UPDATE saa entries.change_seq-arvoksi seuraavan
+        juoksevan numeron, DELETE kirjaa tombstonen samasta sarjasta. Vienti
+        tallentaa suurimman viemänsä numeron ja jatkaa seuraavalla kerralla siitä.
+        """
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS change_counter (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                value INTEGER NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entry_tombstones (
+                change_seq INTEGER PRIMARY KEY,
+                entry_id TEXT NOT NULL,
+                deleted_at TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_change_seq ON entries(change_seq)")
+        if conn.execute("SELECT 1 FROM change_counter").fetchone() is None:
+            # Existing rows count as changed once, in insertion order
+            conn.execute("UPDATE entries SET change_seq = rowid WHERE change_seq IS NULL")
+            conn.execute(
+                "INSERT INTO change_counter (id, value) "
+                "SELECT 1, COALESCE(MAX(change_seq), 0) FROM entries"
+            )
+        
+        bump = """
+            UPDATE change_counter SET value = value + 1 WHERE id = 1;
+            UPDATE entries SET change_seq = (SELECT value FROM change_counter WHERE id = 1)
+            WHERE rowid = new.rowid;
+        """
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS entry_changes_ai AFTER INSERT ON entries BEGIN
+                {bump}
+            END
+        """)
+        # Every column but change_seq itself, so the bump does not re-trigger
+        tracked = ", ".join([*self._ENTRY_COLUMNS, "is_latest"])
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS entry_changes_au AFTER UPDATE OF {tracked} ON entries BEGIN
+                {bump}
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS entry_changes_ad AFTER DELETE ON entries BEGIN
+                UPDATE change_counter SET value = value + 1 WHERE id = 1;
+                INSERT INTO entry_tombstones (change_seq, entry_id, deleted_at)
+                VALUES (
+                    (SELECT value FROM change_counter WHERE id = 1),
+                    old.id, strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')
+                );
+            END
+        """)
+    
+    @staticmethod
+    def _index_tags(
+        conn: sqlite3.Connection, entry_tags: Sequence[Tuple[str, List[str]]]
+    ) -> None:
+        """Korvaa kirjausten tagirivit: [(entry_id, tags), ...]."""
+        conn.executemany(
+            "DELETE FROM entry_tags WHERE entry_id = ?",
+            [(entry_id,) for entry_id, _ in entry_tags]
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO entry_tags (tag, entry_id) VALUES (?, ?)",
+            [
+                (normalize_tag(tag), entry_id)
+                for entry_id, tags in entry_tags
+                for tag in tags if tag.strip()
+            ]
+        )
+    
+    # Lineage head (is_latest): highest version, ties by newest created_at, id
+    HEAD_ORDER = "version DESC, created_at DESC, id DESC"
+    
+    @staticmethod
+    def _backfill_lineage(conn: sqlite3.Connection) -> int:
+        """
+        Laske root_id ja is_latest kaikille riveille parent_id-ketjuista.
+        
+        Uusin versio = suurin version (tasatilanteessa uusin created_at).
+        """
+        conn.execute("DROP TABLE IF EXISTS temp.lineage")
+        conn.execute("""
+            CREATE TEMP TABLE lineage AS
+            WITH RECURSIVE chain(id, root) AS (
+                SELECT id, id FROM entries
+                WHERE parent_id IS NULL
+                   OR parent_id NOT IN (SELECT id FROM entries)
+                UNION
+                SELECT e.id, chain.root FROM entries e JOIN chain ON e.parent_id = chain.id
+            )
+            SELECT id, root FROM chain
+        """)
+        conn.execute("CREATE UNIQUE INDEX temp.idx_lineage ON lineage(id)")
+        # Rows in a parent_id cycle are unreachable from any root: own lineage
+        updated = conn.execute("""
+            UPDATE entries SET root_id = COALESCE(
+                (SELECT root FROM lineage WHERE lineage.id = entries.id), id
+            )
+        """).rowcount
+        conn.execute("DROP TABLE temp.lineage")
+        
+        conn.execute(f"""
+            UPDATE entries SET is_latest = (
+                id = (
+                    SELECT e2.id FROM entries e2
+                    WHERE e2.root_id = entries.root_id
+                    ORDER BY {ArchiveService.HEAD_ORDER}
+                    LIMIT 1
+                )
+            )
+        """)
+        return updated
+    
+    @staticmethod
+    def _add_missing_columns(
+        conn: sqlite3.Connection, table: str, columns: dict
+    ) -> None:
+        """Lisää uudet sarakkeet vanhaan tietokantaan (kevyt migraatio)."""
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, decl in columns.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+    
+    def _load_dictionaries(self) -> dict:
+        with self._pool.read() as conn:
+            rows = conn.execute("SELECT id, data FROM codec_dicts").fetchall()
+        return {row["id"]: row["data"] for row in rows}
+    
+    # -------------------------------------------------------------------------
+    # Storage helpers (shared with GCSArchiveService)
+    # -------------------------------------------------------------------------
+    
+    # Columns needed to materialise a full ArchiveEntry from a row
+    _LOAD_COLUMNS = "artifact_path, codec, content_blob, content_hash, meta_patch"
+    
+    def _encode_entry(self, entry: ArchiveEntry) -> Tuple[str, bytes]:
+        return self._codec.encode(entry.model_dump_json().encode("utf-8"))
+    
+    def _decode_entry(self, codec: str, blob: bytes) -> ArchiveEntry:
+        return ArchiveEntry.model_validate_json(self._codec.decode(codec, blob))
+    
+    @staticmethod
+    def _row_to_view(row: sqlite3.Row) -> ArchiveEntryView:
+        """Muunna projektiorivi ArchiveEntryViewiksi (ei validointia)."""
+        data = {k: row[k] for k in row.keys() if k in PROJECTION_FIELDS}
+        if data.get("tags") is not None:
+            data["tags"] = data["tags"].split()
+        if data.get("prompt_packs") is not None:
+            data["prompt_packs"] = json.loads(data["prompt_packs"])
+        for key in ("created_at", "updated_at"):
+            if data.get(key) is not None:
+                data[key] = datetime.fromisoformat(data[key])
+        return ArchiveEntryView.model_construct(**data)
+    
+    def _load_entry_row(self, row: sqlite3.Row) -> Optional[ArchiveEntry]:
+        """Inline-sisältö suoraan riviltä, muuten artifact-tiedostosta (+ jaettu blob)."""
+        if row["content_blob"] is not None:
+            entry = self._decode_entry(row["codec"], row["content_blob"])
+        elif row["artifact_path"] and row["codec"]:
+            # Compressed artifact file: moved to the cold tier
+            entry = self._load_cold_artifact(row["artifact_path"], row["codec"])
+        elif row["artifact_path"]:
+            entry = self._load_entry_from_path(row["artifact_path"])
+        else:
+            return None
+        if entry is None:
+            return None
+        if row["content_hash"]:
+            content = self._load_blob(row["content_hash"])
+            if content is None:
+                return None
+            entry.content = content.decode("utf-8")
+        if row["meta_patch"]:
+            # Patched columns win over the (older) stored record
+            for name, value in json.loads(row["meta_patch"]).items():
+                ArchiveEntry.__pydantic_validator__.validate_assignment(entry, name, value)
+        return entry
+    
+    def _load_entry_rows(self, rows: Sequence[sqlite3.Row]) -> List[Optional[ArchiveEntry]]:
+        """Lataa hakusivun kirjaukset rivijärjestyksessä (GCS: rinnakkain)."""
+        return [self._load_entry_row(row) for row in rows]
+    
+    # -------------------------------------------------------------------------
+    # Content-addressed bodies (dedup)
+    # -------------------------------------------------------------------------
+    
+    def _split_body(self, entry: ArchiveEntry) -> Tuple[ArchiveEntry, Optional[str]]:
+        """(tallennettava kirjaus, content_hash): dedupissa sisältö irrotetaan blobiksi."""
+        if not self.dedup:
+            return entry, None
+        return entry.model_copy(update={"content": ""}), content_hash(entry.content)
+    
+    # Every DELTA_SNAPSHOT_INTERVAL-th version is stored in full, which
+    # bounds reconstruction to that many delta decodes. A delta larger than
+    # DELTA_MAX_RATIO of the body (a rewrite) is stored in full too.
+    DELTA_SNAPSHOT_INTERVAL = 16
+    DELTA_MAX_RATIO = 0.5
+    
+    def _store_blobs(
+        self, entries: Sequence[ArchiveEntry], hashes: Sequence[Optional[str]]
+    ) -> List[BlobRow]:
+        """Tallenna puuttuvat sisällöt, palauta uudet blobs-rivit."""
+        wanted: Dict[str, ArchiveEntry] = {}
+        for entry, digest in zip(entries, hashes):
+            if digest:
+                wanted.setdefault(digest, entry)
+        if not wanted:
+            return []
+        with self._pool.read() as conn:
+            placeholders = ",".join("?" * len(wanted))
+            known = {row[0] for row in conn.execute(
+                f"SELECT hash FROM blobs WHERE hash IN ({placeholders})", list(wanted)
+            )}
+        
+        # entry id -> (hash, depth, body) for parents saved in this batch
+        batch: Dict[str, Tuple[str, int, bytes]] = {}
+        blobs: List[BlobRow] = []
+        for entry, digest in zip(entries, hashes):
+            if not digest:
+                continue
+            data = entry.content.encode("utf-8")
+            if digest in known:
+                if self.delta_chains:
+                    batch[entry.id] = (digest, self._blob_depth(digest, blobs), data)
+                continue
+            known.add(digest)
             
-            # Indexes
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_document_type ON entries(document_type)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_program ON entries(program)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_project ON entries(project)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_status ON entries(status)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON entries(created_at)")
-            
-            conn.commit()
+            row = self._encode_delta(entry, digest, data, batch) if self.delta_chains else None
+            if row is None:
+                row = (digest, *self._store_body(digest, entry.content), len(data), None, 0)
+            blobs.append(row)
+            batch[entry.id] = (digest, row[6], data)
+        return blobs
     
-    def save(self, entry: ArchiveEntry) -> str:
+    def _blob_depth(self, digest: str, pending: Sequence[BlobRow]) -> int:
+        for row in pending:
+            if row[0] == digest:
+                return row[6]
+        with self._pool.read() as conn:
+            row = conn.execute("SELECT depth FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        return row[0] if row else 0
+    
+    def _encode_delta(
+        self,
+        entry: ArchiveEntry,
+        digest: str,
+        data: bytes,
+        batch: Dict[str, Tuple[str, int, bytes]],
+    ) -> Optional[BlobRow]:
+        """Delta parent_id-version sisällöstä, tai None → täysi snapshot."""
+        if not entry.parent_id:
+            return None
+        if entry.parent_id in batch:
+            base_hash, depth, base = batch[entry.parent_id]
+        else:
+            with self._pool.read() as conn:
+                parent = conn.execute("""
+                    SELECT b.hash, b.depth FROM entries e JOIN blobs b ON b.hash = e.content_hash
+                    WHERE e.id = ?
+                """, (entry.parent_id,)).fetchone()
+            if parent is None:
+                return None
+            base_hash, depth = parent
+            base = self._load_blob(base_hash)
+            if base is None:
+                return None
+        if depth + 1 >= self.DELTA_SNAPSHOT_INTERVAL:
+            return None
+        codec, delta = self._codec.encode_delta(data, base)
+        if len(delta) > len(data) * self.DELTA_MAX_RATIO:
+            return None
+        return (digest, codec, delta, None, len(data), base_hash, depth + 1)
+    
+    def _store_body(
+        self, digest: str, content: str
+    ) -> Tuple[Optional[str], Optional[bytes], Optional[str]]:
+        """Pakkaa sisältö blobs-riville: (codec, data, path)."""
+        codec, data = self._codec.encode(content.encode("utf-8"))
+        return codec, data, None
+    
+    def _load_blob(self, digest: str) -> Optional[bytes]:
+        """Blobin sisältö; delta puretaan ketjua pitkin lähimmästä snapshotista."""
+        with self._pool.read() as conn:
+            chain = conn.execute("""
+                WITH RECURSIVE chain(n, hash, base, codec, data, path) AS (
+                    SELECT 0, hash, base, codec, data, path FROM blobs WHERE hash = ?
+                    UNION ALL
+                    SELECT chain.n + 1, b.hash, b.base, b.codec, b.data, b.path
+                    FROM blobs b JOIN chain ON b.hash = chain.base
+                    WHERE chain.n < ?
+                )
+                SELECT codec, data, path, base FROM chain ORDER BY n DESC
+            """, (digest, self.DELTA_SNAPSHOT_INTERVAL * 4)).fetchall()
+        if not chain or chain[0]["base"] is not None:
+            return None  # unknown hash or a broken chain
+        content = self._load_body(chain[0]["codec"], chain[0]["data"], chain[0]["path"])
+        for row in chain[1:]:
+            if content is None:
+                return None
+            content = self._codec.decode_delta(row["codec"], row["data"], content)
+        return content
+    
+    def _load_body(
+        self, codec: Optional[str], data: Optional[bytes], path: Optional[str]
+    ) -> Optional[bytes]:
+        return self._codec.decode(codec, data)
+    
+    def _delete_body(self, path: str) -> None:
+        """Poista ulkoinen blob-objekti (GCSArchiveService)."""
+    
+    def gc_blobs(self, grace_seconds: float = 3600.0) -> dict:
         """
-        Tallenna arkistokirjaus.
+        Poista blobit joihin mikään kirjaus ei viittaa.
+        
+        grace_seconds: vain blobit joita ei ole käytetty tänä aikana, jotta
+        samaan aikaan tallentuva kirjaus ei menetä juuri löytämäänsä blobia.
         
         Returns:
-            entry.id
+            {"deleted", "bytes"}
         """
-        # Save full content to JSON file
+        cutoff = datetime.fromtimestamp(time.time() - grace_seconds, timezone.utc).isoformat()
+        
+        def collect(conn: sqlite3.Connection) -> List[sqlite3.Row]:
+            collected: List[sqlite3.Row] = []
+            # Deleting a delta can orphan its base: repeat until nothing goes
+            while True:
+                rows = conn.execute("""
+                    SELECT hash, path, size FROM blobs
+                    WHERE last_used < ?
+                      AND NOT EXISTS (SELECT 1 FROM entries WHERE entries.content_hash = blobs.hash)
+                      AND NOT EXISTS (SELECT 1 FROM blobs d WHERE d.base = blobs.hash)
+                """, (cutoff,)).fetchall()
+                if not rows:
+                    return collected
+                conn.executemany(
+                    "DELETE FROM blobs WHERE hash = ?", [(row["hash"],) for row in rows]
+                )
+                collected.extend(rows)
+        
+        rows = self._pool.write(collect)
+        # Objects go after the commit: a failed delete only leaks storage
+        for row in rows:
+            if row["path"]:
+                self._delete_body(row["path"])
+        return {"deleted": len(rows), "bytes": sum(row["size"] for row in rows)}
+    
+    def _store_artifact(self, entry: ArchiveEntry) -> str:
+        """Tallenna täysi sisältö JSON-tiedostoon, palauta artifact_path."""
         artifact_path = self.artifacts_dir / f"{entry.id}.json"
         with open(artifact_path, "w", encoding="utf-8") as f:
             json.dump(entry.model_dump(mode="json"), f, ensure_ascii=False, indent=2)
+        return str(artifact_path)
+    
+    def _load_entry_from_path(self, artifact_path: str) -> Optional[ArchiveEntry]:
+        """Load entry from a local JSON artifact."""
+        local_path = Path(artifact_path)
+        if not local_path.exists():
+            return None
         
-        # Save metadata to SQLite
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT OR REPLACE INTO entries (
-                    id, trace_id, title, summary, document_type, program, project,
-                    tags, audience, language, channel, status, qa_decision, qa_report_id,
-                    agent_name, prompt_packs, version, parent_id, created_at, updated_at,
-                    word_count, artifact_path
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+        with open(local_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        
+        return ArchiveEntry(**data)
+    
+    _ENTRY_COLUMNS = (
+        "id", "trace_id", "title", "summary", "document_type", "program", "project",
+        "tags", "audience", "language", "channel", "status", "qa_decision",
+        "qa_report_id", "agent_name", "prompt_packs", "version", "parent_id",
+        "created_at", "updated_at", "word_count", "artifact_path", "codec",
+        "content_blob", "content_hash", "meta_patch", "tier", "root_id",
+    )
+    
+    @staticmethod
+    def _fts_bodies(entries: Sequence[ArchiveEntry]) -> List[Tuple[str, str, str]]:
+        """
+        FTS-rivien sisältö: [(content, compounds, id), ...].
+        
+        Lasketaan kutsujan säikeessä, ei kirjoittajasäikeessä.
+        """
+        return [
+            (
+                entry.content,
+                split_compounds(
+                    " ".join([entry.title, entry.summary, entry.tags_str, entry.content])
+                ),
+                entry.id,
+            )
+            for entry in entries
+        ]
+    
+    @staticmethod
+    def _index_bodies(
+        conn: sqlite3.Connection, bodies: Sequence[Tuple[str, str, str]]
+    ) -> None:
+        """Sisältö + yhdyssanaosat FTS-riveille (metadata tulee triggeristä)."""
+        conn.executemany("""
+            UPDATE entries_fts SET content = ?, compounds = ?
+            WHERE rowid = (SELECT rowid FROM entries WHERE id = ?)
+        """, bodies)
+    
+    def _insert_entries(
+        self,
+        conn: sqlite3.Connection,
+        rows: Sequence[
+            Tuple[ArchiveEntry, Optional[str], Optional[str], Optional[bytes], Optional[str]]
+        ],
+        bodies: Sequence[Tuple[str, str, str]],
+        blobs: Sequence[BlobRow] = (),
+    ) -> None:
+        """
+        Kirjoita metadata, tagit ja FTS-rivit (kutsutaan kirjoitustransaktiossa).
+        
+        rows: [(entry, artifact_path, codec, content_blob, content_hash), ...]
+            tallennusjärjestyksessä.
+        bodies: _fts_bodies() samoille kirjauksille.
+        blobs: _store_blobs():n uudet blobs-rivit.
+        """
+        def stored_root(parent_id: str) -> Optional[str]:
+            parent = conn.execute(
+                "SELECT root_id FROM entries WHERE id = ?", (parent_id,)
+            ).fetchone()
+            return (parent["root_id"] or parent_id) if parent else None
+        
+        # Lineage roots: parents in the same batch count too, in any order
+        roots = lineage_roots([entry for entry, *_ in rows], stored_root)
+        
+        # Lineage head = highest (version, created_at, id), as in delete_many
+        # and _backfill_lineage; stored versions are compared after the upsert
+        best: Dict[str, Tuple[Tuple[int, str, str], str]] = {}
+        for entry, *_ in rows:
+            rank = (entry.version, entry.created_at.isoformat(), entry.id)
+            root_id = roots[entry.id]
+            if root_id not in best or rank > best[root_id][0]:
+                best[root_id] = (rank, entry.id)
+        heads = {root_id: entry_id for root_id, (_, entry_id) in best.items()}
+        
+        # Upsert keeps the rowid stable, so FTS triggers see an UPDATE rather
+        # than a silent REPLACE delete
+        conn.executemany(f"""
+            INSERT INTO entries ({", ".join(self._ENTRY_COLUMNS)}, is_latest)
+            VALUES ({", ".join("?" * (len(self._ENTRY_COLUMNS) + 1))})
+            ON CONFLICT(id) DO UPDATE SET
+                {", ".join(f"{c} = excluded.{c}" for c in self._ENTRY_COLUMNS[1:])},
+                is_latest = excluded.is_latest
+        """, [
+            (
                 entry.id,
                 entry.trace_id,
                 entry.title,
@@ -264,48 +1152,109 @@ class ArchiveService:
                 entry.created_at.isoformat(),
                 entry.updated_at.isoformat(),
                 entry.word_count,
-                str(artifact_path)
+                artifact_path,
+                codec,
+                content_blob,
+                digest,
+                None,  # a full save carries all metadata in the record
+                None,  # and is hot again
+                roots[entry.id],
+                int(heads[roots[entry.id]] == entry.id),
+            )
+            for entry, artifact_path, codec, content_blob, digest in rows
+        ])
+        # Only rows whose flag changes are written (change_seq tracks is_latest)
+        conn.executemany(f"""
+            UPDATE entries SET is_latest = 1 - is_latest
+            WHERE root_id = ?1 AND is_latest != (id = (
+                SELECT id FROM entries WHERE root_id = ?1 ORDER BY {self.HEAD_ORDER} LIMIT 1
             ))
-            
-            # Update FTS index
-            conn.execute("""
-                INSERT INTO entries_fts (id, title, summary, tags)
-                VALUES (?, ?, ?, ?)
-            """, (entry.id, entry.title, entry.summary, " ".join(entry.tags)))
-            
-            conn.commit()
+        """, [(root_id,) for root_id in sorted(heads)])
         
-        return entry.id
+        self._index_tags(conn, [(entry.id, entry.tags) for entry, *_ in rows])
+        self._index_bodies(conn, bodies)
+        
+        digests = {row[4] for row in rows if row[4]}
+        # Delta bases must survive too (same gc_blobs() race as the bodies)
+        digests.update(blob[5] for blob in blobs if blob[5])
+        if digests:
+            now = datetime.now(timezone.utc).isoformat()
+            conn.executemany("""
+                INSERT INTO blobs (hash, codec, data, path, size, base, depth, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(hash) DO NOTHING
+            """, [(*blob, now) for blob in blobs])
+            # Reused blobs are touched so gc_blobs() leaves them alone
+            conn.executemany(
+                "UPDATE blobs SET last_used = ? WHERE hash = ?",
+                [(now, digest) for digest in digests]
+            )
+            missing = digests - {row[0] for row in conn.execute(
+                f"SELECT hash FROM blobs WHERE hash IN ({','.join('?' * len(digests))})",
+                list(digests)
+            )}
+            if missing:
+                # Collected between _store_blobs() and this transaction
+                raise RuntimeError(f"Archive blobs vanished during save: {sorted(missing)}")
     
-    def get(self, entry_id: str) -> Optional[ArchiveEntry]:
-        """Hae yksittäinen arkistokirjaus ID:llä."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            row = conn.execute(
-                "SELECT artifact_path FROM entries WHERE id = ?",
-                (entry_id,)
-            ).fetchone()
-            
-            if not row:
-                return None
-            
-            artifact_path = Path(row["artifact_path"])
-            if not artifact_path.exists():
-                return None
-            
-            with open(artifact_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            return ArchiveEntry(**data)
+    # A tag set matching fewer rows than this drives the query from
+    # entry_tags; more common tags are probed per row while walking
+    # idx_created_id newest-first, which stops after one page.
+    SELECTIVE_TAG_ROWS = 1000
     
-    def search(self, query: ArchiveSearchQuery) -> ArchiveSearchResult:
-        """
-        Hae arkistosta suodattimilla ja/tai tekstihaulla.
-        """
+    def _tag_conditions(self, tags: List[str], mode: TagMode) -> Tuple[List[str], list]:
+        """Tagiehdot entry_tags-taulua vasten (ei LIKE-osumia sanan sisältä)."""
+        tags = sorted({normalize_tag(t) for t in tags if t.strip()})
+        if not tags:
+            return [], []
+        
+        with self._pool.read() as conn:
+            counts = {
+                tag: conn.execute("""
+                    SELECT COUNT(*) FROM (
+                        SELECT 1 FROM entry_tags WHERE tag = ? LIMIT ?
+                    )
+                """, (tag, self.SELECTIVE_TAG_ROWS)).fetchone()[0]
+                for tag in tags
+            }
+        
+        if mode == "any":
+            placeholders = ", ".join("?" * len(tags))
+            if sum(counts.values()) < self.SELECTIVE_TAG_ROWS:
+                return [
+                    f"id IN (SELECT entry_id FROM entry_tags WHERE tag IN ({placeholders}))"
+                ], tags
+            return [f"""EXISTS (
+                SELECT 1 FROM entry_tags
+                WHERE tag IN ({placeholders}) AND entry_id = entries.id
+            )"""], tags
+        
+        # All tags: entry_tags rows of the rarest tag, other tags probed by key
+        tags.sort(key=counts.__getitem__)
+        intersection = "SELECT entry_id FROM entry_tags AS t0 WHERE t0.tag = ?" + "".join(
+            f" AND EXISTS (SELECT 1 FROM entry_tags WHERE tag = ? AND entry_id = t0.entry_id)"
+            for _ in tags[1:]
+        )
+        selective = counts[tags[0]] < self.SELECTIVE_TAG_ROWS
+        if not selective and len(tags) > 1:
+            # Common tags can still have a small (or empty) intersection
+            with self._pool.read() as conn:
+                matches = conn.execute(
+                    f"SELECT COUNT(*) FROM ({intersection} LIMIT ?)",
+                    (*tags, self.SELECTIVE_TAG_ROWS)
+                ).fetchone()[0]
+            selective = matches < self.SELECTIVE_TAG_ROWS
+        if selective:
+            return [f"id IN ({intersection})"], tags
+        return [
+            "EXISTS (SELECT 1 FROM entry_tags WHERE tag = ? AND entry_id = entries.id)"
+        ] * len(tags), tags
+    
+    def _build_where(self, query: ArchiveSearchQuery) -> Tuple[str, list]:
+        """Rakenna WHERE-lauseke ja parametrit hakukyselystä."""
         conditions = []
         params = []
         
-        # Build WHERE clause
         if query.document_type:
             conditions.append("document_type = ?")
             params.append(query.document_type)
@@ -329,10 +1278,14 @@ class ArchiveService:
         if query.approved_only:
             conditions.append("qa_decision = 'approve'")
         
+        if query.latest_only:
+            # Literal predicate so the planner can use idx_latest
+            conditions.append("is_latest = 1")
+        
         if query.tags:
-            for tag in query.tags:
-                conditions.append("tags LIKE ?")
-                params.append(f"%{tag}%")
+            tag_conditions, tag_params = self._tag_conditions(query.tags, query.tag_mode)
+            conditions.extend(tag_conditions)
+            params.extend(tag_params)
         
         if query.date_from:
             conditions.append("created_at >= ?")
@@ -342,89 +1295,518 @@ class ArchiveService:
             conditions.append("created_at <= ?")
             params.append(query.date_to.isoformat())
         
-        # Full-text search
-        if query.query:
-            conditions.append("""
-                id IN (
-                    SELECT id FROM entries_fts 
-                    WHERE entries_fts MATCH ?
-                )
-            """)
-            params.append(query.query)
-        
         where_clause = " AND ".join(conditions) if conditions else "1=1"
+        return where_clause, params
+    
+    # Cached counts go stale after this many seconds even without local
+    # writes (another process may write to the same database file)
+    COUNT_CACHE_TTL = 30.0
+    COUNT_CACHE_SIZE = 256
+    
+    def _count(
+        self, conn: sqlite3.Connection, query: ArchiveSearchQuery,
+        from_where: str, params: list
+    ) -> Optional[int]:
+        if query.count_mode == "none":
+            return None
+        
+        count_sql = f"SELECT COUNT(*) FROM {from_where}"
+        if query.count_mode == "exact":
+            return conn.execute(count_sql, params).fetchone()[0]
+        
+        key = (from_where, tuple(params))
+        generation = self._pool.generation
+        with self._count_lock:
+            cached = self._count_cache.get(key)
+        if cached and cached[0] == generation and time.monotonic() - cached[1] < self.COUNT_CACHE_TTL:
+            return cached[2]
+        
+        total_count = conn.execute(count_sql, params).fetchone()[0]
+        with self._count_lock:
+            if len(self._count_cache) >= self.COUNT_CACHE_SIZE:
+                self._count_cache.clear()
+            self._count_cache[key] = (generation, time.monotonic(), total_count)
+        return total_count
+    
+    SNIPPET_TOKENS = 16
+    
+    # Relevance search ranks every full-text match with bm25. Opt-in speed-up
+    # (bm25 over every match of e.g. "hakemu*" in 100k entries costs ~200 ms):
+    # rank only the newest RANK_WINDOW matches. The window then defines the
+    # result set of every page and the total_count, so offset pages agree;
+    # older matches beyond it are not returned.
+    RANK_WINDOW: Optional[int] = int(os.environ.get("ARCHIVE_RANK_WINDOW", "0")) or None
+    
+    _FTS_JOIN = """
+        entries JOIN (
+            SELECT rowid AS fts_rowid, rank AS fts_rank
+            FROM entries_fts WHERE entries_fts MATCH ?{window}
+        ) AS fts ON fts.fts_rowid = entries.rowid
+    """
+    
+    def _snippets(
+        self, conn: sqlite3.Connection, fts_query: str, rows: Sequence[sqlite3.Row]
+    ) -> Dict[str, str]:
+        """Osumakatkelmat sivun riveille (rivit, jotka eivät osu, ohitetaan)."""
+        # One rowid = ? lookup per hit: FTS5 has a fast path for it,
+        # whereas rowid IN (...) walks every match
+        snippet_sql = f"""
+            SELECT snippet(entries_fts, -1, '**', '**', '…', {self.SNIPPET_TOKENS})
+            FROM entries_fts WHERE entries_fts MATCH ? AND rowid = ?
+        """
+        snippets: Dict[str, str] = {}
+        for row in rows:
+            hit = conn.execute(snippet_sql, (fts_query, row["row_key"])).fetchone()
+            if hit:
+                snippets[row["cursor_id"]] = hit[0]
+        return snippets
+    
+    def _search_rows(
+        self, query: ArchiveSearchQuery, columns: str = _LOAD_COLUMNS, snippets: bool = True
+    ) -> Tuple[Optional[int], List[sqlite3.Row], Optional[str], Dict[str, str]]:
+        """Aja hakukysely, palauta (total_count, rivit, next_cursor, snippets)."""
+        if query.mode != "keyword" and query.query:
+            return self._semantic_rows(query, columns)
+        
+        where_clause, params = self._build_where(query)
+        
+        from_clause = "entries"
+        order_clause = "created_at DESC, id DESC"
+        fts_query = build_fts_query(query.query) if query.query else ""
+        ranked = bool(fts_query) and query.order_by == "relevance"
+        if fts_query:
+            # FTS columns stay inside the subquery so entry columns are unambiguous
+            from_clause = self._FTS_JOIN.format(window="")
+            params = [fts_query, *params]
+            if ranked:
+                order_clause = "fts.fts_rank, id"
+        
+        if ranked and query.cursor:
+            raise ValueError("Cursor pagination needs order_by='created_at'; use offset")
         
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        # Keyset columns ride along with every page for next_cursor
+        columns = (
+            f"{columns}, entries.rowid AS row_key, "
+            "created_at AS cursor_created_at, id AS cursor_id"
+        )
+        
+        with self._pool.read() as conn:
+            if ranked and self.RANK_WINDOW:
+                # Lowest rowid among the newest RANK_WINDOW matches (FTS5
+                # walks its doclist in rowid order, so this is cheap)
+                floor = conn.execute("""
+                    SELECT rowid FROM entries_fts WHERE entries_fts MATCH ?
+                    ORDER BY rowid DESC LIMIT 1 OFFSET ?
+                """, (fts_query, self.RANK_WINDOW - 1)).fetchone()
+                if floor:
+                    from_clause = self._FTS_JOIN.format(window=" AND rowid >= ?")
+                    params = [fts_query, floor[0], *params[1:]]
             
-            # Count total
-            count_sql = f"SELECT COUNT(*) FROM entries WHERE {where_clause}"
-            total_count = conn.execute(count_sql, params).fetchone()[0]
+            # The count ignores the cursor: it is the size of the whole result set
+            total_count = self._count(
+                conn, query, f"{from_clause} WHERE {where_clause}", params
+            )
             
-            # Fetch results
-            if query.latest_only:
-                # Get only latest version per title
-                sql = f"""
-                    SELECT artifact_path FROM entries 
-                    WHERE {where_clause}
-                    GROUP BY title
-                    HAVING version = MAX(version)
-                    ORDER BY created_at DESC
-                    LIMIT ? OFFSET ?
-                """
-            else:
-                sql = f"""
-                    SELECT artifact_path FROM entries 
-                    WHERE {where_clause}
-                    ORDER BY created_at DESC
-                    LIMIT ? OFFSET ?
-                """
+            if query.cursor:
+                cursor_created_at, cursor_id = decode_cursor(query.cursor)
+                # Row-value comparison lets SQLite seek idx_created_id directly
+                where_clause += " AND (created_at, id) < (?, ?)"
+                params = [*params, cursor_created_at, cursor_id]
             
-            params.extend([query.limit, query.offset])
-            rows = conn.execute(sql, params).fetchall()
+            rows = conn.execute(f"""
+                SELECT {columns} FROM {from_clause}
+                WHERE {where_clause}
+                ORDER BY {order_clause}
+                LIMIT ? OFFSET ?
+            """, [*params, query.limit, query.offset]).fetchall()
+            
+            # Snippets only for the returned page, not every match
+            page_snippets = (
+                self._snippets(conn, fts_query, rows) if fts_query and rows and snippets else {}
+            )
         
-        # Load full entries from JSON files
-        entries = []
-        for row in rows:
-            artifact_path = Path(row["artifact_path"])
-            if artifact_path.exists():
-                with open(artifact_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                entries.append(ArchiveEntry(**data))
+        next_cursor = None
+        if len(rows) == query.limit and not ranked:
+            last = rows[-1]
+            next_cursor = encode_cursor(last["cursor_created_at"], last["cursor_id"])
         
-        return ArchiveSearchResult(
-            entries=entries,
-            total_count=total_count,
-            query=query
-        )
+        return total_count, rows, next_cursor, page_snippets
     
-    def update(self, entry_id: str, updates: dict) -> Optional[ArchiveEntry]:
+    # Nearest neighbours fetched before filters are applied; filters that
+    # reject most of them shrink the vector leg (raise for very selective ones)
+    VECTOR_WINDOW = 1000
+    # Candidates per leg that enter the fusion (and the total_count)
+    SEMANTIC_CANDIDATES = 200
+    # Reciprocal rank fusion constant: score = sum of 1 / (RRF_K + rank)
+    RRF_K = 60
+    
+    def _semantic_rows(
+        self, query: ArchiveSearchQuery, columns: str
+    ) -> Tuple[Optional[int], List[sqlite3.Row], Optional[str], Dict[str, str]]:
         """
-        Päivitä arkistokirjaus (luo uuden version).
-        
-        Returns:
-            New entry with incremented version
+        mode="vector" / "hybrid": vektorihaun (ja FTS:n) ehdokkaat yhdistetään
+        RRF:llä, suodattimet rajaavat ehdokkaat. Sivutus offsetilla.
         """
-        existing = self.get(entry_id)
-        if not existing:
-            return None
+        if self.embedder is None:
+            raise ValueError(f"mode={query.mode!r} needs an embedder (ARCHIVE_EMBEDDER)")
+        if query.cursor:
+            raise ValueError("Cursor pagination needs mode='keyword'; use offset")
         
-        # Create new version
-        new_data = existing.model_dump()
-        new_data.update(updates)
-        new_data["version"] = existing.version + 1
-        new_data["parent_id"] = existing.id
-        new_data["id"] = f"art_{datetime.now().strftime('%Y%m%d')}_{uuid.uuid4().hex[:6]}"
-        new_data["updated_at"] = datetime.now(timezone.utc)
+        # Training runs after saves (train_in_background) and in reindex_vectors;
+        # until then the untrained index is scanned brute force
+        hits = self._vectors.search(self.embedder.embed_query(query.query), k=self.VECTOR_WINDOW)
         
-        new_entry = ArchiveEntry(**new_data)
-        self.save(new_entry)
+        fts_query = build_fts_query(query.query)
+        keyword_ids: List[str] = []
+        if query.mode == "hybrid" and fts_query:
+            _, rows, _, _ = self._search_rows(
+                query.model_copy(update={
+                    "mode": "keyword", "order_by": "relevance", "cursor": None,
+                    "limit": self.SEMANTIC_CANDIDATES, "offset": 0, "count_mode": "none",
+                }),
+                columns="id",
+                snippets=False,
+            )
+            keyword_ids = [row["id"] for row in rows]
         
-        return new_entry
+        where_clause, params = self._build_where(query)
+        candidates = json.dumps([entry_id for entry_id, _ in hits] + keyword_ids)
+        with self._pool.read() as conn:
+            allowed = dict(conn.execute(f"""
+                SELECT id, created_at FROM entries
+                WHERE id IN (SELECT value FROM json_each(?)) AND {where_clause}
+            """, [candidates, *params]).fetchall())
+        vector_ids = [entry_id for entry_id, _ in hits if entry_id in allowed]
+        
+        scores: Dict[str, float] = {}
+        for ranking in (vector_ids[:self.SEMANTIC_CANDIDATES], keyword_ids):
+            for rank, entry_id in enumerate(ranking, start=1):
+                scores[entry_id] = scores.get(entry_id, 0.0) + 1.0 / (self.RRF_K + rank)
+        if query.order_by == "created_at":
+            fused = sorted(scores, key=lambda i: (allowed[i], i), reverse=True)
+        else:
+            fused = sorted(scores, key=lambda i: (-scores[i], i))
+        page = fused[query.offset:query.offset + query.limit]
+        
+        with self._pool.read() as conn:
+            rows = conn.execute(f"""
+                SELECT {columns}, entries.rowid AS row_key,
+                       created_at AS cursor_created_at, id AS cursor_id
+                FROM entries WHERE id IN (SELECT value FROM json_each(?))
+            """, [json.dumps(page)]).fetchall()
+            by_id = {row["cursor_id"]: row for row in rows}
+            rows = [by_id[entry_id] for entry_id in page if entry_id in by_id]
+            page_snippets = self._snippets(conn, fts_query, rows) if fts_query and rows else {}
+        
+        total_count = None if query.count_mode == "none" else len(fused)
+        return total_count, rows, None, page_snippets
     
-    def list_latest(
-        self,
-        document_type: Optional[DocumentType] = None,
+    # -------------------------------------------------------------------------
+    # Public API
+    # -------------------------------------------------------------------------
+    
+    def save(self, entry: ArchiveEntry) -> str:
+        """
+        Tallenna arkistokirjaus.
+        
+        Returns:
+            entry.id
+        """
+        return self.save_many([entry])[0]
+    
+    def save_many(self, entries: Sequence[ArchiveEntry]) -> List[str]:
+        """
+        Tallenna monta kirjausta yhdessä kirjoitustransaktiossa.
+        
+        Rivit, tagit ja FTS-sisältö kirjoitetaan executemany-erinä; joko
+        kaikki kirjaukset tallentuvat tai ei yksikään. Artifact-tiedostot
+        ("file") kirjoitetaan ennen transaktiota.
+        
+        Returns:
+            Kirjausten id:t samassa järjestyksessä
+        """
+        if not entries:
+            return []
+        
+        split = [self._split_body(entry) for entry in entries]
+        blobs = self._store_blobs(entries, [digest for _, digest in split])
+        if self.storage == "inline":
+            rows = [
+                (entry, None, *self._encode_entry(record), digest)
+                for entry, (record, digest) in zip(entries, split)
+            ]
+        else:
+            # Save full content first, then metadata in one write transaction
+            rows = [
+                (entry, self._store_artifact(record), None, None, digest)
+                for entry, (record, digest) in zip(entries, split)
+            ]
+        
+        bodies = self._fts_bodies(entries)
+        vectors: List[Tuple[str, List[float]]] = []
+        if self.embedder is not None:
+            try:
+                vectors = self._embed_entries(entries)
+            except Exception as e:
+                # The save must not depend on the embedding API being up
+                print(f"Embedding failed, saved without vectors (run reindex_vectors()): {e}")
+        
+        def write(conn: sqlite3.Connection) -> None:
+            self._insert_entries(conn, rows, bodies, blobs)
+            self._vectors.add(conn, vectors)
+        
+        self._pool.write(write)
+        if vectors:
+            self._vectors.train_in_background()
+        return [entry.id for entry in entries]
+    
+    def _embed_entries(self, entries: Sequence[ArchiveEntry]) -> List[Tuple[str, List[float]]]:
+        vectors = self.embedder.embed_documents([
+            embedding_text(entry.title, entry.summary, entry.tags, entry.content)
+            for entry in entries
+        ])
+        return [(entry.id, vector) for entry, vector in zip(entries, vectors)]
+    
+    def get(self, entry_id: str) -> Optional[ArchiveEntry]:
+        """Hae yksittäinen arkistokirjaus ID:llä."""
+        with self._pool.read() as conn:
+            row = conn.execute(
+                f"SELECT {self._LOAD_COLUMNS} FROM entries WHERE id = ?",
+                (entry_id,)
+            ).fetchone()
+        
+        if not row:
+            return None
+        
+        return self._load_entry_row(row)
+    
+    def search(
+        self,
+        query: ArchiveSearchQuery,
+        fields: Optional[Sequence[str]] = None,
+        mode: Optional[SearchMode] = None,
+    ) -> ArchiveSearchResult:
+        """
+        Hae arkistosta suodattimilla ja/tai tekstihaulla.
+        
+        Args:
+            fields: Projektio, esim. ["title", "summary"]. Palauttaa
+                ArchiveEntryView-rivejä suoraan SQLitestä lataamatta sisältöä.
+                None = täydet ArchiveEntry-oliot.
+            mode: Ohittaa query.moden: "keyword", "vector" tai "hybrid"
+                (FTS + upotukset RRF-yhdistettynä; vaatii embedderin).
+        """
+        if mode is not None:
+            if mode not in get_args(SearchMode):
+                raise ValueError(f"Unknown search mode: {mode!r} (keyword | vector | hybrid)")
+            query = query.model_copy(update={"mode": mode})
+        if fields is not None:
+            unknown = set(fields) - PROJECTION_FIELDS
+            if unknown:
+                raise ValueError(f"Unknown projection fields: {sorted(unknown)}")
+            columns = ", ".join(["id", *(f for f in fields if f != "id")])
+            total_count, rows, next_cursor, snippets = self._search_rows(
+                query, columns=columns
+            )
+            return ArchiveSearchResult(
+                entries=[self._row_to_view(row) for row in rows],
+                total_count=total_count,
+                query=query,
+                next_cursor=next_cursor,
+                snippets=snippets
+            )
+        
+        total_count, rows, next_cursor, snippets = self._search_rows(query)
+        
+        # Inline rows decode in place, file rows load their artifact
+        entries = [entry for entry in self._load_entry_rows(rows) if entry]
+        
+        return ArchiveSearchResult(
+            entries=entries,
+            total_count=total_count,
+            query=query,
+            next_cursor=next_cursor,
+            snippets=snippets
+        )
+    
+    def iter_search(
+        self,
+        query: ArchiveSearchQuery,
+        fields: Optional[Sequence[str]] = None,
+        batch_size: int = 100,
+    ) -> Iterator[Union[ArchiveEntry, ArchiveEntryView]]:
+        """
+        Käy läpi kaikki hakuosumat erissä keyset-kursorilla.
+        
+        Muistissa on kerrallaan vain yksi erä, joten sopii vienteihin ja
+        uudelleenindeksointiin. Laskentaa (COUNT) ei tehdä. Tekstihaun osumat
+        tulevat aikajärjestyksessä (relevanssi ei sovi keyset-sivutukseen).
+        mode="vector" / "hybrid" sivutetaan offsetilla (ehdokasjoukko on rajattu).
+        """
+        page = query.model_copy(update={
+            "limit": min(batch_size, 100),
+            "offset": 0,
+            "count_mode": "none",
+            "order_by": "created_at",
+        })
+        while True:
+            result = self.search(page, fields=fields)
+            yield from result.entries
+            page = next_page(page, result)
+            if page is None:
+                return
+
+    def tag_facets(
+        self, query: Optional[ArchiveSearchQuery] = None, limit: int = 50
+    ) -> Dict[str, int]:
+        """
+        Tagien osumamäärät (facetit), yleisin ensin.
+
+        Args:
+            query: Rajaa laskennan hakuehtoihin (suodattimet + tekstihaku).
+                None = koko arkisto. Sivutus ja järjestys ohitetaan.
+        """
+        query = query or ArchiveSearchQuery()
+        where_clause, params = self._build_where(query)
+        fts_query = build_fts_query(query.query) if query.query else ""
+
+        if where_clause == "1=1" and not fts_query:
+            # Whole archive: one pass over the (tag, entry_id) primary key
+            sql = """
+                SELECT tag, COUNT(*) AS n FROM entry_tags
+                GROUP BY tag ORDER BY n DESC, tag LIMIT ?
+            """
+        else:
+            from_clause = "entries"
+            if fts_query:
+                from_clause = self._FTS_JOIN.format(window="")
+                params = [fts_query, *params]
+            sql = f"""
+                SELECT t.tag, COUNT(*) AS n
+                FROM {from_clause} JOIN entry_tags AS t ON t.entry_id = entries.id
+                WHERE {where_clause}
+                GROUP BY t.tag ORDER BY n DESC, t.tag LIMIT ?
+            """
+
+        with self._pool.read() as conn:
+            rows = conn.execute(sql, [*params, limit]).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def update(self, entry_id: str, updates: dict) -> Optional[ArchiveEntry]:
+        """
+        Päivitä arkistokirjaus (luo uuden version).
+        
+        Returns:
+            New entry with incremented version
+        """
+        existing = self.get(entry_id)
+        if not existing:
+            return None
+        
+        new_entry = next_version(existing, updates)
+        self.save(new_entry)
+        
+        return new_entry
+    
+    def patch_metadata(self, entry_id: str, **fields) -> bool:
+        """
+        Päivitä metadata paikallaan: SQLite-sarakkeet, tagit ja FTS yhdessä
+        transaktiossa, ilman uutta versiota tai artifactin uudelleenkirjoitusta.
+        
+        Sisällön muutokset kulkevat edelleen update():n kautta (uusi versio).
+        
+        Returns:
+            False jos kirjausta ei ole
+        
+        Raises:
+            ValueError: kenttä ei ole PATCHABLE_FIELDS-joukossa tai arvo ei kelpaa
+        """
+        patch = validate_patch(fields)
+        if not patch:
+            with self._pool.read() as conn:
+                return conn.execute(
+                    "SELECT 1 FROM entries WHERE id = ?", (entry_id,)
+                ).fetchone() is not None
+        patch["updated_at"] = datetime.now(timezone.utc).isoformat()
+        
+        columns = {
+            name: " ".join(value) if name == "tags" else value
+            for name, value in patch.items()
+        }
+        reindex = bool({"title", "summary", "tags"} & set(fields))
+        
+        def apply(conn: sqlite3.Connection) -> bool:
+            row = conn.execute(
+                "SELECT rowid, meta_patch FROM entries WHERE id = ?", (entry_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            merged = {**json.loads(row["meta_patch"] or "{}"), **patch}
+            conn.execute(
+                f"""
+                UPDATE entries SET {", ".join(f"{name} = ?" for name in columns)}, meta_patch = ?
+                WHERE id = ?
+                """,
+                [*columns.values(), json.dumps(merged, ensure_ascii=False), entry_id]
+            )
+            if "tags" in patch:
+                self._index_tags(conn, [(entry_id, patch["tags"])])
+            if reindex:
+                # Triggers refreshed title/summary/tags; compound parts follow
+                fts = conn.execute(
+                    "SELECT title, summary, tags, content FROM entries_fts WHERE rowid = ?",
+                    (row["rowid"],)
+                ).fetchone()
+                conn.execute(
+                    "UPDATE entries_fts SET compounds = ? WHERE rowid = ?",
+                    (split_compounds(" ".join(v or "" for v in fts)), row["rowid"])
+                )
+            return True
+        
+        return self._pool.write(apply)
+    
+    def lineage(self, entry_id: str) -> List[ArchiveEntryView]:
+        """Kirjauksen kaikki versiot (sama root_id) vanhimmasta uusimpaan, ilman sisältöä."""
+        with self._pool.read() as conn:
+            rows = conn.execute("""
+                SELECT id, title, status, version, parent_id, created_at, updated_at, word_count
+                FROM entries
+                WHERE root_id = (SELECT root_id FROM entries WHERE id = ?)
+                ORDER BY version, created_at, id
+            """, (entry_id,)).fetchall()
+        return [self._row_to_view(row) for row in rows]
+    
+    def diff(self, from_id: str, to_id: str, context: int = 3) -> str:
+        """
+        Unified diff kahden saman lineagen version sisällöstä.
+        
+        Raises:
+            ValueError: tuntematon id tai versiot eri lineageista
+        """
+        with self._pool.read() as conn:
+            roots = dict(conn.execute(
+                "SELECT id, root_id FROM entries WHERE id IN (?, ?)", (from_id, to_id)
+            ).fetchall())
+        for entry_id in (from_id, to_id):
+            if entry_id not in roots:
+                raise ValueError(f"Unknown archive entry: {entry_id}")
+        if roots[from_id] != roots[to_id]:
+            raise ValueError(f"{from_id} and {to_id} are not versions of the same entry")
+        
+        old, new = self.get(from_id), self.get(to_id)
+        if old is None or new is None:
+            raise ValueError(f"Content of {from_id if old is None else to_id} is missing")
+        return "".join(difflib.unified_diff(
+            old.content.splitlines(keepends=True),
+            new.content.splitlines(keepends=True),
+            fromfile=f"{old.id} (v{old.version})",
+            tofile=f"{new.id} (v{new.version})",
+            n=context,
+        ))
+    
+    def list_latest(
+        self,
+        document_type: Optional[DocumentType] = None,
         project: Optional[Project] = None,
         limit: int = 10
     ) -> List[ArchiveEntry]:
@@ -438,25 +1820,524 @@ class ArchiveService:
         result = self.search(query)
         return result.entries
     
+    def rebuild_fts(self, batch_size: int = 200) -> int:
+        """
+        Indeksoi kaikkien kirjausten sisältö uudelleen (esim. vanhan
+        tietokannan migraation jälkeen, kun vain metadata on indeksoitu).
+        
+        Returns:
+            Indeksoitujen kirjausten määrä
+        """
+        count = 0
+        batch: List[ArchiveEntry] = []
+        
+        def flush(entries: List[ArchiveEntry]) -> None:
+            bodies = self._fts_bodies(entries)
+            self._pool.write(lambda conn: self._index_bodies(conn, bodies))
+        
+        def resync_metadata(conn: sqlite3.Connection) -> None:
+            conn.execute(
+                "DELETE FROM entries_fts WHERE rowid NOT IN (SELECT rowid FROM entries)"
+            )
+            conn.execute("""
+                INSERT INTO entries_fts (rowid, title, summary, tags)
+                SELECT rowid, title, summary, tags FROM entries
+                WHERE rowid NOT IN (SELECT rowid FROM entries_fts)
+            """)
+        
+        self._pool.write(resync_metadata)
+        for entry in self.iter_search(ArchiveSearchQuery()):
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                flush(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            flush(batch)
+            count += len(batch)
+        self._pool.write(lambda conn: conn.execute(
+            "INSERT INTO entries_fts (entries_fts) VALUES ('optimize')"
+        ))
+        return count
+    
+    def backfill_lineage(self) -> int:
+        """Laske lineage-sarakkeet (root_id, is_latest) uudelleen kaikille riveille."""
+        return self._pool.write(self._backfill_lineage)
+    
+    # -------------------------------------------------------------------------
+    # Vector index maintenance
+    # -------------------------------------------------------------------------
+    
+    def reindex_vectors(self, batch_size: int = 64, rebuild: bool = False) -> int:
+        """
+        Upota kirjaukset, joilta vektori puuttuu (vanha arkisto, epäonnistunut
+        upotus save():ssa). rebuild=True tyhjentää indeksin ensin (embedder vaihtunut).
+        
+        Returns:
+            Upotettujen kirjausten määrä
+        """
+        if self.embedder is None:
+            raise ValueError("reindex_vectors needs an embedder (ARCHIVE_EMBEDDER)")
+        if rebuild:
+            self._pool.write(VectorIndex.clear)
+        
+        count = 0
+        last_rowid = 0
+        while True:
+            # Keyset over rowid: rows whose artifact is missing are not retried forever
+            with self._pool.read() as conn:
+                rows = conn.execute(f"""
+                    SELECT {self._LOAD_COLUMNS}, rowid AS row_key FROM entries
+                    WHERE rowid > ? AND NOT EXISTS (
+                        SELECT 1 FROM entry_vectors WHERE entry_id = entries.id
+                    )
+                    ORDER BY rowid LIMIT ?
+                """, (last_rowid, batch_size)).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1]["row_key"]
+            entries = [entry for entry in self._load_entry_rows(rows) if entry]
+            vectors = self._embed_entries(entries)
+            self._pool.write(lambda conn: self._vectors.add(conn, vectors))
+            count += len(vectors)
+        
+        if self._vectors.needs_training():
+            self._vectors.train()
+        return count
+    
+    def train_vector_index(self, lists: Optional[int] = None) -> int:
+        """Opeta IVF-listat uudelleen nyt (tallennukset tekevät tämän taustalla kun arkisto on kasvanut)."""
+        return self._vectors.train(lists)
+    
+    def vector_stats(self) -> Dict[str, int]:
+        return self._vectors.stats()
+    
+    def export_parquet(
+        self, out_dir: Union[str, Path], incremental: bool = False, **options
+    ) -> dict:
+        """
+        Vie arkisto osioituun Parquet-hakemistoon (ks. app.archive_export).
+        
+        incremental=True vie vain edellisen viennin jälkeen muuttuneet rivit.
+        """
+        from app.archive_export import export_parquet
+        
+        return export_parquet(self, out_dir, incremental=incremental, **options)
+    
+    # -------------------------------------------------------------------------
+    # Retention and compaction (policy engine: app.archive_retention)
+    # -------------------------------------------------------------------------
+    
+    # Pages freed per write transaction by vacuum(): keeps each step short
+    # so saves queued behind it are not held up
+    VACUUM_STEP_PAGES = 2000
+    
+    def _load_cold_artifact(self, path: str, codec: str) -> Optional[ArchiveEntry]:
+        try:
+            data = Path(path).read_bytes()
+        except FileNotFoundError:
+            return None
+        return self._decode_entry(codec, data)
+    
+    def _write_cold(self, row: sqlite3.Row) -> Optional[Tuple[str, Optional[str], int]]:
+        """
+        Kopioi rivin tallennettu kirjaus kylmään tieriin (cold_dir, pakattuna).
+        
+        Returns:
+            (uusi artifact_path, codec, vapautuvat hot-tavut) tai None
+        """
+        if row["content_blob"] is not None:
+            codec, data = row["codec"], row["content_blob"]
+            hot_bytes = len(data)
+        else:
+            try:
+                raw = Path(row["artifact_path"]).read_bytes()
+            except FileNotFoundError:
+                return None
+            codec, data = self._encode_entry(ArchiveEntry.model_validate_json(raw))
+            hot_bytes = len(raw)
+        self.cold_dir.mkdir(parents=True, exist_ok=True)
+        cold_path = self.cold_dir / f"{row['id']}.json.{codec.split(':')[0]}"
+        tmp_path = cold_path.with_name(cold_path.name + ".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, cold_path)
+        return str(cold_path), codec, hot_bytes
+    
+    def _delete_artifact(self, path: str) -> int:
+        """Poista artifact-tiedosto, palauta vapautetut tavut."""
+        local_path = Path(path)
+        try:
+            size = local_path.stat().st_size
+            local_path.unlink()
+        except FileNotFoundError:
+            return 0
+        return size
+    
+    def move_to_cold(self, entry_ids: Sequence[str], batch_size: int = 500) -> dict:
+        """
+        Siirrä kirjausten tallennettu sisältö kylmään tieriin.
+        
+        Paikallisesti pakattu tiedosto cold_dir:iin (inline-BLOB poistuu
+        tietokannasta, vapautuu vacuum():lla), GCS:ssä storage class vaihtuu.
+        Haku ja get() toimivat ennallaan. Jos kirjaus tallennetaan samaan
+        aikaan uudelleen, siirto ohitetaan ja uusi versio jää hot-tieriin.
+        Dedupin jaetut sisällöt (blobs) eivät siirry.
+        
+        Returns:
+            {"moved", "skipped", "bytes", "inline_bytes"}: hot-tieristä
+            vapautuneet tiedostotavut / tietokannan BLOB-tavut (levylle vacuum():lla)
+        """
+        stats = {"moved": 0, "skipped": 0, "bytes": 0, "inline_bytes": 0}
+        for start in range(0, len(entry_ids), batch_size):
+            chunk = json.dumps(list(entry_ids[start:start + batch_size]))
+            with self._pool.read() as conn:
+                rows = conn.execute("""
+                    SELECT id, artifact_path, codec, content_blob, change_seq FROM entries
+                    WHERE id IN (SELECT value FROM json_each(?)) AND tier IS NULL
+                      AND (artifact_path IS NOT NULL OR content_blob IS NOT NULL)
+                """, (chunk,)).fetchall()
+            
+            copied = []
+            for row in rows:
+                cold = self._write_cold(row)
+                if cold is None:
+                    stats["skipped"] += 1
+                else:
+                    copied.append((row, *cold))
+            
+            def commit(conn: sqlite3.Connection) -> List[str]:
+                applied = []
+                for row, path, codec, _ in copied:
+                    # change_seq unchanged = no re-save since the copy
+                    cursor = conn.execute("""
+                        UPDATE entries
+                        SET artifact_path = ?, codec = ?, content_blob = NULL, tier = 'cold'
+                        WHERE id = ? AND change_seq = ?
+                    """, (path, codec, row["id"], row["change_seq"]))
+                    if cursor.rowcount:
+                        applied.append(row["id"])
+                return applied
+            
+            applied = set(self._pool.write(commit))
+            for row, path, _, hot_bytes in copied:
+                if row["id"] not in applied:
+                    stats["skipped"] += 1
+                    if path != row["artifact_path"]:
+                        self._delete_artifact(path)
+                    continue
+                if row["artifact_path"] and row["artifact_path"] != path:
+                    self._delete_artifact(row["artifact_path"])
+                stats["moved"] += 1
+                stats["inline_bytes" if row["content_blob"] is not None else "bytes"] += hot_bytes
+        return stats
+    
+    def delete_many(self, entry_ids: Sequence[str], batch_size: int = 500) -> dict:
+        """
+        Poista kirjaukset pysyvästi (rivit, tagit, FTS, vektorit, artifactit).
+        
+        Poistetun lineage-pään tilalle nousee uusin jäljelle jäävä versio
+        (version, created_at, id laskevasti, kuten backfill_lineage).
+        Jaetut sisällöt poistuvat vasta gc_blobs():lla.
+        
+        Returns:
+            {"deleted", "bytes", "inline_bytes"} (tiedostot / tietokannan BLOBit)
+        """
+        stats = {"deleted": 0, "bytes": 0, "inline_bytes": 0}
+        for start in range(0, len(entry_ids), batch_size):
+            chunk = json.dumps(list(entry_ids[start:start + batch_size]))
+            
+            def delete(conn: sqlite3.Connection) -> List[sqlite3.Row]:
+                rows = conn.execute("""
+                    SELECT id, root_id, is_latest, artifact_path,
+                           COALESCE(length(content_blob), 0) AS inline_bytes
+                    FROM entries WHERE id IN (SELECT value FROM json_each(?))
+                """, (chunk,)).fetchall()
+                conn.execute(
+                    "DELETE FROM entries WHERE id IN (SELECT value FROM json_each(?))", (chunk,)
+                )
+                conn.executemany(f"""
+                    UPDATE entries SET is_latest = 1 WHERE id = (
+                        SELECT id FROM entries WHERE root_id = ?
+                        ORDER BY {self.HEAD_ORDER} LIMIT 1
+                    )
+                """, [(row["root_id"],) for row in rows if row["is_latest"] and row["root_id"]])
+                return rows
+            
+            rows = self._pool.write(delete)
+            stats["deleted"] += len(rows)
+            for row in rows:
+                stats["inline_bytes"] += row["inline_bytes"]
+                if row["artifact_path"]:
+                    stats["bytes"] += self._delete_artifact(row["artifact_path"])
+        return stats
+    
+    def database_bytes(self) -> int:
+        """Tietokantatiedoston + WAL:n koko levyllä."""
+        return sum(
+            path.stat().st_size
+            for path in (self.db_path, Path(f"{self.db_path}-wal"))
+            if path.exists()
+        )
+    
+    def vacuum(self, full: bool = False) -> dict:
+        """
+        Palauta vapaat sivut levylle.
+        
+        auto_vacuum=INCREMENTAL (uudet tietokannat): incremental_vacuum
+        VACUUM_STEP_PAGES sivun transaktioissa, tallennukset mahtuvat väliin.
+        Vanha tietokanta: full=True ajaa kerran täyden VACUUMin (kirjoitukset
+        odottavat sen ajan jonossa, levyä tarvitaan tilapäisesti 2x) ja
+        vaihtaa samalla incremental-tilaan.
+        
+        Returns:
+            {"mode", "freed_pages", "bytes_before", "bytes_after"}
+        """
+        def pragma(name: str) -> int:
+            with self._pool.read() as conn:
+                return conn.execute(f"PRAGMA {name}").fetchone()[0]
+        
+        bytes_before = self.database_bytes()
+        free_before = pragma("freelist_count")
+        auto_vacuum = pragma("auto_vacuum")
+        
+        def step(conn: sqlite3.Connection) -> int:
+            # The pragma frees one page per statement step
+            for _ in range(self.VACUUM_STEP_PAGES):
+                conn.execute("PRAGMA incremental_vacuum(1)")
+            return conn.execute("PRAGMA freelist_count").fetchone()[0]
+        
+        def full_vacuum(conn: sqlite3.Connection) -> None:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        
+        if auto_vacuum == 2:
+            mode = "incremental"
+            # Bounded: pages freed by concurrent deletes wait for the next run
+            for _ in range(free_before // self.VACUUM_STEP_PAGES + 1):
+                if self._pool.write(step) == 0:
+                    break
+        elif full:
+            mode = "full"
+            self._pool.write(full_vacuum, transaction=False)
+        else:
+            mode = "none"
+        # Move the WAL back into the database file so the file sizes are real
+        self._pool.write(
+            lambda conn: conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone(),
+            transaction=False,
+        )
+        return {
+            "mode": mode,
+            "freed_pages": max(0, free_before - pragma("freelist_count")),
+            "bytes_before": bytes_before,
+            "bytes_after": self.database_bytes(),
+        }
+    
+    def optimize_fts(self) -> None:
+        """Yhdistä FTS-indeksin segmentit (poistot jättävät tyhjää segmentteihin)."""
+        self._pool.write(lambda conn: conn.execute(
+            "INSERT INTO entries_fts (entries_fts) VALUES ('optimize')"
+        ))
+    
+    # -------------------------------------------------------------------------
+    # Inline storage maintenance
+    # -------------------------------------------------------------------------
+    
+    def train_dictionary(
+        self, max_samples: int = 2000, dict_size: int = 64 * 1024
+    ) -> int:
+        """
+        Opeta zstd-sanakirja arkiston uusimmista inline-kirjauksista ja ota se
+        käyttöön uusille tallennuksille.
+        
+        Returns:
+            Sanakirjan id (codec "zstd:<id>")
+        """
+        with self._pool.read() as conn:
+            rows = conn.execute(
+                """
+                SELECT codec, content_blob FROM entries
+                WHERE content_blob IS NOT NULL
+                ORDER BY created_at DESC LIMIT ?
+                """,
+                (max_samples,)
+            ).fetchall()
+        samples = [self._codec.decode(row["codec"], row["content_blob"]) for row in rows]
+        data = train_zstd_dictionary(samples, dict_size=dict_size)
+        
+        def insert(conn: sqlite3.Connection) -> int:
+            cur = conn.execute(
+                "INSERT INTO codec_dicts (data, sample_count, created_at) VALUES (?, ?, ?)",
+                (data, len(samples), datetime.now(timezone.utc).isoformat())
+            )
+            return cur.lastrowid
+        
+        dict_id = self._pool.write(insert)
+        self._codec.add_dictionary(dict_id, data)
+        return dict_id
+    
+    def migrate_to_inline(
+        self,
+        batch_size: int = 500,
+        train: bool = True,
+        remove_artifacts: bool = False,
+    ) -> dict:
+        """
+        Siirrä olemassa olevat artifact-kirjaukset inline-BLOBeiksi.
+        
+        1. Pakkaa jokainen JSON-artifact riville (oletuscodec)
+        2. Opeta sanakirja ja pakkaa kaikki inline-rivit uudelleen sillä
+        
+        Returns:
+            {"migrated", "missing", "recompressed", "dict_id"}
+        """
+        stats = {"migrated": 0, "missing": 0, "recompressed": 0, "dict_id": None}
+        with self._pool.read() as conn:
+            pending = conn.execute(
+                f"""
+                SELECT id, {self._LOAD_COLUMNS} FROM entries
+                WHERE content_blob IS NULL AND artifact_path IS NOT NULL AND tier IS NULL
+                """
+            ).fetchall()
+        
+        for start in range(0, len(pending), batch_size):
+            updates = []
+            for row in pending[start:start + batch_size]:
+                entry = self._load_entry_row(row)
+                if entry is None:
+                    stats["missing"] += 1
+                    continue
+                if row["content_hash"]:
+                    # The body stays in blobs
+                    entry = entry.model_copy(update={"content": ""})
+                codec, blob = self._encode_entry(entry)
+                updates.append((codec, blob, row["id"]))
+            self._pool.write(lambda conn: conn.executemany(
+                "UPDATE entries SET codec = ?, content_blob = ? WHERE id = ?",
+                updates
+            ))
+            stats["migrated"] += len(updates)
+            if remove_artifacts:
+                for row in pending[start:start + batch_size]:
+                    if not row["artifact_path"].startswith("gs://"):
+                        Path(row["artifact_path"]).unlink(missing_ok=True)
+        
+        if train:
+            try:
+                stats["dict_id"] = self.train_dictionary()
+            except Exception as e:
+                # zstd needs a reasonable sample corpus; small archives skip it
+                print(f"Dictionary training skipped: {e}")
+            else:
+                stats["recompressed"] = self.recompress(batch_size=batch_size)
+        
+        return stats
+    
+    def recompress(self, batch_size: int = 500) -> int:
+        """Pakkaa inline-rivit uudelleen aktiivisella codecilla."""
+        codec = self._codec.default_codec
+        count = 0
+        with self._pool.read() as conn:
+            ids = [row["id"] for row in conn.execute(
+                """
+                SELECT id FROM entries
+                WHERE content_blob IS NOT NULL AND codec IS NOT ?
+                """,
+                (codec,)
+            )]
+        
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            
+            def rewrite(conn: sqlite3.Connection) -> int:
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT id, codec, content_blob FROM entries WHERE id IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                updates = []
+                for row in rows:
+                    raw = self._codec.decode(row["codec"], row["content_blob"])
+                    new_codec, blob = self._codec.encode(raw, codec)
+                    updates.append((new_codec, blob, row["id"]))
+                conn.executemany(
+                    "UPDATE entries SET codec = ?, content_blob = ? WHERE id = ?",
+                    updates
+                )
+                return len(updates)
+            
+            count += self._pool.write(rewrite)
+        return count
+    
     def get_stats(self) -> dict:
-        """Arkiston tilastot."""
-        with sqlite3.connect(self.db_path) as conn:
-            total = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
-            by_type = dict(conn.execute(
-                "SELECT document_type, COUNT(*) FROM entries GROUP BY document_type"
-            ).fetchall())
-            by_status = dict(conn.execute(
-                "SELECT status, COUNT(*) FROM entries GROUP BY status"
-            ).fetchall())
-            by_program = dict(conn.execute(
-                "SELECT program, COUNT(*) FROM entries GROUP BY program"
-            ).fetchall())
+        """
+        Arkiston tilastot materialisoiduista laskureista (entry_stats).
+        
+        Returns:
+            total_entries, total_words ja jakaumat by_type, by_status,
+            by_program, by_project, by_agent
+        """
+        keys = {
+            "document_type": "by_type",
+            "status": "by_status",
+            "program": "by_program",
+            "project": "by_project",
+            "agent_name": "by_agent",
+        }
+        stats: dict = {"total_entries": 0, "total_words": 0, **{k: {} for k in keys.values()}}
+        with self._pool.read() as conn:
+            rows = conn.execute(f"""
+                SELECT dimension, value, entries, words FROM entry_stats
+                WHERE dimension IN ('total', {", ".join(f"'{d}'" for d in keys)})
+                  AND entries > 0
+            """).fetchall()
+        for dimension, value, entries, words in rows:
+            if dimension == "total":
+                stats["total_entries"], stats["total_words"] = entries, words
+            else:
+                stats[keys[dimension]][value] = entries
+        return stats
+    
+    def daily_histogram(
+        self,
+        date_from: Optional[Union[date, str]] = None,
+        date_to: Optional[Union[date, str]] = None,
+    ) -> List[dict]:
+        """
+        Kirjaukset ja sanamäärät päivittäin (created_at, UTC-päivä).
         
+        Returns:
+            [{"day": "2026-01-31", "entries": 3, "words": 1200}, ...] päivämääräjärjestyksessä
+        """
+        sql = "SELECT value, entries, words FROM entry_stats WHERE dimension = 'day' AND entries > 0"
+        params = []
+        if date_from is not None:
+            sql += " AND value >= ?"
+            params.append(str(date_from)[:10])
+        if date_to is not None:
+            sql += " AND value <= ?"
+            params.append(str(date_to)[:10])
+        with self._pool.read() as conn:
+            rows = conn.execute(sql + " ORDER BY value", params).fetchall()
+        return [{"day": day, "entries": entries, "words": words} for day, entries, words in rows]
+    
+    def blob_stats(self) -> dict:
+        """Dedup- ja deltatallennuksen koko (skannaa blobs-taulun)."""
+        with self._pool.read() as conn:
+            blobs = conn.execute("""
+                SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0),
+                       COUNT(base)
+                FROM blobs
+            """).fetchone()
+            deduped = conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE content_hash IS NOT NULL"
+            ).fetchone()[0]
         return {
-            "total_entries": total,
-            "by_type": by_type,
-            "by_status": by_status,
-            "by_program": by_program
+            "count": blobs[0],
+            "bytes": blobs[1],         # uncompressed bodies
+            "stored_bytes": blobs[2],  # compressed / delta bytes in SQLite
+            "deltas": blobs[3],
+            "entries": deduped,
         }
 
 
@@ -477,262 +2358,286 @@ class GCSArchiveService(ArchiveService):
     
     Käyttää SQLite:tä metadatalle (lokaali) ja GCS:ää artifact-tiedostoille.
     Tuotannossa SQLite voidaan korvata Cloud SQL:llä.
+    
+    Artifactit kulkevat ArtifactCachen läpi (muisti + valinnainen levy).
+    Polkuun tallennetaan objektin generaatio (gs://bucket/a.json#<gen>),
+    joten välimuistiavain vaihtuu aina kun objekti kirjoitetaan uudelleen.
+    Hakusivun artifactit ladataan rinnakkain (fetch_workers säiettä).
+    
+    write_behind=True: save() kirjoittaa artifactin spool-hakemistoon ja
+    SQLiteen ja palaa heti; UploadSpool lähettää sen taustalla. Siihen asti
+    artifact_path on ilman generaatiota ja get() lukee spoolista; lähetyksen
+    jälkeen polku päivitetään generaatiolliseksi.
+    
+    dedup=True: sisältö on jaettu objekti <prefix><sha256>.body, joka
+    lähetetään vain kerran; uusi versio lähettää vain metadatansa.
+    delta_chains=True: deltat jäävät SQLiteen, GCS:ään menevät vain snapshotit.
     """
     
+    # Concurrent artifact downloads per search page
+    FETCH_WORKERS = int(os.environ.get("ARCHIVE_GCS_FETCH_WORKERS", "16"))
+    # Background uploaders in write-behind mode
+    UPLOAD_WORKERS = int(os.environ.get("ARCHIVE_GCS_UPLOAD_WORKERS", "2"))
+    # Storage class for move_to_cold() (NEARLINE | COLDLINE | ARCHIVE)
+    COLD_STORAGE_CLASS = os.environ.get("ARCHIVE_GCS_COLD_CLASS", "COLDLINE")
+    
     def __init__(
         self, 
         bucket_name: str,
         db_path: str = "./archive/samha_archive.db",
-        prefix: str = "artifacts/"
+        prefix: str = "artifacts/",
+        bucket=None,
+        cache: Optional[ArtifactCache] = None,
+        fetch_workers: Optional[int] = None,
+        write_behind: bool = False,
+        spool_dir: Optional[Union[str, Path]] = None,
+        upload_workers: Optional[int] = None,
+        dedup: bool = False,
+        delta_chains: bool = False,
+        embedder: Optional[Embedder] = None,
     ):
-        from google.cloud import storage
-        
         self.bucket_name = bucket_name
         self.prefix = prefix
-        self.storage_client = storage.Client()
-        self.bucket = self.storage_client.bucket(bucket_name)
+        if bucket is None:
+            from google.cloud import storage
+            
+            self.storage_client = storage.Client()
+            bucket = self.storage_client.bucket(bucket_name)
+        self.bucket = bucket
+        self.cache = cache if cache is not None else cache_from_env()
+        self._fetch_pool = ThreadPoolExecutor(
+            fetch_workers or self.FETCH_WORKERS, thread_name_prefix="gcs-fetch"
+        )
+        
+        self.spool: Optional[UploadSpool] = None
         
         # Initialize parent (SQLite for metadata)
-        super().__init__(db_path=db_path)
+        super().__init__(
+            db_path=db_path, dedup=dedup, delta_chains=delta_chains, embedder=embedder
+        )
+        
+        if write_behind:
+            self.spool = UploadSpool(
+                spool_dir or self.db_path.parent / "spool",
+                upload=self._upload_spooled,
+                on_uploaded=self._spool_uploaded,
+                workers=upload_workers or self.UPLOAD_WORKERS,
+            )
+            recovered = self.spool.start()
+            if recovered:
+                print(f"Archive spool: resuming {recovered} pending uploads")
         
         print(f"GCSArchiveService initialized with bucket: gs://{bucket_name}/{prefix}")
     
-    def save(self, entry: ArchiveEntry) -> str:
-        """
-        Tallenna arkistokirjaus.
-        - Metadata → SQLite (lokaali)
-        - Content → GCS bucket
-        """
-        # Save full content to GCS
-        gcs_path = f"{self.prefix}{entry.id}.json"
-        blob = self.bucket.blob(gcs_path)
-        
+    def _pending_path(self, name: str) -> str:
+        return f"gs://{self.bucket_name}/{self.prefix}{name}"
+    
+    def _store_artifact(self, entry: ArchiveEntry) -> str:
+        """Content → GCS bucket, palauta gs://-polku (+ #generaatio)."""
+        name = f"{entry.id}.json"
         content_json = entry.model_dump_json(indent=2)
-        blob.upload_from_string(content_json, content_type="application/json")
-        
-        # Save metadata to SQLite with GCS path
-        artifact_path = f"gs://{self.bucket_name}/{gcs_path}"
+        if self.spool is not None:
+            # Uploaded after the metadata commit (see save_many)
+            self.spool.write(name, content_json.encode("utf-8"))
+            return self._pending_path(name)
         
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT OR REPLACE INTO entries (
-                    id, trace_id, title, summary, document_type, program, project,
-                    tags, audience, language, channel, status, qa_decision, qa_report_id,
-                    agent_name, prompt_packs, version, parent_id, created_at, updated_at,
-                    word_count, artifact_path
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                entry.id,
-                entry.trace_id,
-                entry.title,
-                entry.summary,
-                entry.document_type,
-                entry.program,
-                entry.project,
-                " ".join(entry.tags),
-                entry.audience,
-                entry.language,
-                entry.channel,
-                entry.status,
-                entry.qa_decision,
-                entry.qa_report_id,
-                entry.agent_name,
-                json.dumps(entry.prompt_packs),
-                entry.version,
-                entry.parent_id,
-                entry.created_at.isoformat(),
-                entry.updated_at.isoformat(),
-                entry.word_count,
-                artifact_path
-            ))
-            
-            # Update FTS index
-            conn.execute("""
-                INSERT INTO entries_fts (id, title, summary, tags)
-                VALUES (?, ?, ?, ?)
-            """, (entry.id, entry.title, entry.summary, " ".join(entry.tags)))
-            
-            conn.commit()
+        artifact_path = self._upload_spooled(name, content_json.encode("utf-8"))
+        print(f"Saved to GCS: {artifact_path}")
+        return artifact_path
+    
+    def _upload_spooled(self, name: str, data: bytes) -> str:
+        """Lähetä artifact GCS:ään, palauta gs://-polku (+ #generaatio)."""
+        blob = self.bucket.blob(f"{self.prefix}{name}")
+        content_type = (
+            "application/json" if name.endswith(".json") else "text/plain; charset=utf-8"
+        )
+        blob.upload_from_string(data, content_type=content_type)
         
-        print(f"Saved to GCS: gs://{self.bucket_name}/{gcs_path}")
-        return entry.id
+        artifact_path = self._pending_path(name)
+        if blob.generation:
+            artifact_path += f"#{blob.generation}"
+        # Write-through: reading back a fresh save never goes to GCS
+        self.cache.put(artifact_path, data, fetched=False)
+        return artifact_path
     
-    def get(self, entry_id: str) -> Optional[ArchiveEntry]:
-        """Hae yksittäinen arkistokirjaus ID:llä GCS:stä."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            row = conn.execute(
-                "SELECT artifact_path FROM entries WHERE id = ?",
-                (entry_id,)
-            ).fetchone()
-            
-            if not row:
-                return None
-            
-            artifact_path = row["artifact_path"]
-            
-            # Check if GCS path
-            if artifact_path.startswith("gs://"):
-                # Parse gs://bucket/path
-                gcs_path = artifact_path.replace(f"gs://{self.bucket_name}/", "")
-                blob = self.bucket.blob(gcs_path)
-                
-                if not blob.exists():
-                    return None
-                
-                content = blob.download_as_text()
-                data = json.loads(content)
-            else:
-                # Fall back to local file (for migration)
-                local_path = Path(artifact_path)
-                if not local_path.exists():
-                    return None
-                
-                with open(local_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            
-            return ArchiveEntry(**data)
+    def _spool_uploaded(self, name: str, data: bytes, artifact_path: str) -> None:
+        """Spoolattu artifact on GCS:ssä: osoita rivit generaatiolliseen polkuun."""
+        pending = self._pending_path(name)
+        table, column = ("blobs", "path") if name.endswith(".body") else ("entries", "artifact_path")
+        self._pool.write(lambda conn: conn.execute(
+            f"UPDATE {table} SET {column} = ? WHERE {column} = ?",
+            (artifact_path, pending),
+        ))
+    
+    def _store_body(
+        self, digest: str, content: str
+    ) -> Tuple[Optional[str], Optional[bytes], Optional[str]]:
+        """Jaettu sisältö omaksi objektikseen: (None, None, gs://-polku)."""
+        name = f"{digest}.body"
+        data = content.encode("utf-8")
+        if self.spool is not None:
+            self.spool.write(name, data)
+            return None, None, self._pending_path(name)
+        return None, None, self._upload_spooled(name, data)
+    
+    def _load_body(
+        self, codec: Optional[str], data: Optional[bytes], path: Optional[str]
+    ) -> Optional[bytes]:
+        if path is None:
+            return super()._load_body(codec, data, path)
+        try:
+            return self._read_object(path)
+        except Exception as e:
+            if GCSNotFound is None or not isinstance(e, GCSNotFound):
+                print(f"Error loading {path}: {e}")
+            return None
+    
+    def _delete_body(self, path: str) -> None:
+        gcs_path = path.replace(f"gs://{self.bucket_name}/", "")
+        name, _, generation = gcs_path.partition("#")
+        self.cache.invalidate(path)
+        try:
+            # Pinned generation: a re-upload of the same hash survives
+            self.bucket.blob(name, generation=int(generation) if generation else None).delete()
+        except Exception as e:
+            if GCSNotFound is None or not isinstance(e, GCSNotFound):
+                print(f"Error deleting {path}: {e}")
+    
+    def _write_cold(self, row: sqlite3.Row) -> Optional[Tuple[str, Optional[str], int]]:
+        """Vaihda objektin storage class; uusi generaatio polkuun."""
+        path = row["artifact_path"] or ""
+        name, _, generation = path.replace(f"gs://{self.bucket_name}/", "").partition("#")
+        if not path.startswith("gs://") or not generation:
+            # Local fallback row or upload still spooled: nothing to tier yet
+            return None
+        blob = self.bucket.blob(name, generation=int(generation))
+        try:
+            # Precondition: a concurrent re-save (newer generation) is never overwritten
+            blob.update_storage_class(self.COLD_STORAGE_CLASS, if_generation_match=int(generation))
+        except Exception as e:
+            print(f"Cold tiering skipped for {path}: {e}")
+            return None
+        return f"gs://{self.bucket_name}/{name}#{blob.generation}", None, blob.size or 0
+    
+    def _delete_artifact(self, path: str) -> int:
+        if not path.startswith("gs://"):
+            return super()._delete_artifact(path)
+        # Same generation-pinned delete as shared bodies
+        self._delete_body(path)
+        return 0
+    
+    def save_many(self, entries: Sequence[ArchiveEntry]) -> List[str]:
+        ids = super().save_many(entries)
+        if self.spool is not None:
+            for entry in entries:
+                self.spool.enqueue(f"{entry.id}.json")
+                if self.dedup:
+                    # No-op when the body was already stored
+                    self.spool.enqueue(f"{content_hash(entry.content)}.body")
+        return ids
+    
+    def flush_uploads(self, timeout: Optional[float] = None) -> bool:
+        """Odota spoolin tyhjenemistä (write-behind). False = timeout."""
+        return self.spool.flush(timeout) if self.spool is not None else True
+    
+    def close(self) -> None:
+        """Pysäytä taustalähettäjät; kesken jääneet jatkuvat seuraavassa käynnistyksessä."""
+        if self.spool is not None:
+            self.spool.close()
+        self._fetch_pool.shutdown(wait=True)
+    
+    def _read_object(self, gcs_uri: str) -> bytes:
+        """gs://-objektin tavut: spool → välimuisti → GCS (NotFound nousee)."""
+        if self.spool is not None and "#" not in gcs_uri:
+            # Not uploaded yet: serve the spooled copy
+            content = self.spool.read(gcs_uri.rsplit("/", 1)[-1])
+            if content is not None:
+                return content
+        content = self.cache.get(gcs_uri)
+        if content is None:
+            gcs_path = gcs_uri.replace(f"gs://{self.bucket_name}/", "")
+            name, _, generation = gcs_path.partition("#")
+            blob = self.bucket.blob(
+                name, generation=int(generation) if generation else None
+            )
+            # One round trip: a missing object raises NotFound
+            content = blob.download_as_bytes()
+            self.cache.put(gcs_uri, content)
+        return content
     
     def _load_entry_from_path(self, artifact_path: str) -> Optional[ArchiveEntry]:
-        """Load entry from either GCS or local path."""
+        """Load entry from either GCS (via the cache) or local path."""
         try:
-            if artifact_path.startswith("gs://"):
-                gcs_path = artifact_path.replace(f"gs://{self.bucket_name}/", "")
-                blob = self.bucket.blob(gcs_path)
-                
-                if not blob.exists():
-                    return None
-                
-                content = blob.download_as_text()
-                data = json.loads(content)
-            else:
-                local_path = Path(artifact_path)
-                if not local_path.exists():
-                    return None
-                
-                with open(local_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            
-            return ArchiveEntry(**data)
+            if not artifact_path.startswith("gs://"):
+                # Fall back to local file (for migration)
+                return super()._load_entry_from_path(artifact_path)
+            return ArchiveEntry.model_validate_json(self._read_object(artifact_path))
         except Exception as e:
+            if GCSNotFound is not None and isinstance(e, GCSNotFound):
+                return None
             print(f"Error loading {artifact_path}: {e}")
             return None
     
-    def search(self, query: ArchiveSearchQuery) -> ArchiveSearchResult:
-        """
-        Hae arkistosta suodattimilla ja/tai tekstihaulla.
-        Override to load from GCS.
-        """
-        conditions = []
-        params = []
-        
-        # Build WHERE clause (same as parent)
-        if query.document_type:
-            conditions.append("document_type = ?")
-            params.append(query.document_type)
-        
-        if query.program:
-            conditions.append("program = ?")
-            params.append(query.program)
-        
-        if query.project:
-            conditions.append("project = ?")
-            params.append(query.project)
-        
-        if query.status:
-            conditions.append("status = ?")
-            params.append(query.status)
-        
-        if query.agent_name:
-            conditions.append("agent_name = ?")
-            params.append(query.agent_name)
-        
-        if query.approved_only:
-            conditions.append("qa_decision = 'approve'")
-        
-        if query.tags:
-            for tag in query.tags:
-                conditions.append("tags LIKE ?")
-                params.append(f"%{tag}%")
-        
-        if query.date_from:
-            conditions.append("created_at >= ?")
-            params.append(query.date_from.isoformat())
-        
-        if query.date_to:
-            conditions.append("created_at <= ?")
-            params.append(query.date_to.isoformat())
-        
-        if query.query:
-            conditions.append("""
-                id IN (
-                    SELECT id FROM entries_fts 
-                    WHERE entries_fts MATCH ?
-                )
-            """)
-            params.append(query.query)
-        
-        where_clause = " AND ".join(conditions) if conditions else "1=1"
-        
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            
-            count_sql = f"SELECT COUNT(*) FROM entries WHERE {where_clause}"
-            total_count = conn.execute(count_sql, params).fetchone()[0]
-            
-            if query.latest_only:
-                sql = f"""
-                    SELECT artifact_path FROM entries 
-                    WHERE {where_clause}
-                    GROUP BY title
-                    HAVING version = MAX(version)
-                    ORDER BY created_at DESC
-                    LIMIT ? OFFSET ?
-                """
-            else:
-                sql = f"""
-                    SELECT artifact_path FROM entries 
-                    WHERE {where_clause}
-                    ORDER BY created_at DESC
-                    LIMIT ? OFFSET ?
-                """
-            
-            params.extend([query.limit, query.offset])
-            rows = conn.execute(sql, params).fetchall()
-        
-        # Load entries from GCS or local
-        entries = []
-        for row in rows:
-            entry = self._load_entry_from_path(row["artifact_path"])
-            if entry:
-                entries.append(entry)
-        
-        return ArchiveSearchResult(
-            entries=entries,
-            total_count=total_count,
-            query=query
-        )
+    def _load_entry_rows(self, rows: Sequence[sqlite3.Row]) -> List[Optional[ArchiveEntry]]:
+        """Artifactit rinnakkain, tulokset rivijärjestyksessä."""
+        if len(rows) <= 1:
+            return super()._load_entry_rows(rows)
+        return list(self._fetch_pool.map(self._load_entry_row, rows))
+    
+    def cache_stats(self) -> dict:
+        """Artifact-välimuistin osumat, ohitukset ja tavut."""
+        return self.cache.stats()
+    
+    def get_stats(self) -> dict:
+        stats = {**super().get_stats(), "artifact_cache": self.cache_stats()}
+        if self.spool is not None:
+            stats["upload_spool"] = self.spool.stats()
+        return stats
 
 
-def get_archive_service() -> ArchiveService:
+def get_archive_service() -> Union[ArchiveService, "BlockingArchiveBackend"]:
     """
     Get or create archive service singleton.
     
-    Uses GCS if ARCHIVE_GCS_BUCKET env var is set, otherwise local storage.
+    ARCHIVE_BACKEND=postgres: shared PostgreSQL archive (app.archive_backends)
+    behind a blocking facade; it searches and saves like ArchiveService but
+    has no SQLite maintenance methods (gc_blobs, vacuum, ...), and retention
+    and export raise SQLiteOnlyError. Otherwise uses GCS if ARCHIVE_GCS_BUCKET
+    env var is set,
+    otherwise local storage.
     """
     global _archive_service
     if _archive_service is None:
+        from app.archive_backends import BlockingArchiveBackend, PostgresBackend, backend_name
+        
         bucket_name = os.environ.get("ARCHIVE_GCS_BUCKET")
+        dedup = os.environ.get("ARCHIVE_DEDUP", "").lower() in ("1", "true", "yes")
+        delta_chains = os.environ.get("ARCHIVE_DELTA", "").lower() in ("1", "true", "yes")
+        embedder = embedder_from_env()
         
-        if bucket_name:
+        if backend_name() == "postgres":
+            print("Using PostgreSQL Archive (ARCHIVE_DATABASE_URL)")
+            _archive_service = BlockingArchiveBackend(PostgresBackend.from_env())
+        elif bucket_name:
             print(f"Using GCS Archive: gs://{bucket_name}/")
             _archive_service = GCSArchiveService(
                 bucket_name=bucket_name,
-                prefix=os.environ.get("ARCHIVE_GCS_PREFIX", "archive/")
+                prefix=os.environ.get("ARCHIVE_GCS_PREFIX", "archive/"),
+                write_behind=os.environ.get("ARCHIVE_GCS_WRITE_BEHIND", "").lower()
+                in ("1", "true", "yes"),
+                spool_dir=os.environ.get("ARCHIVE_GCS_SPOOL_DIR") or None,
+                dedup=dedup,
+                delta_chains=delta_chains,
+                embedder=embedder,
             )
         else:
-            print("Using Local Archive: ./archive/")
-            _archive_service = ArchiveService()
+            storage = os.environ.get("ARCHIVE_STORAGE", "file")
+            print(
+                f"Using Local Archive: ./archive/ "
+                f"(storage={storage}, dedup={dedup}, delta_chains={delta_chains})"
+            )
+            _archive_service = ArchiveService(
+                storage=storage, dedup=dedup, delta_chains=delta_chains, embedder=embedder
+            )
     
     return _archive_service
-
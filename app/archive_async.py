@@ -0,0 +1,161 @@
+"""
+Arkiston async-rajapinta FastAPI/ADK-tapahtumasilmukkaa varten.
+
+ArchiveService tekee blokkaavaa I/O:ta (SQLite, GCS-lataukset). Tämä kääre
+ajaa jokaisen kutsun omassa säiepoolissaan, joten hidas GCS-upload tai
+kirjoitusjono ei pysäytä /run_sse-silmukkaa muilta käyttäjiltä:
+
+- Lukupooli: get, search, tag_facets, get_stats, daily_histogram
+- Kirjoituspooli: save, save_many, update, patch_metadata (GCS-uploadit)
+  → hitaat uploadit eivät vie lukijoiden säikeitä
+
+Tämä on ArchiveBackendin SQLite-toteutus; ARCHIVE_BACKEND=postgres valitsee
+PostgresBackendin (app.archive_backends).
+
+Käyttö:
+    from app.archive_async import get_async_archive_service
+
+    archive = get_async_archive_service()
+    entry_id = await archive.save(entry)
+    result = await archive.search(query, fields=["title"])
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Callable, Dict, List, Optional, Sequence, TypeVar, Union
+
+from app.archive import (
+    ArchiveEntry,
+    ArchiveSearchQuery,
+    ArchiveSearchResult,
+    ArchiveService,
+    DocumentType,
+    Project,
+    SearchMode,
+    get_archive_service,
+)
+from app.archive_backends import ArchiveBackend, PostgresBackend, backend_name
+
+T = TypeVar("T")
+
+# Thread pool sizes (env overridable). SQLite has a single writer anyway;
+# write threads mostly wait on GCS uploads.
+READ_WORKERS = int(os.environ.get("ARCHIVE_READ_WORKERS", "8"))
+WRITE_WORKERS = int(os.environ.get("ARCHIVE_WRITE_WORKERS", "4"))
+
+
+class AsyncArchiveService(ArchiveBackend):
+    """ArchiveServicen async-versio: sama API, kutsut omissa säiepooleissaan."""
+
+    def __init__(
+        self,
+        service: Optional[ArchiveService] = None,
+        read_workers: int = READ_WORKERS,
+        write_workers: int = WRITE_WORKERS,
+    ):
+        self.service = service or get_archive_service()
+        self._readers = ThreadPoolExecutor(read_workers, thread_name_prefix="archive-read")
+        self._writers = ThreadPoolExecutor(write_workers, thread_name_prefix="archive-write")
+
+    @property
+    def embedder(self):
+        return self.service.embedder
+
+    async def _run(
+        self, executor: ThreadPoolExecutor, fn: Callable[..., T], *args, **kwargs
+    ) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    # -------------------------------------------------------------------------
+    # Writes
+    # -------------------------------------------------------------------------
+
+    async def save(self, entry: ArchiveEntry) -> str:
+        return await self._run(self._writers, self.service.save, entry)
+
+    async def save_many(self, entries: Sequence[ArchiveEntry]) -> List[str]:
+        return await self._run(self._writers, self.service.save_many, entries)
+
+    async def update(self, entry_id: str, updates: dict) -> Optional[ArchiveEntry]:
+        return await self._run(self._writers, self.service.update, entry_id, updates)
+
+    async def patch_metadata(self, entry_id: str, **fields) -> bool:
+        return await self._run(self._writers, self.service.patch_metadata, entry_id, **fields)
+
+    # -------------------------------------------------------------------------
+    # Reads
+    # -------------------------------------------------------------------------
+
+    async def get(self, entry_id: str) -> Optional[ArchiveEntry]:
+        return await self._run(self._readers, self.service.get, entry_id)
+
+    async def search(
+        self,
+        query: ArchiveSearchQuery,
+        fields: Optional[Sequence[str]] = None,
+        mode: Optional[SearchMode] = None,
+    ) -> ArchiveSearchResult:
+        return await self._run(
+            self._readers, self.service.search, query, fields=fields, mode=mode
+        )
+
+    async def list_latest(
+        self,
+        document_type: Optional[DocumentType] = None,
+        project: Optional[Project] = None,
+        limit: int = 10,
+    ) -> List[ArchiveEntry]:
+        return await self._run(
+            self._readers, self.service.list_latest,
+            document_type=document_type, project=project, limit=limit,
+        )
+
+    async def tag_facets(
+        self, query: Optional[ArchiveSearchQuery] = None, limit: int = 50
+    ) -> Dict[str, int]:
+        return await self._run(self._readers, self.service.tag_facets, query, limit=limit)
+
+    async def get_stats(self) -> dict:
+        return await self._run(self._readers, self.service.get_stats)
+
+    async def daily_histogram(
+        self,
+        date_from: Optional[Union[date, str]] = None,
+        date_to: Optional[Union[date, str]] = None,
+    ) -> List[dict]:
+        return await self._run(self._readers, self.service.daily_histogram, date_from, date_to)
+
+    # -------------------------------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------------------------------
+
+    def close(self) -> None:
+        """Odota kesken olevat kutsut ja sulje säiepoolit."""
+        self._writers.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+    async def aclose(self) -> None:
+        await asyncio.to_thread(self.close)
+
+
+_async_archive_service: Optional[ArchiveBackend] = None
+
+
+def get_async_archive_service() -> ArchiveBackend:
+    """
+    Get or create the async archive singleton.
+
+    ARCHIVE_BACKEND=postgres: PostgresBackend (pool bound to the server's
+    event loop), otherwise AsyncArchiveService wrapping get_archive_service().
+    """
+    global _async_archive_service
+    if _async_archive_service is None:
+        if backend_name() == "postgres":
+            _async_archive_service = PostgresBackend.from_env()
+        else:
+            _async_archive_service = AsyncArchiveService()
+    return _async_archive_service
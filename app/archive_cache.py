@@ -0,0 +1,229 @@
+"""
+Arkiston artifact-välimuisti (GCS-latausten read-through).
+
+- Muistitaso: LRU, rajattu tavumäärällä ja TTL:llä
+- Valinnainen levytaso: tiedosto per avain, oma tavuraja, LRU-poisto
+- Avain: artifact-polku + GCS-generaatio ("gs://b/a.json#1712..."), joten
+  ylikirjoitettu objekti ei koskaan palaudu vanhana versiona
+- Tilastot: osumat / ohitukset per taso, tavut välimuistista ja verkosta
+
+Käyttö:
+    cache = ArtifactCache(max_bytes=64 * 2**20, ttl=3600, disk_dir="/tmp/archive-cache")
+    data = cache.get(key)
+    if data is None:
+        data = download()
+        cache.put(key, data)
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 3600.0
+DEFAULT_DISK_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ArtifactCache:
+    """Säieturvallinen LRU+TTL-välimuisti artifact-tavuille."""
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: float = DEFAULT_TTL,
+        disk_dir: Optional[Union[str, Path]] = None,
+        disk_max_bytes: int = DEFAULT_DISK_MAX_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        # key -> (stored_at, data), least recently used first
+        self._memory: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._stats: Dict[str, int] = dict.fromkeys((
+            "hits", "misses", "memory_hits", "disk_hits", "evictions",
+            "bytes_served", "bytes_fetched",
+        ), 0)
+
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        # file name -> size, least recently used first
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._load_disk_index()
+
+    # -------------------------------------------------------------------------
+    # Public API
+    # -------------------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Palauta välimuistissa oleva data tai None (= hae lähteestä ja put())."""
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                stored_at, data = item
+                if now - stored_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._record_hit("memory_hits", data)
+                    return data
+                self._drop_memory(key)
+
+        data = self._disk_get(key, now)
+        with self._lock:
+            if data is None:
+                self._stats["misses"] += 1
+                return None
+            self._record_hit("disk_hits", data)
+            self._memory_put(key, data, now)
+        return data
+
+    def put(self, key: str, data: bytes, fetched: bool = True) -> None:
+        """
+        Lisää data välimuistiin.
+
+        Args:
+            fetched: True = data haettiin verkosta (bytes_fetched-tilasto),
+                False = kirjoitettiin itse (write-through tallennuksessa)
+        """
+        now = time.time()
+        with self._lock:
+            if fetched:
+                self._stats["bytes_fetched"] += len(data)
+            self._memory_put(key, data, now)
+        self._disk_put(key, data)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._drop_memory(key)
+            if self.disk_dir:
+                name = self._disk_name(key)
+                if name in self._disk:
+                    self._disk_bytes -= self._disk.pop(name)
+                    (self.disk_dir / name).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self.disk_dir:
+                for name in self._disk:
+                    (self.disk_dir / name).unlink(missing_ok=True)
+                self._disk.clear()
+                self._disk_bytes = 0
+
+    def stats(self) -> dict:
+        """Osumat, ohitukset, tavut ja nykyinen koko."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    # -------------------------------------------------------------------------
+    # Memory tier (call with self._lock held)
+    # -------------------------------------------------------------------------
+
+    def _record_hit(self, tier: str, data: bytes) -> None:
+        self._stats["hits"] += 1
+        self._stats[tier] += 1
+        self._stats["bytes_served"] += len(data)
+
+    def _memory_put(self, key: str, data: bytes, now: float) -> None:
+        if len(data) > self.max_bytes:
+            return
+        self._drop_memory(key)
+        self._memory[key] = (now, data)
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._stats["evictions"] += 1
+
+    def _drop_memory(self, key: str) -> None:
+        item = self._memory.pop(key, None)
+        if item is not None:
+            self._memory_bytes -= len(item[1])
+
+    # -------------------------------------------------------------------------
+    # Disk tier
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _disk_name(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _load_disk_index(self) -> None:
+        files = sorted(
+            (p for p in self.disk_dir.iterdir() if p.is_file() and not p.name.endswith(".tmp")),
+            key=lambda p: p.stat().st_mtime,
+        )
+        for path in files:
+            size = path.stat().st_size
+            self._disk[path.name] = size
+            self._disk_bytes += size
+
+    def _disk_get(self, key: str, now: float) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        name = self._disk_name(key)
+        path = self.disk_dir / name
+        with self._lock:
+            if name not in self._disk:
+                return None
+            self._disk.move_to_end(name)
+        try:
+            if now - path.stat().st_mtime > self.ttl:
+                raise FileNotFoundError(path)
+            return path.read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                if name in self._disk:
+                    self._disk_bytes -= self._disk.pop(name)
+            path.unlink(missing_ok=True)
+            return None
+
+    def _disk_put(self, key: str, data: bytes) -> None:
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            return
+        name = self._disk_name(key)
+        path = self.disk_dir / name
+        # Write-then-rename: readers never see a partial file
+        tmp_path = path.with_name(f"{name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(name, 0)
+            self._disk[name] = len(data)
+            self._disk_bytes += len(data)
+            while self._disk_bytes > self.disk_max_bytes:
+                old, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(old)
+        for old in evicted:
+            (self.disk_dir / old).unlink(missing_ok=True)
+
+
+def cache_from_env() -> ArtifactCache:
+    """ArtifactCache ympäristömuuttujista (ARCHIVE_CACHE_*)."""
+    return ArtifactCache(
+        max_bytes=int(float(os.environ.get("ARCHIVE_CACHE_MAX_MB", "64")) * 1024 * 1024),
+        ttl=float(os.environ.get("ARCHIVE_CACHE_TTL", str(DEFAULT_TTL))),
+        disk_dir=os.environ.get("ARCHIVE_CACHE_DIR") or None,
+        disk_max_bytes=int(
+            float(os.environ.get("ARCHIVE_CACHE_DISK_MAX_MB", "512")) * 1024 * 1024
+        ),
+    )
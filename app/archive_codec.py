@@ -0,0 +1,117 @@
+"""
+Arkiston sisällön pakkaus (inline-tallennus SQLiteen).
+
+- zstd (zstandard-paketti), valinnaisesti opetetulla sanakirjalla:
+  lyhyet suomenkieliset luonnokset pakkautuvat sanakirjalla moninkertaisesti
+- zlib-fallback jos zstandard ei ole asennettu
+
+Codec-nimi tallennetaan riville: "zstd", "zstd:<dict_id>" tai "zlib".
+
+Versioketjujen deltat: uusi versio pakataan edellisen version sisältö
+sanakirjana ("zstd-delta", fallback "zlib-delta"), joten muuttumaton teksti
+maksaa lähes nolla tavua. Purku tarvitsee saman pohjaversion.
+"""
+
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional: pip install "samha-infra[archive]"
+    zstandard = None
+
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+# zlib preset dictionaries are limited to the 32 KB window
+ZLIB_MAX_DICT = 32 * 1024
+DEFAULT_DICT_SIZE = 64 * 1024
+
+
+def zstd_available() -> bool:
+    return zstandard is not None
+
+
+class ArchiveCodec:
+    """Pakkaa/pura arkistorivien sisältö. Sanakirjat ladataan tietokannasta."""
+
+    def __init__(self, dictionaries: Optional[Dict[int, bytes]] = None):
+        self._dicts: Dict[int, "zstandard.ZstdCompressionDict"] = {}
+        self.active_dict_id: Optional[int] = None
+        for dict_id, data in sorted((dictionaries or {}).items()):
+            self.add_dictionary(dict_id, data)
+
+    @property
+    def default_codec(self) -> str:
+        if zstandard is None:
+            return "zlib"
+        if self.active_dict_id is not None:
+            return f"zstd:{self.active_dict_id}"
+        return "zstd"
+
+    def add_dictionary(self, dict_id: int, data: bytes, activate: bool = True) -> None:
+        if zstandard is None:
+            return
+        self._dicts[dict_id] = zstandard.ZstdCompressionDict(data)
+        if activate:
+            self.active_dict_id = dict_id
+
+    def _dict_id(self, codec: str) -> Optional[int]:
+        _, _, dict_id = codec.partition(":")
+        return int(dict_id) if dict_id else None
+
+    def _require_zstd(self, codec: str) -> None:
+        if zstandard is None:
+            raise RuntimeError(
+                f"Codec '{codec}' requires the zstandard package "
+                "(pip install 'samha-infra[archive]')"
+            )
+
+    # Compressor objects are not thread-safe; they are cheap, so only the
+    # (immutable) dictionaries are shared and a new object is made per call.
+    def encode(self, data: bytes, codec: Optional[str] = None) -> Tuple[str, bytes]:
+        """Pakkaa data, palauta (codec, blob)."""
+        codec = codec or self.default_codec
+        if codec == "zlib":
+            return codec, zlib.compress(data, ZLIB_LEVEL)
+        self._require_zstd(codec)
+        dict_id = self._dict_id(codec)
+        dict_data = self._dicts[dict_id] if dict_id is not None else None
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data)
+        return codec, compressor.compress(data)
+
+    def decode(self, codec: str, blob: bytes) -> bytes:
+        """Pura rivin sisältö codec-nimen mukaan."""
+        if codec == "zlib":
+            return zlib.decompress(blob)
+        self._require_zstd(codec)
+        dict_id = self._dict_id(codec)
+        if dict_id is not None and dict_id not in self._dicts:
+            raise KeyError(f"Unknown zstd dictionary id {dict_id}")
+        dict_data = self._dicts[dict_id] if dict_id is not None else None
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(blob)
+
+    def encode_delta(self, data: bytes, base: bytes) -> Tuple[str, bytes]:
+        """Pakkaa data käyttäen pohjaversiota sanakirjana, palauta (codec, delta)."""
+        if zstandard is None:
+            compressor = zlib.compressobj(ZLIB_LEVEL, zdict=base[-ZLIB_MAX_DICT:])
+            return "zlib-delta", compressor.compress(data) + compressor.flush()
+        raw = zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        return "zstd-delta", zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=raw).compress(data)
+
+    def decode_delta(self, codec: str, delta: bytes, base: bytes) -> bytes:
+        """Pura encode_delta():n tulos samaa pohjaversiota vasten."""
+        if codec == "zlib-delta":
+            decompressor = zlib.decompressobj(zdict=base[-ZLIB_MAX_DICT:])
+            return decompressor.decompress(delta) + decompressor.flush()
+        if codec != "zstd-delta":
+            raise ValueError(f"Not a delta codec: {codec!r}")
+        self._require_zstd(codec)
+        raw = zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        return zstandard.ZstdDecompressor(dict_data=raw).decompress(delta)
+
+
+def train_dictionary(samples: List[bytes], dict_size: int = DEFAULT_DICT_SIZE) -> bytes:
+    """Opeta zstd-sanakirja näytteistä (esim. olemassa olevat arkistorivit)."""
+    if zstandard is None:
+        raise RuntimeError("Dictionary training requires the zstandard package")
+    return zstandard.train_dictionary(dict_size, samples).as_bytes()
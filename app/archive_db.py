@@ -0,0 +1,305 @@
+"""
+Arkiston SQLite-yhteyksien hallinta.
+
+Yksi SQLitePool per tietokantatiedosto per prosessi:
+- WAL-journal: lukijat eivät odota kirjoittajaa eivätkä toisiaan
+- Lukijat: säiekohtainen (thread-local) yhteys, avataan kerran; päättyneiden
+  säikeiden yhteydet suljetaan kun uusi lukijasäie avaa yhteyden
+- read(): yksi lukutransaktio, eli kaikki sen kyselyt näkevät saman tilannekuvan
+- Kirjoittaja: yksi yhteys omassa säikeessään + jono (group commit)
+- Prepared statementit: sqlite3:n statement-välimuisti per yhteys
+
+Käyttö:
+    from app.archive_db import get_pool
+
+    pool = get_pool("./archive/samha_archive.db")
+    with pool.read() as conn:
+        conn.execute("SELECT ...")
+    pool.write(lambda conn: conn.execute("INSERT ..."))
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, Union
+
+T = TypeVar("T")
+
+# Per-connection tuning. WAL + synchronous=NORMAL is durable across app
+# crashes; only an OS crash can lose the last committed transactions.
+DEFAULT_PRAGMAS: Dict[str, Union[int, str]] = {
+    "synchronous": "NORMAL",
+    # New databases free pages with PRAGMA incremental_vacuum (archive
+    # compaction); existing ones switch over on their next full VACUUM
+    "auto_vacuum": "INCREMENTAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -16 * 1024,  # KiB, per connection
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+    "foreign_keys": "ON",
+}
+
+# Prepared statements kept per connection (sqlite3 LRU statement cache)
+STATEMENT_CACHE_SIZE = 256
+
+# Max queued writes committed in one transaction
+WRITE_BATCH_SIZE = 64
+
+
+class SQLitePool:
+    """Säiekohtaiset lukijayhteydet + yksi jonotettu kirjoittaja."""
+
+    def __init__(
+        self,
+        db_path: Union[str, Path],
+        pragmas: Optional[Dict[str, Union[int, str]]] = None,
+    ):
+        self.db_path = str(db_path)
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self._lock = threading.Lock()
+        self._reset()
+
+        # journal_mode is persistent in the database file, set it once
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+
+    def _reset(self) -> None:
+        """(Re)initialise per-process state, e.g. after fork()."""
+        self._pid = os.getpid()
+        self._local = threading.local()
+        # Owner thread -> its reader connection (reaped when the thread dies)
+        self._readers: Dict[threading.Thread, sqlite3.Connection] = {}
+        # (fn, future, transaction)
+        self._queue: "queue.Queue[Optional[Tuple[Callable, Future, bool]]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_conn: Optional[sqlite3.Connection] = None
+        self._closed = False
+        # Bumped after every commit; lets callers invalidate derived caches
+        self.generation = 0
+
+    def _check_pid(self) -> None:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            isolation_level=None,  # transactions are managed explicitly
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    # -------------------------------------------------------------------------
+    # Readers
+    # -------------------------------------------------------------------------
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """
+        Säikeen oma lukuyhteys yhdessä lukutransaktiossa.
+
+        Lohkon kaikki kyselyt (esim. count + sivu) näkevät saman tilannekuvan.
+        Sisäkkäinen read() samassa säikeessä liittyy ulompaan transaktioon.
+        """
+        self._check_pid()
+        if self._closed:
+            raise RuntimeError(f"SQLitePool for {self.db_path} is closed")
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._reap_readers()
+                self._readers[threading.current_thread()] = conn
+        if conn.in_transaction:
+            yield conn
+            return
+        # Deferred: the snapshot is taken by the first SELECT
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+
+    def _reap_readers(self) -> None:
+        """Sulje päättyneiden säikeiden lukuyhteydet (kutsutaan lukon alla)."""
+        for thread in [t for t in self._readers if not t.is_alive()]:
+            # Releases the file handle and the connection's WAL read mark
+            self._readers.pop(thread).close()
+
+    # -------------------------------------------------------------------------
+    # Writer
+    # -------------------------------------------------------------------------
+
+    def write(self, fn: Callable[[sqlite3.Connection], T], transaction: bool = True) -> T:
+        """
+        Aja fn(conn) kirjoitustransaktiossa ja palauta sen tulos.
+
+        Kutsu blokkaa kunnes transaktio on commitoitu. Kutsu kirjoittaja-
+        säikeestä (fn:n sisältä) ajetaan suoraan samaan transaktioon.
+
+        transaction=False: fn ajetaan kirjoittajasäikeessä yksinään ilman
+        transaktiota (VACUUM, wal_checkpoint); muut kirjoitukset odottavat jonossa.
+        """
+        self._check_pid()
+        if threading.current_thread() is self._writer:
+            if not transaction:
+                raise RuntimeError("transaction=False write from inside a write transaction")
+            return fn(self._writer_conn)
+        if self._closed:
+            raise RuntimeError(f"SQLitePool for {self.db_path} is closed")
+
+        future: Future = Future()
+        self._ensure_writer()
+        self._queue.put((fn, future, transaction))
+        return future.result()
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._writer_loop,
+                    name=f"sqlite-writer:{Path(self.db_path).name}",
+                    daemon=True,
+                )
+                self._writer.start()
+
+    def _writer_loop(self) -> None:
+        conn = self._writer_conn = self._connect()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                batch = [item]
+                alone = None if item[2] else batch.pop()
+                while alone is None and len(batch) < WRITE_BATCH_SIZE:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        self._queue.put(None)  # stop after this batch
+                        break
+                    if not item[2]:
+                        alone = item  # after the batch queued before it
+                        break
+                    batch.append(item)
+                if batch:
+                    self._commit_batch(conn, batch)
+                if alone is not None:
+                    self._run_alone(conn, alone)
+        finally:
+            self._writer_conn = None
+            conn.close()
+
+    def _run_alone(self, conn: sqlite3.Connection, item: Tuple[Callable, Future, bool]) -> None:
+        fn, future, _ = item
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(conn)
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            future.set_exception(e)
+            return
+        self.generation += 1
+        future.set_result(result)
+
+    def _commit_batch(
+        self, conn: sqlite3.Connection, batch: List[Tuple[Callable, Future, bool]]
+    ) -> None:
+        """Group commit: yksi transaktio, jokainen kirjoitus omassa savepointissa."""
+        done: List[Tuple[Future, object]] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, future, _ in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write_item")
+                try:
+                    result = fn(conn)
+                except BaseException as e:
+                    conn.execute("ROLLBACK TO write_item")
+                    conn.execute("RELEASE write_item")
+                    future.set_exception(e)
+                else:
+                    conn.execute("RELEASE write_item")
+                    done.append((future, result))
+            conn.execute("COMMIT")
+            self.generation += 1
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for future, _ in done:
+                future.set_exception(e)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in done:
+            future.set_result(result)
+
+    # -------------------------------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------------------------------
+
+    def close(self) -> None:
+        """Sulje kirjoittaja ja kaikki lukijayhteydet."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            writer = self._writer
+        if writer is not None and writer.is_alive():
+            self._queue.put(None)
+            writer.join()
+        with self._lock:
+            for conn in self._readers.values():
+                conn.close()
+            self._readers.clear()
+
+
+# =============================================================================
+# PER-PROCESS REGISTRY
+# =============================================================================
+
+_pools: Dict[str, SQLitePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: Union[str, Path]) -> SQLitePool:
+    """Hae tai luo prosessin yhteinen pool tietokantatiedostolle."""
+    key = os.path.realpath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = _pools[key] = SQLitePool(key)
+        return pool
+
+
+def close_pools() -> None:
+    """Sulje kaikki prosessin poolit (testit, sammutus)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
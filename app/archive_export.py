@@ -0,0 +1,362 @@
+"""
+Arkiston vienti Parquet-muotoon analytiikkaa varten.
+
+- Hive-osiointi: <out>/entries/month=2026-01/document_type=hakemus/part-*.parquet
+  (pyarrow.dataset / DuckDB / BigQuery lukevat osiot sarakkeina)
+- tags, prompt_packs ja tool_calls ovat sisäkkäisiä sarakkeita
+  (list<string>, list<struct<tool_name, status, latency_ms>>)
+- Muisti rajattu: kirjaukset luetaan batch_size-erissä, osioiden puskurit
+  kirjoitetaan row grouppeina kun niissä on yhteensä max_buffered_rows riviä,
+  auki on korkeintaan MAX_OPEN_WRITERS tiedostoa
+- Inkrementaalinen: <out>/_snapshot.json muistaa suurimman viedyn
+  entries.change_seq-arvon; incremental=True vie vain sen jälkeen muuttuneet
+  rivit uusiin part-tiedostoihin ja poistot <out>/deleted/-hakemistoon.
+  Sama id voi siis esiintyä useassa tiedostossa: lukija ottaa per id rivin,
+  jolla change_seq on suurin, ja pudottaa deleted-listan id:t.
+- Tiedostot kirjoitetaan piilotettuina (.part-*.tmp) ja nimetään lopullisiksi
+  vasta kun koko vienti onnistui. _snapshot.json on manifesti: sen "files"
+  listaa viennin voimassa olevat tiedostot ja se vaihdetaan atomisesti.
+  Vasta sen jälkeen poistetaan tiedostot, joihin manifesti ei enää viittaa
+  (täysi vienti korvaa edellisen); kaatuminen välissä jättää vanhan
+  manifestin ja sen tiedostot ehjiksi, ja seuraava vienti siivoaa orvot
+
+Käyttö:
+    from app.archive_export import export_parquet
+
+    stats = export_parquet(archive, "./exports/archive", incremental=True)
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: pip install "samha-infra[archive]"
+    pa = pq = None
+
+from app.archive import ArchiveEntry, ArchiveService
+from app.archive_backends import SQLiteOnlyError
+
+DEFAULT_BATCH_SIZE = 1000
+# Rows held in partition buffers before the largest one is written out
+MAX_BUFFERED_ROWS = 20_000
+MAX_OPEN_WRITERS = 32
+STATE_FILE = "_snapshot.json"
+
+
+def entry_schema(include_content: bool = True) -> "pa.Schema":
+    """Parquet-skeema; month ja document_type ovat hakemistopolussa, eivät tiedostossa."""
+    timestamp = pa.timestamp("us", tz="UTC")
+    fields = [
+        pa.field("id", pa.string(), nullable=False),
+        pa.field("trace_id", pa.string()),
+        pa.field("title", pa.string()),
+        pa.field("summary", pa.string()),
+        pa.field("program", pa.string()),
+        pa.field("project", pa.string()),
+        pa.field("tags", pa.list_(pa.string())),
+        pa.field("audience", pa.string()),
+        pa.field("language", pa.string()),
+        pa.field("channel", pa.string()),
+        pa.field("status", pa.string()),
+        pa.field("qa_decision", pa.string()),
+        pa.field("qa_report_id", pa.string()),
+        pa.field("agent_name", pa.string()),
+        pa.field("prompt_packs", pa.list_(pa.string())),
+        pa.field("tool_calls", pa.list_(pa.struct([
+            pa.field("tool_name", pa.string()),
+            pa.field("status", pa.string()),
+            pa.field("latency_ms", pa.int64()),
+        ]))),
+        pa.field("created_at", timestamp),
+        pa.field("updated_at", timestamp),
+        pa.field("version", pa.int32()),
+        pa.field("parent_id", pa.string()),
+        pa.field("root_id", pa.string()),
+        pa.field("is_latest", pa.bool_()),
+        pa.field("word_count", pa.int64()),
+        pa.field("change_seq", pa.int64()),
+    ]
+    if include_content:
+        fields.insert(4, pa.field("content", pa.string()))
+    return pa.schema(fields)
+
+
+TOMBSTONE_SCHEMA = None if pa is None else pa.schema([
+    pa.field("entry_id", pa.string(), nullable=False),
+    pa.field("change_seq", pa.int64()),
+    pa.field("deleted_at", pa.string()),
+])
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _partition(entry: ArchiveEntry) -> Tuple[str, str]:
+    return (
+        f"month={_utc(entry.created_at).strftime('%Y-%m')}",
+        f"document_type={entry.document_type}",
+    )
+
+
+def _record(entry: ArchiveEntry, row, include_content: bool) -> dict:
+    record = entry.model_dump(
+        exclude={"document_type", "tags_str"} | (set() if include_content else {"content"})
+    )
+    record["created_at"] = _utc(entry.created_at)
+    record["updated_at"] = _utc(entry.updated_at)
+    record["root_id"] = row["root_id"]
+    record["is_latest"] = bool(row["is_latest"])
+    record["change_seq"] = row["change_seq"]
+    return record
+
+
+class _PartitionWriters:
+    """Osiokohtaiset puskurit ja ParquetWriterit rajatulla muistilla."""
+
+    def __init__(
+        self, root: Path, schema: "pa.Schema", snapshot: int,
+        max_buffered_rows: int, max_open: int = MAX_OPEN_WRITERS,
+    ):
+        self.root = root
+        self.schema = schema
+        self.snapshot = snapshot
+        self.max_buffered_rows = max_buffered_rows
+        self.max_open = max_open
+        self._buffers: Dict[Tuple[str, ...], List[dict]] = {}
+        self._buffered = 0
+        # Least recently written first
+        self._writers: "OrderedDict[Tuple[str, ...], pq.ParquetWriter]" = OrderedDict()
+        self._parts: Dict[Tuple[str, ...], int] = {}
+        self.files: List[Path] = []
+
+    def add(self, partition: Tuple[str, ...], record: dict) -> None:
+        self._buffers.setdefault(partition, []).append(record)
+        self._buffered += 1
+        if self._buffered >= self.max_buffered_rows:
+            largest = max(self._buffers, key=lambda p: len(self._buffers[p]))
+            self._flush(largest)
+
+    def _writer(self, partition: Tuple[str, ...]) -> "pq.ParquetWriter":
+        writer = self._writers.get(partition)
+        if writer is not None:
+            self._writers.move_to_end(partition)
+            return writer
+        if len(self._writers) >= self.max_open:
+            _, oldest = self._writers.popitem(last=False)
+            oldest.close()
+        # A partition reopened after eviction continues in a new part file
+        part = self._parts.get(partition, 0)
+        self._parts[partition] = part + 1
+        directory = self.root.joinpath(*partition)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f".part-{self.snapshot:012d}-{part:04d}.parquet.tmp"
+        self.files.append(path)
+        writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        self._writers[partition] = writer
+        return writer
+
+    def _flush(self, partition: Tuple[str, ...]) -> None:
+        rows = self._buffers.pop(partition, None)
+        if not rows:
+            return
+        self._buffered -= len(rows)
+        self._writer(partition).write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self) -> List[Path]:
+        """Kirjoita puskurit, sulje tiedostot, palauta valmiit (yhä .tmp-nimiset) tiedostot."""
+        for partition in list(self._buffers):
+            self._flush(partition)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+        return self.files
+
+
+def _load_state(out_dir: Path) -> dict:
+    path = out_dir / STATE_FILE
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _save_state(out_dir: Path, state: dict) -> None:
+    # Write-then-rename so a crash never leaves a half-written state file
+    path = out_dir / STATE_FILE
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _remove_stale_parts(out_dir: Path) -> None:
+    """Kaatuneen viennin keskeneräiset tiedostot."""
+    for path in out_dir.rglob(".part-*.tmp"):
+        path.unlink()
+
+
+def _published_files(out_dir: Path) -> List[str]:
+    """Kaikki julkaistut tiedostot (manifestin polkumuoto: out_dirin suhteen)."""
+    paths = [*out_dir.glob("entries/**/part-*.parquet"), *out_dir.glob("deleted/part-*.parquet")]
+    return sorted(path.relative_to(out_dir).as_posix() for path in paths)
+
+
+def _remove_unreferenced(out_dir: Path, manifest: List[str]) -> None:
+    """Poista tiedostot, joihin manifesti ei viittaa, ja tyhjät osiohakemistot."""
+    keep = set(manifest)
+    for name in _published_files(out_dir):
+        if name not in keep:
+            (out_dir / name).unlink()
+    directories = [p for p in out_dir.glob("*/**") if p.is_dir() and p != out_dir]
+    for directory in sorted(directories, key=lambda p: len(p.parts), reverse=True):
+        if not any(directory.iterdir()):
+            directory.rmdir()
+
+
+def _publish(out_dir: Path, files: List[Path]) -> List[str]:
+    names = []
+    for path in files:
+        # .part-X.parquet.tmp -> part-X.parquet
+        final = path.with_name(path.name[1:-len(".tmp")])
+        path.rename(final)
+        names.append(final.relative_to(out_dir).as_posix())
+    return names
+
+
+def export_parquet(
+    archive: ArchiveService,
+    out_dir: Union[str, Path],
+    incremental: bool = False,
+    include_content: bool = True,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_buffered_rows: int = MAX_BUFFERED_ROWS,
+    progress: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """
+    Vie arkisto osioituun Parquet-hakemistoon.
+
+    Args:
+        incremental: Vain edellisen viennin jälkeen muuttuneet/poistetut
+            rivit. Ilman aiempaa vientiä tekee täyden viennin.
+            False = täysi vienti, vanhat entries/ ja deleted/ korvataan.
+        include_content: False = vain metadata (huomattavasti pienempi)
+        batch_size: Kirjauksia per tietokantakysely
+        progress: Kutsutaan jokaisen erän jälkeen tilastoilla
+
+    Returns:
+        {"mode", "exported", "deleted", "skipped", "files", "change_seq", "seconds"}
+    """
+    if not isinstance(archive, ArchiveService):
+        raise SQLiteOnlyError("Parquet export")
+    if pa is None:
+        raise RuntimeError('Parquet export needs pyarrow: pip install "samha-infra[archive]"')
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    _remove_stale_parts(out_dir)
+
+    state = _load_state(out_dir)
+    if "files" in state:
+        # Leftovers of an export that crashed after publishing its parts
+        _remove_unreferenced(out_dir, state["files"])
+    # Exports from before the manifest: every published file is current
+    manifest = state.get("files", _published_files(out_dir))
+    if incremental and state.get("include_content", include_content) != include_content:
+        raise ValueError("include_content differs from the existing export; run a full export")
+    since = state.get("change_seq", 0) if incremental else 0
+    mode = "incremental" if since else "full"
+
+    start = time.perf_counter()
+    with archive._pool.read() as conn:
+        # Upper bound taken up front: rows changed during the export go to the next one
+        until = conn.execute("SELECT value FROM change_counter WHERE id = 1").fetchone()[0]
+
+    stats = {
+        "mode": mode, "exported": 0, "deleted": 0, "skipped": 0,
+        "files": 0, "change_seq": until, "seconds": 0.0,
+    }
+    if until < since:
+        raise ValueError(
+            f"Archive change_seq {until} is behind the export ({since}): "
+            "the database was replaced, run a full export"
+        )
+    if until == since:
+        stats["seconds"] = time.perf_counter() - start
+        return stats
+
+    columns = f"{ArchiveService._LOAD_COLUMNS}, root_id, is_latest, change_seq, created_at, id"
+    if mode == "full":
+        # created_at order keeps only a few months' partitions open at a time
+        order, keyset = "created_at, id", "(created_at, id) > (?, ?)"
+        where, cursor = "change_seq <= ?", ["", ""]
+    else:
+        order, keyset = "change_seq", "change_seq > ?"
+        where, cursor = "change_seq <= ?", [since]
+
+    writers = _PartitionWriters(
+        out_dir / "entries", entry_schema(include_content), until, max_buffered_rows
+    )
+    try:
+        while True:
+            with archive._pool.read() as conn:
+                rows = conn.execute(f"""
+                    SELECT {columns} FROM entries
+                    WHERE {where} AND {keyset}
+                    ORDER BY {order} LIMIT ?
+                """, [until, *cursor, batch_size]).fetchall()
+            if not rows:
+                break
+            last = rows[-1]
+            cursor = [last["created_at"], last["id"]] if mode == "full" else [last["change_seq"]]
+
+            for row, entry in zip(rows, archive._load_entry_rows(rows)):
+                if entry is None:
+                    stats["skipped"] += 1
+                    continue
+                writers.add(_partition(entry), _record(entry, row, include_content))
+                stats["exported"] += 1
+            if progress:
+                progress({**stats, "seconds": time.perf_counter() - start})
+        files = writers.close()
+    except BaseException:
+        writers.close()
+        _remove_stale_parts(out_dir)
+        raise
+
+    if mode == "incremental":
+        with archive._pool.read() as conn:
+            tombstones = conn.execute("""
+                SELECT entry_id, change_seq, deleted_at FROM entry_tombstones
+                WHERE change_seq > ? AND change_seq <= ? ORDER BY change_seq
+            """, (since, until)).fetchall()
+        if tombstones:
+            deleted_dir = out_dir / "deleted"
+            deleted_dir.mkdir(exist_ok=True)
+            path = deleted_dir / f".part-{until:012d}.parquet.tmp"
+            pq.write_table(
+                pa.Table.from_pylist([dict(row) for row in tombstones], schema=TOMBSTONE_SCHEMA),
+                path,
+            )
+            files.append(path)
+            stats["deleted"] = len(tombstones)
+
+    published = _publish(out_dir, files)
+    # A full export replaces the previous files; an incremental one adds to them
+    manifest = sorted(set(manifest) | set(published) if mode == "incremental" else published)
+    stats["files"] = len(files)
+    stats["seconds"] = time.perf_counter() - start
+    _save_state(out_dir, {
+        "change_seq": until,
+        "include_content": include_content,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "last_run": {k: v for k, v in stats.items() if k != "change_seq"},
+        "files": manifest,
+    })
+    # Only now that the new manifest is in place
+    _remove_unreferenced(out_dir, manifest)
+    return stats
@@ -0,0 +1,133 @@
+"""
+Arkiston full-text-haku (SQLite FTS5).
+
+- Tokenizer: unicode61 + remove_diacritics 2 → ä/ö/å taittuvat (äiti = aiti)
+- Prefix-indeksit 2-6 merkille → "hakemu*" ilman termilistan läpikäyntiä
+- Yhdyssanat: tunnetuista perusosista alkavat loppuosat indeksoidaan erikseen
+  (avustushakemuksen → hakemuksen), jolloin "hakemu*" löytää myös yhdyssanat
+- Käyttäjän hakulause muunnetaan turvalliseksi FTS5-kyselyksi
+  (build_fts_query) tai PostgreSQL-tsqueryksi (build_tsquery)
+"""
+
+import re
+from functools import lru_cache
+from typing import Callable, List, Tuple
+
+from app.text_utils import fold
+
+FTS_TOKENIZE = "unicode61 remove_diacritics 2"
+FTS_PREFIX = "2 3 4 5 6"
+
+# entries_fts columns, in order (indexes used by bm25() / snippet())
+FTS_COLUMNS = ("title", "summary", "tags", "content", "compounds")
+
+# bm25 column weights: title and tags matter more than body text
+FTS_RANK = "bm25(10.0, 5.0, 4.0, 1.0, 2.0)"
+
+# Stems of common compound heads in our documents (lowercase, diacritics
+# folded). A match inside a word starts an extra indexed token there.
+COMPOUND_HEADS = (
+    "hakemu", "avustu", "rahoitu", "hanke", "hankk", "raport", "kertomu",
+    "suunnitelm", "koulutu", "ohjelm", "toimin", "palvelu", "tervey",
+    "hyvinvoin", "arvioin", "strategi", "tyo", "tuki", "tuen", "nuor",
+    "kumppan", "osallisuu", "yhdenvertaisuu", "rasism", "vapaaehtoi",
+    "ryhm", "tapahtum", "verkosto", "budjet", "talou",
+)
+
+MIN_COMPOUND_LENGTH = 8
+MIN_PART_LENGTH = 3
+
+# Zero-width lookahead: finds every (also overlapping) head position
+_HEADS_RE = re.compile("(?=(?:" + "|".join(COMPOUND_HEADS) + "))")
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_QUERY_TOKEN_RE = re.compile(r'"[^"]*"|\S+')
+_OPERATORS = {"AND", "OR", "NOT"}
+
+
+@lru_cache(maxsize=65536)
+def _word_parts(word: str) -> Tuple[str, ...]:
+    # Documents repeat the same words a lot: cache the parts per word
+    return tuple(
+        word[start:]
+        for start in dict.fromkeys(m.start() for m in _HEADS_RE.finditer(word, MIN_PART_LENGTH))
+        if len(word) - start >= MIN_PART_LENGTH
+    )
+
+
+def split_compounds(text: str) -> str:
+    """
+    Palauta yhdyssanojen loppuosat välilyönnein eroteltuna.
+
+    "avustushakemuksen hankesuunnitelma" → "hakemuksen suunnitelma"
+    """
+    parts: List[str] = []
+    for word in _WORD_RE.findall(fold(text)):
+        if len(word) >= MIN_COMPOUND_LENGTH:
+            parts.extend(_word_parts(word))
+    return " ".join(dict.fromkeys(parts))
+
+
+def build_fts_query(text: str) -> str:
+    """
+    Muunna vapaa hakulause FTS5-kyselyksi.
+
+    - "lainausmerkit" → fraasihaku
+    - sana* → prefix-haku
+    - AND / OR / NOT säilyvät operaattoreina
+    - muut sanat lainataan, jolloin välimerkit (STEA-hakemus) eivät riko kyselyä
+    """
+    terms: List[str] = []
+    for token in _QUERY_TOKEN_RE.findall(text):
+        if token in _OPERATORS:
+            if terms and terms[-1] not in _OPERATORS:
+                terms.append(token)
+            continue
+        prefix = token.endswith("*")
+        phrase = token.strip('"*').replace('"', "")
+        if not phrase.strip():
+            continue
+        terms.append(f'"{phrase}"' + ("*" if prefix else ""))
+    while terms and terms[-1] in _OPERATORS:
+        terms.pop()
+    return " ".join(terms)
+
+
+def build_tsquery(text: str, config: str, param: Callable[[str], str]) -> str:
+    """
+    Sama hakulause PostgreSQL-tsquery-lausekkeeksi (PostgresBackend).
+
+    Arvot kulkevat parametreina: param(arvo) palauttaa placeholderin ($n).
+    Fraasi → phraseto_tsquery, sana* → prefix (:*), muut → plainto_tsquery.
+    Sidonta kuten FTS5:ssä: NOT ennen AND:ia, AND ennen OR:ia.
+
+    Returns:
+        SQL-lauseke tai "" jos hakulauseessa ei ole hakusanoja
+    """
+    groups: List[List[str]] = [[]]
+    negate = False
+    for token in _QUERY_TOKEN_RE.findall(text):
+        if token == "OR":
+            if groups[-1]:
+                groups.append([])
+            continue
+        if token in _OPERATORS:
+            negate = token == "NOT" and bool(groups[-1])
+            continue
+        prefix = token.endswith("*")
+        phrase = token.strip('"*').replace('"', "")
+        if prefix:
+            # to_tsquery() parses its input: only word characters go through
+            phrase = " ".join(_WORD_RE.findall(phrase))
+        if not phrase.strip():
+            continue
+        if prefix and " " not in phrase:
+            term = f"to_tsquery('{config}', {param(phrase + ':*')})"
+        elif token.startswith('"') or prefix:
+            term = f"phraseto_tsquery('{config}', {param(phrase)})"
+        else:
+            term = f"plainto_tsquery('{config}', {param(phrase)})"
+        groups[-1].append(f"!!{term}" if negate else term)
+        negate = False
+    groups = [group for group in groups if group]
+    return " || ".join(f"({' && '.join(group)})" for group in groups)
@@ -0,0 +1,175 @@
+"""
+Arkiston massatuonti JSONL-tiedostosta.
+
+- Yksi ArchiveEntry-JSON per rivi (esim. model_dump_json() tai vienti)
+- Tallennus save_many()-erinä: yksi transaktio per erä, seuraava erä
+  jäsennetään sillä aikaa kun edellinen kirjoitetaan
+- Jatkettavissa: tilatiedostoon kirjataan tavu-offset jokaisen commitoidun
+  erän jälkeen; uusi ajo jatkaa siitä (myös tiedoston loppuun lisätyt rivit)
+- Idempotentti jatko: rivi ilman id:tä saa id:n rivin sisällöstä ja offsetista,
+  ja jatkon ensimmäisestä erästä ohitetaan jo arkistossa olevat id:t (erä,
+  joka ehdittiin commitoida ennen kuin tila tallentui, ei tuplaannu)
+- Viallinen rivi ei pysäytä tuontia, se kirjataan errors-listaan
+- Keskeneräinen viimeinen rivi (ei rivinvaihtoa, ei validi) jää seuraavaan ajoon
+
+Käyttö:
+    from app.archive_import import import_jsonl
+
+    stats = import_jsonl(archive, "drafts.jsonl")
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+
+from app.archive import ArchiveEntry, ArchiveService
+
+DEFAULT_BATCH_SIZE = 500
+
+# Error messages kept in the stats (the count keeps growing past this)
+MAX_REPORTED_ERRORS = 20
+
+
+def default_state_path(path: Union[str, Path]) -> Path:
+    """Tilatiedosto tuotavan tiedoston viereen: drafts.jsonl.import-state."""
+    path = Path(path)
+    return path.with_name(f"{path.name}.import-state")
+
+
+def _load_state(state_path: Path, source: Path, resume: bool) -> dict:
+    state = {"source": str(source), "offset": 0, "line": 0, "imported": 0, "errors": 0}
+    if not resume or not state_path.exists():
+        return state
+    saved = json.loads(state_path.read_text(encoding="utf-8"))
+    if saved.get("offset", 0) > source.stat().st_size:
+        # The file was replaced by a shorter one: start over
+        print(f"Import state {state_path} is past the end of {source}, restarting")
+        return state
+    state.update(saved)
+    return state
+
+
+def _line_id(offset: int, raw: bytes) -> str:
+    """Pysyvä id rivin tavuista ja offsetista: sama rivi saa saman id:n joka ajossa."""
+    digest = hashlib.sha256(f"{offset}:".encode() + raw.rstrip(b"\r\n")).hexdigest()
+    return f"art_import_{digest[:16]}"
+
+
+def _save_state(state_path: Path, state: dict) -> None:
+    # Write-then-rename so a crash never leaves a half-written state file
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    tmp_path.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp_path, state_path)
+
+
+def import_jsonl(
+    archive: ArchiveService,
+    path: Union[str, Path],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    state_path: Optional[Union[str, Path]] = None,
+    resume: bool = True,
+    progress: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """
+    Tuo JSONL-tiedoston kirjaukset arkistoon.
+
+    Args:
+        batch_size: Kirjauksia per save_many-transaktio
+        state_path: Tilatiedosto (oletus: <path>.import-state)
+        resume: False = aloita alusta vanhasta tilasta välittämättä
+        progress: Kutsutaan jokaisen erän jälkeen tilastoilla
+
+    Returns:
+        {"imported", "errors", "lines", "bytes_read", "total_bytes",
+         "seconds", "error_messages"}. imported/errors kattavat myös
+        aiemmat (jatketut) ajot.
+    """
+    source = Path(path)
+    state_path = Path(state_path) if state_path else default_state_path(source)
+    state = _load_state(state_path, source, resume)
+
+    stats = {
+        "imported": state["imported"],
+        "errors": state["errors"],
+        "lines": state["line"],
+        "bytes_read": state["offset"],
+        "total_bytes": source.stat().st_size,
+        "seconds": 0.0,
+        "error_messages": [],
+    }
+    start = time.perf_counter()
+    batch: List[ArchiveEntry] = []
+    # (save_many future, offset, line, entries, errors) of the batch in flight
+    pending: Optional[Tuple[Future, int, int, int, int]] = None
+
+    def checkpoint() -> None:
+        future, offset, line, count, errors = pending
+        future.result()
+        stats["imported"] += count
+        stats["bytes_read"] = offset
+        stats["lines"] = line
+        stats["seconds"] = time.perf_counter() - start
+        state.update(offset=offset, line=line, imported=stats["imported"], errors=errors)
+        _save_state(state_path, state)
+        if progress:
+            progress(stats)
+
+    # Batch N is written in the background while batch N+1 is parsed; the
+    # state only advances once a batch is committed.
+    with ThreadPoolExecutor(max_workers=1) as writer:
+
+        # A crash between save_many's commit and the state write leaves the
+        # first batch after the checkpoint already stored: skip what exists
+        verify_next = state["offset"] > 0
+
+        def submit(offset: int, line: int) -> None:
+            nonlocal pending, verify_next
+            if pending:
+                checkpoint()
+            entries = list(batch)
+            if verify_next:
+                entries = [entry for entry in entries if archive.get(entry.id) is None]
+                verify_next = False
+            pending = (
+                writer.submit(archive.save_many, entries),
+                offset, line, len(batch), stats["errors"],
+            )
+            batch.clear()
+
+        # Binary mode: byte offsets to resume from
+        with open(source, "rb") as f:
+            f.seek(state["offset"])
+            line_no = state["line"]
+            offset = state["offset"]
+            for raw in iter(f.readline, b""):
+                if raw.strip():
+                    try:
+                        entry = ArchiveEntry.model_validate_json(raw)
+                    except ValidationError as e:
+                        if not raw.endswith(b"\n"):
+                            # Unterminated last line may still be being
+                            # written: leave it for the next run
+                            break
+                        stats["errors"] += 1
+                        if len(stats["error_messages"]) < MAX_REPORTED_ERRORS:
+                            stats["error_messages"].append(
+                                f"line {line_no + 1}: {e.errors()[0]['msg']}"
+                            )
+                    else:
+                        if "id" not in entry.model_fields_set:
+                            entry.id = _line_id(offset, raw)
+                        batch.append(entry)
+                line_no += 1
+                offset += len(raw)
+                if len(batch) >= batch_size:
+                    submit(offset, line_no)
+            submit(offset, line_no)
+            checkpoint()
+
+    return stats
@@ -0,0 +1,267 @@
+"""
+Arkiston säilytyssäännöt, tiering ja tiivistys (compaction).
+
+Säännöt (RetentionPolicy):
+- RetentionRule: document_type/status/ikä → "cold" (siirto kylmään tieriin),
+  "archive" (status=archived + cold) tai "delete"
+- keep_versions: lineagen vanhat versiot N uusimman jälkeen poistetaan
+  (uusin versio säilyy aina; järjestys version, created_at, id)
+- DEFAULT_POLICY ei poista mitään: poistot vain erikseen annetulla säännöllä
+- FileRule: arkistohakemiston irtotiedostot (charts/, generated_images/)
+  vanhemmat kuin N päivää → cold_dir tai poisto
+
+Tiivistys ajon lopuksi: gc_blobs (orvot sisällöt), FTS optimize,
+incremental VACUUM ja WAL-checkpoint. Raportti kertoo vapautetut tavut.
+
+Turvallinen käynnissä olevalle palvelulle: kaikki kirjoitukset kulkevat
+SQLitePoolin kirjoittajan kautta lyhyinä transaktioina (tallennukset
+lomittuvat), tiedostot poistetaan vasta commitin jälkeen ja cold-siirto
+ohittaa kirjaukset, jotka tallennettiin uudelleen siirron aikana.
+
+Käyttö:
+    from app.archive_retention import load_policy, run_retention
+
+    report = run_retention(archive, load_policy(), dry_run=True)
+"""
+
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field
+
+from app.archive import ArchiveService, ArchiveStatus, DocumentType
+from app.archive_backends import SQLiteOnlyError
+
+RetentionAction = Literal[
+    "cold",         # Sisältö kylmään tieriin, kirjaus muuten ennallaan
+    "archive",      # status=archived + cold
+    "delete"        # Pysyvä poisto
+]
+
+
+class RetentionRule(BaseModel):
+    """Yksi säilytyssääntö: suodattimet + ikä → toimenpide."""
+
+    name: str
+    document_type: Optional[DocumentType] = None
+    status: Optional[ArchiveStatus] = None
+    older_than_days: int = Field(..., ge=0, description="created_at vanhempi kuin N päivää")
+    action: RetentionAction = "cold"
+    superseded_only: bool = Field(False, description="Vain vanhat versiot (ei lineagen uusinta)")
+
+
+class FileRule(BaseModel):
+    """Arkistohakemiston alihakemiston irtotiedostot (esim. kaaviot)."""
+
+    directory: str = Field(..., description="Suhteessa arkistohakemistoon, esim. charts")
+    older_than_days: int = Field(..., ge=0, description="mtime vanhempi kuin N päivää")
+    action: Literal["cold", "delete"] = "cold"
+
+
+class RetentionPolicy(BaseModel):
+    rules: List[RetentionRule] = Field(default_factory=list)
+    keep_versions: Optional[int] = Field(
+        None, ge=1, description="Säilytä N uusinta versiota per lineage, None = kaikki"
+    )
+    files: List[FileRule] = Field(default_factory=list)
+
+
+# Non-destructive: tiers and archives only. Deleting (keep_versions,
+# action="delete", FileRule action="delete") needs an explicit policy file.
+DEFAULT_POLICY = RetentionPolicy(
+    rules=[
+        RetentionRule(name="stale-drafts", status="draft", older_than_days=90, action="archive"),
+        RetentionRule(name="old-versions", older_than_days=30, superseded_only=True),
+    ],
+    files=[
+        FileRule(directory="charts", older_than_days=90),
+        FileRule(directory="generated_images", older_than_days=180),
+    ],
+)
+
+
+def load_policy(path: Optional[Union[str, Path]] = None) -> RetentionPolicy:
+    """JSON-tiedostosta (oletus ARCHIVE_RETENTION_POLICY), muuten DEFAULT_POLICY."""
+    path = path or os.environ.get("ARCHIVE_RETENTION_POLICY")
+    if not path:
+        return DEFAULT_POLICY
+    return RetentionPolicy.model_validate_json(Path(path).read_text(encoding="utf-8"))
+
+
+# =============================================================================
+# PLANNING (read-only)
+# =============================================================================
+
+def _rule_ids(archive: ArchiveService, rule: RetentionRule, now: datetime) -> List[str]:
+    conditions = ["created_at < ?"]
+    params: list = [(now - timedelta(days=rule.older_than_days)).isoformat()]
+    if rule.document_type:
+        conditions.append("document_type = ?")
+        params.append(rule.document_type)
+    if rule.status:
+        conditions.append("status = ?")
+        params.append(rule.status)
+    if rule.superseded_only:
+        conditions.append("is_latest = 0")
+    if rule.action in ("cold", "archive"):
+        # Already tiered rows are done (archive still flips the status below)
+        conditions.append("tier IS NULL" if rule.action == "cold" else
+                          "(tier IS NULL OR status != 'archived')")
+    with archive._pool.read() as conn:
+        return [row[0] for row in conn.execute(
+            f"SELECT id FROM entries WHERE {' AND '.join(conditions)} ORDER BY created_at",
+            params
+        )]
+
+
+def _superseded_ids(archive: ArchiveService, keep_versions: int) -> List[str]:
+    """Versiot N uusimman jälkeen; lineagen pää ei koskaan."""
+    with archive._pool.read() as conn:
+        return [row[0] for row in conn.execute("""
+            SELECT id FROM (
+                SELECT id, is_latest, ROW_NUMBER() OVER (
+                    PARTITION BY COALESCE(root_id, id)
+                    ORDER BY version DESC, created_at DESC, id DESC
+                ) AS position
+                FROM entries
+            )
+            WHERE position > ? AND is_latest = 0
+        """, (keep_versions,))]
+
+
+def plan_retention(
+    archive: ArchiveService, policy: RetentionPolicy, now: Optional[datetime] = None
+) -> Dict[str, List[str]]:
+    """
+    Mitä ajo tekisi: {"delete": [...], "archive": [...], "cold": [...]}.
+
+    Jokainen kirjaus on vain yhdessä listassa: poisto voittaa arkistoinnin,
+    arkistointi pelkän cold-siirron.
+    """
+    if not isinstance(archive, ArchiveService):
+        raise SQLiteOnlyError("Retention")
+    now = now or datetime.now(timezone.utc)
+    plan: Dict[str, List[str]] = {"delete": [], "archive": [], "cold": []}
+    claimed = set()
+
+    def claim(action: str, ids: List[str]) -> None:
+        for entry_id in ids:
+            if entry_id not in claimed:
+                claimed.add(entry_id)
+                plan[action].append(entry_id)
+
+    if policy.keep_versions:
+        claim("delete", _superseded_ids(archive, policy.keep_versions))
+    for action in ("delete", "archive", "cold"):
+        for rule in policy.rules:
+            if rule.action == action:
+                claim(action, _rule_ids(archive, rule, now))
+    return plan
+
+
+def _expired_files(archive: ArchiveService, rule: FileRule, now: datetime) -> List[Path]:
+    directory = archive.db_path.parent / rule.directory
+    if not directory.is_dir():
+        return []
+    cutoff = (now - timedelta(days=rule.older_than_days)).timestamp()
+    return [
+        path for path in sorted(directory.rglob("*"))
+        if path.is_file() and path.stat().st_mtime < cutoff
+    ]
+
+
+# =============================================================================
+# RUN
+# =============================================================================
+
+def run_retention(
+    archive: ArchiveService,
+    policy: Optional[RetentionPolicy] = None,
+    dry_run: bool = False,
+    compact: bool = True,
+    full_vacuum: bool = False,
+    blob_grace_seconds: float = 3600.0,
+    now: Optional[datetime] = None,
+) -> dict:
+    """
+    Aja säilytyssäännöt ja tiivistys.
+
+    Args:
+        dry_run: Vain suunnitelma (määrät), ei muutoksia
+        compact: gc_blobs + FTS optimize + vacuum sääntöjen jälkeen
+        full_vacuum: Vanha tietokanta ilman auto_vacuumia: täysi VACUUM
+            kerran (ks. ArchiveService.vacuum)
+
+    Returns:
+        Määrät toimenpiteittäin ja "bytes": mistä tavut vapautuivat,
+        "reclaimed_bytes" yhteensä hot-tieristä
+    """
+    policy = policy or DEFAULT_POLICY
+    now = now or datetime.now(timezone.utc)
+    start = time.perf_counter()
+    plan = plan_retention(archive, policy, now)
+    files = {rule.directory: (rule, _expired_files(archive, rule, now)) for rule in policy.files}
+
+    report: dict = {
+        "dry_run": dry_run,
+        "deleted": len(plan["delete"]),
+        "archived": len(plan["archive"]),
+        "cold": len(plan["cold"]),
+        "files": {name: len(paths) for name, (_, paths) in files.items()},
+        "bytes": {},
+        "reclaimed_bytes": 0,
+    }
+    if dry_run:
+        report["seconds"] = time.perf_counter() - start
+        return report
+
+    db_before = archive.database_bytes()
+    deleted = archive.delete_many(plan["delete"])
+    for entry_id in plan["archive"]:
+        archive.patch_metadata(entry_id, status="archived")
+    tiered = archive.move_to_cold(plan["archive"] + plan["cold"])
+    report.update({
+        "deleted": deleted["deleted"],
+        "cold": tiered["moved"],
+        "cold_skipped": tiered["skipped"],
+    })
+    # Artifact files; inline BLOBs show up in the database shrink below
+    report["bytes"]["entries_deleted"] = deleted["bytes"]
+    report["bytes"]["moved_to_cold"] = tiered["bytes"]
+
+    file_bytes = 0
+    for rule, paths in files.values():
+        for path in paths:
+            size = path.stat().st_size
+            if rule.action == "delete":
+                path.unlink(missing_ok=True)
+            else:
+                target = archive.cold_dir / path.relative_to(archive.db_path.parent)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(path), target)
+            file_bytes += size
+    report["bytes"]["files"] = file_bytes
+
+    if compact:
+        blobs = archive.gc_blobs(grace_seconds=blob_grace_seconds)
+        report["blobs_deleted"] = blobs["deleted"]
+        report["bytes"]["blobs"] = blobs["bytes"]
+        archive.optimize_fts()
+        vacuum = archive.vacuum(full=full_vacuum)
+        report["vacuum"] = vacuum["mode"]
+        report["bytes"]["database"] = max(0, db_before - vacuum["bytes_after"])
+    else:
+        report["bytes"]["database"] = 0
+
+    # Shared bodies are inside the database (or the bucket): not added twice
+    report["reclaimed_bytes"] = sum(
+        v for k, v in report["bytes"].items() if k != "blobs"
+    )
+    report["seconds"] = time.perf_counter() - start
+    print(f"Archive retention: {json.dumps({k: v for k, v in report.items() if k != 'bytes'})}")
+    return report
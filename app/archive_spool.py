@@ -0,0 +1,215 @@
+"""
+Arkiston write-behind-lähetysjono (spool).
+
+save() kirjoittaa artifactin paikalliseen spool-hakemistoon ja palaa heti;
+taustasäikeet lähettävät tiedostot (esim. GCS:ään) uudelleenyrityksin:
+
+- Spool-tiedosto on itse jono: se poistetaan vasta onnistuneen lähetyksen
+  ja on_uploaded-kutsun jälkeen → kaatuminen ei hukkaa mitään, start()
+  jonottaa jäljelle jääneet tiedostot uudelleen
+- Epäonnistunut lähetys: eksponentiaalinen backoff (+ jitter), ei ylärajaa
+  yrityksille
+- Sama nimi kirjoitettu uudelleen lähetyksen aikana → lähetetään uudestaan
+- read(name) palvelee sisällön spoolista kunnes lähetys on valmis
+"""
+
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+DEFAULT_WORKERS = 2
+BASE_DELAY = 0.5
+MAX_DELAY = 60.0
+
+
+class UploadSpool:
+    """Kestävä lähetysjono hakemistossa, lähetys taustasäikeissä."""
+
+    def __init__(
+        self,
+        spool_dir: Union[str, Path],
+        upload: Callable[[str, bytes], object],
+        on_uploaded: Optional[Callable[[str, bytes, object], None]] = None,
+        workers: int = DEFAULT_WORKERS,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+    ):
+        """
+        Args:
+            upload: upload(name, data) → tulos; poikkeus = yritä myöhemmin
+            on_uploaded: on_uploaded(name, data, tulos) ennen spool-tiedoston
+                poistoa (esim. metadatan päivitys); poikkeus = yritä uudelleen
+        """
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.upload = upload
+        self.on_uploaded = on_uploaded
+        self.workers = workers
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        # Serializes spool file swaps with the upload commit (on_uploaded + unlink)
+        self._file_lock = threading.Lock()
+        # (not_before, seq, name, attempt)
+        self._heap: List[Tuple[float, int, str, int]] = []
+        self._seq = itertools.count()
+        self._queued: Set[str] = set()
+        self._in_flight: Set[str] = set()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+        self._stats: Dict[str, object] = {
+            "uploaded": 0, "retries": 0, "last_error": None,
+        }
+
+    # -------------------------------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------------------------------
+
+    def start(self) -> int:
+        """Käynnistä lähettäjät ja jonota edellisen ajon lähettämättömät. Palauttaa niiden määrän."""
+        recovered = 0
+        for path in sorted(self.spool_dir.iterdir(), key=lambda p: p.stat().st_mtime):
+            if path.name.endswith(".tmp"):
+                path.unlink(missing_ok=True)  # torn write from a crash
+            elif path.is_file():
+                self.enqueue(path.name)
+                recovered += 1
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"archive-upload-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        return recovered
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Odota kunnes jono on tyhjä. False = timeout ennen sitä."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queued or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self) -> None:
+        """Pysäytä lähettäjät; lähettämättömät jäävät spooliin seuraavaan käynnistykseen."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    # -------------------------------------------------------------------------
+    # Spool files
+    # -------------------------------------------------------------------------
+
+    def write(self, name: str, data: bytes) -> None:
+        """Kirjoita tiedosto spooliin (jonota erikseen enqueue():lla)."""
+        path = self.spool_dir / name
+        # Write-then-rename: a crash never leaves a half-written upload
+        tmp_path = path.with_name(f"{name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        with self._file_lock:
+            os.replace(tmp_path, path)
+
+    def read(self, name: str) -> Optional[bytes]:
+        """Spoolissa odottava sisältö tai None."""
+        try:
+            return (self.spool_dir / name).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def enqueue(self, name: str, delay: float = 0.0, attempt: int = 0) -> None:
+        """Jonota spool-tiedoston lähetys (jo jonossa oleva nimi ohitetaan)."""
+        with self._cond:
+            self._push(name, delay, attempt)
+
+    def _push(self, name: str, delay: float, attempt: int) -> None:
+        # Call with self._cond held
+        if name in self._queued:
+            return
+        self._queued.add(name)
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), name, attempt))
+        self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                **self._stats,
+                "pending": len(self._queued) + len(self._in_flight),
+            }
+
+    # -------------------------------------------------------------------------
+    # Workers
+    # -------------------------------------------------------------------------
+
+    def _next(self) -> Optional[Tuple[str, int]]:
+        with self._cond:
+            while not self._closed:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                not_before, _, name, attempt = self._heap[0]
+                delay = not_before - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                if name in self._in_flight:
+                    # Another worker is uploading an older copy; retry after it
+                    heapq.heappush(
+                        self._heap, (time.monotonic() + self.base_delay, next(self._seq), name, attempt)
+                    )
+                    continue
+                self._queued.discard(name)
+                self._in_flight.add(name)
+                return name, attempt
+            return None
+
+    def _worker(self) -> None:
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            name, attempt = item
+            try:
+                self._upload_one(name)
+            except Exception as e:
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                delay += random.uniform(0, self.base_delay)
+                with self._cond:
+                    self._stats["retries"] += 1
+                    self._stats["last_error"] = f"{name}: {e}"
+                    self._in_flight.discard(name)
+                    self._push(name, delay, attempt + 1)
+                print(f"Archive upload failed ({name}), retrying in {delay:.1f}s: {e}")
+            else:
+                with self._cond:
+                    self._in_flight.discard(name)
+                    self._cond.notify_all()
+
+    def _upload_one(self, name: str) -> None:
+        data = self.read(name)
+        if data is None:
+            return
+        result = self.upload(name, data)
+        with self._file_lock:
+            if self.read(name) == data:
+                if self.on_uploaded:
+                    self.on_uploaded(name, data, result)
+                (self.spool_dir / name).unlink()
+                with self._cond:
+                    self._stats["uploaded"] += 1
+                return
+        # Rewritten while uploading: the newer copy goes out on the next round
+        with self._cond:
+            self._push(name, 0.0, 0)
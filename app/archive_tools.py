@@ -1,6 +1,11 @@
-from app.archive import get_archive_service, ArchiveEntry, ArchiveSearchQuery
+from typing import Optional
 
-def save_to_archive(
+from app.archive import get_archive_service, ArchiveEntry, ArchiveSearchQuery, ArchiveSearchResult
+
+# Argument parsing and output formatting are shared with the async tools
+# in app.archive_tools_async.
+
+def build_entry(
     title: str,
     summary: str,
     content: str,
@@ -10,10 +15,8 @@ def save_to_archive(
     tags: str = "",
     agent_name: str = "kirjoittaja",
     prompt_packs: str = "org_pack_v1",
-) -> str:
-    """Tallenna teksti arkistoon."""
-    archive = get_archive_service()
-    entry = ArchiveEntry(
+) -> ArchiveEntry:
+    return ArchiveEntry(
         title=title,
         summary=summary[:500],
         content=content,
@@ -25,10 +28,8 @@ def save_to_archive(
         prompt_packs=[p.strip() for p in prompt_packs.split(",") if p.strip()],
         status="draft",
     )
-    entry_id = archive.save(entry)
-    return f"Arkistoitu onnistuneesti. ID: {entry_id}"
 
-def search_archive(
+def build_search_query(
     query: str = "",
     document_type: str = "",
     program: str = "",
@@ -36,8 +37,10 @@ def search_archive(
     tags: str = "",
     latest_only: bool = True,
     limit: int = 5,
-) -> str:
-    """Hae arkistosta."""
+    mode: str = "",
+    semantic: bool = False,
+) -> ArchiveSearchQuery:
+    """semantic = arkistolla on embedder: oletushaku on silloin hybrid."""
     allowed_types = {"hakemus", "raportti", "artikkeli", "koulutus", "some", "memo", "muu"}
     if document_type:
         doc_norm = document_type.strip().lower()
@@ -45,8 +48,11 @@ def search_archive(
             # Fallback to broad search if type is not supported
             doc_norm = ""
         document_type = doc_norm
-    archive = get_archive_service()
-    search_query = ArchiveSearchQuery(
+    mode = mode.strip().lower()
+    if not semantic or mode not in ("keyword", "vector", "hybrid"):
+        # Vector modes need an embedder; unknown modes fall back like document_type
+        mode = "hybrid" if semantic else "keyword"
+    return ArchiveSearchQuery(
         query=query if query else None,
         document_type=document_type if document_type else None,
         program=program if program else None,
@@ -54,18 +60,64 @@ def search_archive(
         tags=[t.strip() for t in tags.split(",") if t.strip()] if tags else None,
         latest_only=latest_only,
         limit=limit,
+        mode=mode,
     )
-    result = archive.search(search_query)
+
+# Listing only needs title/id/summary: skip loading document bodies
+SEARCH_FIELDS = ["title", "summary"]
+
+def format_search_result(result: ArchiveSearchResult) -> str:
     if not result.entries: return "Ei tuloksia."
     output = f"Löytyi {result.total_count} tulosta:\n\n"
     for entry in result.entries:
         output += f"**{entry.title}** (ID: {entry.id})\n"
-        output += f"- Tiivistelmä: {entry.summary[:100]}...\n\n"
+        output += f"- Tiivistelmä: {entry.summary[:100]}...\n"
+        if entry.id in result.snippets:
+            output += f"- Osuma: {result.snippets[entry.id]}\n"
+        output += "\n"
     return output
 
-def get_archived_content(entry_id: str) -> str:
-    """Hae arkistoitu teksti ID:llä."""
-    archive = get_archive_service()
-    entry = archive.get(entry_id)
+def format_content(entry_id: str, entry: Optional[ArchiveEntry]) -> str:
     if not entry: return f"Arkistokirjausta {entry_id} ei löytynyt."
     return f"# {entry.title}\n\n{entry.content}"
+
+def save_to_archive(
+    title: str,
+    summary: str,
+    content: str,
+    document_type: str,
+    program: str = "muu",
+    project: str = "muu",
+    tags: str = "",
+    agent_name: str = "kirjoittaja",
+    prompt_packs: str = "org_pack_v1",
+) -> str:
+    """Tallenna teksti arkistoon."""
+    entry = build_entry(
+        title, summary, content, document_type, program, project, tags, agent_name, prompt_packs
+    )
+    entry_id = get_archive_service().save(entry)
+    return f"Arkistoitu onnistuneesti. ID: {entry_id}"
+
+def search_archive(
+    query: str = "",
+    document_type: str = "",
+    program: str = "",
+    project: str = "",
+    tags: str = "",
+    latest_only: bool = True,
+    limit: int = 5,
+    mode: str = "",
+) -> str:
+    """Hae arkistosta. mode: keyword | vector | hybrid (oletus hybrid kun upotukset ovat käytössä)."""
+    archive = get_archive_service()
+    search_query = build_search_query(
+        query, document_type, program, project, tags, latest_only, limit,
+        mode=mode, semantic=archive.embedder is not None,
+    )
+    result = archive.search(search_query, fields=SEARCH_FIELDS)
+    return format_search_result(result)
+
+def get_archived_content(entry_id: str) -> str:
+    """Hae arkistoitu teksti ID:llä."""
+    return format_content(entry_id, get_archive_service().get(entry_id))
@@ -0,0 +1,59 @@
+"""
+Arkistotyökalujen async-versiot ADK-agenteille.
+
+Samat nimet ja parametrit kuin app.archive_tools (työkalun nimi = funktion
+nimi), mutta SQLite- ja GCS-I/O ajetaan AsyncArchiveServicen säiepooleissa
+eikä tapahtumasilmukassa (tai PostgresBackendin asyncpg-poolissa).
+Synkroniset versiot jäävät skripteille.
+"""
+
+from app.archive_async import get_async_archive_service
+from app.archive_tools import (
+    SEARCH_FIELDS,
+    build_entry,
+    build_search_query,
+    format_content,
+    format_search_result,
+)
+
+
+async def save_to_archive(
+    title: str,
+    summary: str,
+    content: str,
+    document_type: str,
+    program: str = "muu",
+    project: str = "muu",
+    tags: str = "",
+    agent_name: str = "kirjoittaja",
+    prompt_packs: str = "org_pack_v1",
+) -> str:
+    """Tallenna teksti arkistoon."""
+    entry = build_entry(
+        title, summary, content, document_type, program, project, tags, agent_name, prompt_packs
+    )
+    entry_id = await get_async_archive_service().save(entry)
+    return f"Arkistoitu onnistuneesti. ID: {entry_id}"
+
+async def search_archive(
+    query: str = "",
+    document_type: str = "",
+    program: str = "",
+    project: str = "",
+    tags: str = "",
+    latest_only: bool = True,
+    limit: int = 5,
+    mode: str = "",
+) -> str:
+    """Hae arkistosta. mode: keyword | vector | hybrid (oletus hybrid kun upotukset ovat käytössä)."""
+    archive = get_async_archive_service()
+    search_query = build_search_query(
+        query, document_type, program, project, tags, latest_only, limit,
+        mode=mode, semantic=archive.embedder is not None,
+    )
+    result = await archive.search(search_query, fields=SEARCH_FIELDS)
+    return format_search_result(result)
+
+async def get_archived_content(entry_id: str) -> str:
+    """Hae arkistoitu teksti ID:llä."""
+    return format_content(entry_id, await get_async_archive_service().get(entry_id))
@@ -0,0 +1,347 @@
+"""
+Arkiston semanttinen haku: upotukset (embeddings) ja paikallinen IVF-indeksi.
+
+- Embedder: mikä tahansa LangChainin Embeddings-rajapinnan toteuttava olio
+  (embed_documents / embed_query), esim. VertexAIEmbeddings. Testeissä ja
+  offline-käytössä HashingEmbedder (deterministinen, ei verkkoa).
+- Vektorit: entry_vectors-taulu samassa SQLite-tiedostossa (float32,
+  L2-normalisoitu), lisätään save():n kirjoitustransaktiossa.
+- ANN: IVF (k-means-keskipisteet vector_centroids-taulussa). Haku vertaa
+  kyselyä keskipisteisiin ja lukee vain nprobe lähimmän listan vektorit.
+  Alle IVF_MIN_VECTORS vektorilla (tai ennen opetusta) haku käy kaikki
+  vektorit läpi. Opetus ajetaan tallennuksen jälkeen taustasäikeessä tai
+  reindex_vectors()/train_vector_index():ssa, ei koskaan hakupyynnössä.
+
+Käyttö:
+    archive = ArchiveService(embedder=HashingEmbedder())
+    archive.search(ArchiveSearchQuery(query="nuorten hyvinvointi", mode="hybrid"))
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import uuid
+import zlib
+from typing import Dict, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from app.archive_db import SQLitePool
+from app.text_utils import fold
+
+# Longer bodies are cut before embedding (API embedders have token limits)
+EMBED_MAX_CHARS = 8000
+# Below this many vectors a full scan beats IVF
+IVF_MIN_VECTORS = 5000
+# Lists searched per query
+NPROBE = 8
+KMEANS_ITERATIONS = 12
+KMEANS_SAMPLE = 20000
+
+
+class Embedder(Protocol):
+    """LangChainin Embeddings-rajapinnan osajoukko."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]: ...
+
+    def embed_query(self, text: str) -> List[float]: ...
+
+
+class HashingEmbedder:
+    """
+    Deterministinen paikallinen upotus: sanat + merkkitrigrammit hajautettuna
+    dim-ulotteiseen vektoriin (feature hashing).
+
+    Trigrammit tunnistavat taivutusmuodot ja yhdyssanojen osat
+    ("hakemukset" ~ "hakemuksen"), mutta eivät synonyymejä: tuotannossa
+    käytä oikeaa mallia (ARCHIVE_EMBEDDER=vertex).
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        for word in re.findall(r"\w+", fold(text)):
+            features.append(word)
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def embedder_from_env() -> Optional[Embedder]:
+    """ARCHIVE_EMBEDDER: "" (pois), "hashing" tai "vertex" (ARCHIVE_EMBEDDING_MODEL)."""
+    kind = os.environ.get("ARCHIVE_EMBEDDER", "").strip().lower()
+    if not kind:
+        return None
+    if kind == "hashing":
+        return HashingEmbedder()
+    if kind == "vertex":
+        from langchain_google_vertexai import VertexAIEmbeddings
+
+        return VertexAIEmbeddings(
+            model_name=os.environ.get("ARCHIVE_EMBEDDING_MODEL", "text-embedding-005"),
+            location=os.environ.get("GOOGLE_CLOUD_LOCATION", "us-central1"),
+        )
+    raise ValueError(f"Unknown ARCHIVE_EMBEDDER: {kind!r} (hashing | vertex)")
+
+
+def embedding_text(title: str, summary: str, tags: Sequence[str], content: str) -> str:
+    return "\n".join([title, summary, " ".join(tags), content])[:EMBED_MAX_CHARS]
+
+
+def normalize(vectors: "np.ndarray") -> "np.ndarray":
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class VectorIndex:
+    """IVF-indeksi SQLite-tauluissa; keskipisteet välimuistissa muistissa."""
+
+    def __init__(self, pool: SQLitePool):
+        self._pool = pool
+        self._lock = threading.Lock()
+        # (trained_at, centroids) — reloaded when train() runs anywhere
+        self._centroids: Tuple[Optional[str], Optional["np.ndarray"]] = (None, None)
+        # Single flight: one k-means run at a time per index
+        self._training = threading.Lock()
+
+    @staticmethod
+    def create_schema(conn: sqlite3.Connection) -> None:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entry_vectors (
+                entry_id TEXT PRIMARY KEY REFERENCES entries(id) ON DELETE CASCADE,
+                list_id INTEGER,
+                vector BLOB NOT NULL
+            )
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entry_vectors_list ON entry_vectors(list_id)"
+        )
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS vector_centroids (
+                list_id INTEGER PRIMARY KEY,
+                centroid BLOB NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS vector_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+
+    # -------------------------------------------------------------------------
+    # Centroids
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _meta(conn: sqlite3.Connection, key: str) -> Optional[str]:
+        row = conn.execute("SELECT value FROM vector_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _load_centroids(self, conn: sqlite3.Connection) -> Optional["np.ndarray"]:
+        trained_at = self._meta(conn, "trained_at")
+        with self._lock:
+            if trained_at == self._centroids[0]:
+                return self._centroids[1]
+        centroids = None
+        if trained_at is not None:
+            rows = conn.execute(
+                "SELECT centroid FROM vector_centroids ORDER BY list_id"
+            ).fetchall()
+            if rows:
+                centroids = np.stack([np.frombuffer(row[0], dtype=np.float32) for row in rows])
+        with self._lock:
+            self._centroids = (trained_at, centroids)
+        return centroids
+
+    def needs_training(self) -> bool:
+        """IVF kannattaa (uudelleen)opettaa: ei opetettu ja vektoreita ≥ IVF_MIN_VECTORS, tai 4x kasvu."""
+        with self._pool.read() as conn:
+            # MAX(rowid) is O(1); deletes only make it overestimate
+            vectors = conn.execute("SELECT MAX(rowid) FROM entry_vectors").fetchone()[0] or 0
+            trained = int(self._meta(conn, "trained_count") or 0)
+        if not trained:
+            return vectors >= IVF_MIN_VECTORS
+        return vectors > 4 * trained
+
+    # -------------------------------------------------------------------------
+    # Writes (call inside a write transaction)
+    # -------------------------------------------------------------------------
+
+    def add(self, conn: sqlite3.Connection, items: Sequence[Tuple[str, Sequence[float]]]) -> None:
+        """Lisää/korvaa kirjausten vektorit ja sijoita ne lähimpään IVF-listaan."""
+        if not items:
+            return
+        vectors = normalize(np.stack([vector for _, vector in items]))
+        dim = self._meta(conn, "dim")
+        if dim is None:
+            conn.execute(
+                "INSERT INTO vector_meta (key, value) VALUES ('dim', ?)", (str(vectors.shape[1]),)
+            )
+        elif int(dim) != vectors.shape[1]:
+            # Never fail the save itself: the entry is stored, only unindexed
+            print(
+                f"Embedding dimension {vectors.shape[1]} != index dimension {dim}; "
+                "run reindex_vectors(rebuild=True) after changing the embedder"
+            )
+            return
+        centroids = self._load_centroids(conn)
+        lists = (
+            np.argmax(vectors @ centroids.T, axis=1).tolist()
+            if centroids is not None else [None] * len(items)
+        )
+        conn.executemany("""
+            INSERT INTO entry_vectors (entry_id, list_id, vector) VALUES (?, ?, ?)
+            ON CONFLICT(entry_id) DO UPDATE SET
+                list_id = excluded.list_id, vector = excluded.vector
+        """, [
+            (entry_id, list_id, vector.tobytes())
+            for (entry_id, _), list_id, vector in zip(items, lists, vectors)
+        ])
+
+    @staticmethod
+    def clear(conn: sqlite3.Connection) -> None:
+        for table in ("entry_vectors", "vector_centroids", "vector_meta"):
+            conn.execute(f"DELETE FROM {table}")
+
+    # -------------------------------------------------------------------------
+    # Training
+    # -------------------------------------------------------------------------
+
+    def train(self, lists: Optional[int] = None, seed: int = 0) -> int:
+        """
+        Opeta IVF-keskipisteet (sfäärinen k-means) ja sijoita kaikki vektorit
+        listoihin. Palauttaa listojen määrän (0 = liian vähän vektoreita).
+        Odottaa käynnissä olevan opetuksen loppuun.
+        """
+        with self._training:
+            return self._train(lists, seed)
+
+    def train_in_background(self) -> Optional[threading.Thread]:
+        """
+        Käynnistä train() taustasäikeessä jos needs_training() eikä opetus ole
+        jo käynnissä (single flight). Haku ei koskaan opeta itse.
+        """
+        if not self.needs_training() or not self._training.acquire(blocking=False):
+            return None
+
+        def run() -> None:
+            try:
+                self._train(None, 0)
+            except Exception as e:
+                # Searches keep working on the old (or no) centroids
+                print(f"Vector index training failed: {type(e).__name__}: {e}")
+            finally:
+                self._training.release()
+
+        thread = threading.Thread(target=run, name="vector-index-train", daemon=True)
+        thread.start()
+        return thread
+
+    def _train(self, lists: Optional[int], seed: int) -> int:
+        with self._pool.read() as conn:
+            rows = conn.execute("SELECT entry_id, vector FROM entry_vectors").fetchall()
+        if len(rows) < 2:
+            return 0
+        ids = [row[0] for row in rows]
+        vectors = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        k = lists or max(1, min(4096, int(np.sqrt(len(rows)))))
+
+        rng = np.random.default_rng(seed)
+        sample = vectors
+        if len(vectors) > KMEANS_SAMPLE:
+            sample = vectors[rng.choice(len(vectors), KMEANS_SAMPLE, replace=False)]
+        centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(k):
+                members = sample[assignment == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+                else:
+                    # Empty list: reseed from a random vector
+                    centroids[c] = sample[rng.integers(len(sample))]
+            centroids = normalize(centroids)
+
+        assignment = np.argmax(vectors @ centroids.T, axis=1).tolist()
+
+        def store(conn: sqlite3.Connection) -> None:
+            conn.execute("DELETE FROM vector_centroids")
+            conn.executemany(
+                "INSERT INTO vector_centroids (list_id, centroid) VALUES (?, ?)",
+                [(i, c.tobytes()) for i, c in enumerate(centroids)]
+            )
+            conn.executemany(
+                "UPDATE entry_vectors SET list_id = ? WHERE entry_id = ?",
+                list(zip(assignment, ids))
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO vector_meta (key, value) VALUES (?, ?)",
+                [
+                    ("trained_at", uuid.uuid4().hex),
+                    ("trained_count", str(len(ids))),
+                ]
+            )
+
+        self._pool.write(store)
+        return k
+
+    # -------------------------------------------------------------------------
+    # Search
+    # -------------------------------------------------------------------------
+
+    def search(
+        self, query: Sequence[float], k: int, nprobe: int = NPROBE
+    ) -> List[Tuple[str, float]]:
+        """k lähintä (entry_id, kosinisamankaltaisuus) laskevassa järjestyksessä."""
+        q = normalize(np.asarray(query, dtype=np.float32))
+        with self._pool.read() as conn:
+            dim = self._meta(conn, "dim")
+            if dim is not None and int(dim) != len(q):
+                raise ValueError(
+                    f"Query embedding dimension {len(q)} != index dimension {dim}; "
+                    "run reindex_vectors(rebuild=True) after changing the embedder"
+                )
+            centroids = self._load_centroids(conn)
+            if centroids is None:
+                rows = conn.execute("SELECT entry_id, vector FROM entry_vectors").fetchall()
+            else:
+                probe = np.argsort(-(centroids @ q))[:nprobe].tolist()
+                rows = conn.execute(
+                    f"""
+                    SELECT entry_id, vector FROM entry_vectors
+                    WHERE list_id IN ({",".join("?" * len(probe))}) OR list_id IS NULL
+                    """,
+                    probe
+                ).fetchall()
+        if not rows:
+            return []
+        vectors = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32)
+        scores = vectors.reshape(len(rows), -1) @ q
+        top = np.argsort(-scores)[:k]
+        return [(rows[i][0], float(scores[i])) for i in top]
+
+    def stats(self) -> Dict[str, int]:
+        with self._pool.read() as conn:
+            vectors = conn.execute("SELECT COUNT(*) FROM entry_vectors").fetchone()[0]
+            lists = conn.execute("SELECT COUNT(*) FROM vector_centroids").fetchone()[0]
+            trained = int(self._meta(conn, "trained_count") or 0)
+        return {"vectors": vectors, "lists": lists, "trained_count": trained}
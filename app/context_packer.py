@@ -0,0 +1,175 @@
+"""
+Haettujen dokumenttien pakkaus LLM-kontekstiin token-budjetin mukaan.
+
+retrieve_docs liitti ennen jokaisen dokumentin koko sisällön kontekstiin.
+pack_context():
+
+- Järjestää dokumentit rerank-pisteen mukaan (metadata relevance_score;
+  ilman pistettä haun järjestys säilyy)
+- Poistaa päällekkäiset katkelmat: lause, joka on jo korkeammalla
+  sijoittuneessa dokumentissa, jätetään pois; tyhjiksi jäävät pudotetaan
+- Leikkaa budjettiin: dokumentit kokonaisina niin kauan kuin mahtuu,
+  viimeinen lauserajalta lyhennettynä
+- Säilyttää lähteet: <Document id="..." link="..."> jotta viittaukset toimivat
+
+Tokenit arvioidaan merkkimäärästä (CHARS_PER_TOKEN), ei tokenizer-kutsuilla.
+Budjetti tulee agentin AgentMetadata.context_token_budget-kentästä.
+
+Käyttö:
+    packed = pack_context(ranked_docs, budget=4000)
+    print(packed.text, packed.tokens_saved)
+"""
+
+import math
+import os
+import re
+from collections.abc import MutableMapping, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+from app.text_utils import fold
+
+DEFAULT_CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "4000"))
+# Gemini averages ~3.5 characters per token on Finnish prose (~4 on English)
+CHARS_PER_TOKEN = 3.5
+# Shorter sentences (headings, "Answer:") are never treated as duplicates
+MIN_DEDUP_CHARS = 30
+# A document cut shorter than this is dropped instead
+MIN_PARTIAL_TOKENS = 60
+
+HEADER = "## Context provided:"
+EMPTY = "Ei löytynyt dokumentteja tähän hakuun."
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    # Tokens the unpacked context (every document in full) would have used
+    tokens_in: int
+    documents_in: int
+    documents_out: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_in - self.tokens)
+
+
+def _content(doc: Any) -> str:
+    return doc.page_content if hasattr(doc, "page_content") else str(doc)
+
+
+def _metadata(doc: Any) -> dict:
+    return getattr(doc, "metadata", None) or {}
+
+
+def _block(doc: Any, content: str) -> str:
+    metadata = _metadata(doc)
+    attrs = "".join(
+        f' {name}="{str(metadata[name]).replace(chr(34), chr(39))}"'
+        for name in ("id", "link") if metadata.get(name)
+    )
+    return f"<Document{attrs}>\n{content}\n</Document>"
+
+
+def _sentences(text: str) -> list[str]:
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s and s.strip()]
+
+
+def _sentence_key(sentence: str) -> str:
+    return _SPACE_RE.sub(" ", fold(sentence)).strip(" .!?")
+
+
+def _truncate(sentences: list[str], max_chars: int) -> str:
+    """Kokonaiset lauseet max_chars asti; yksittäinen pitkä lause sanarajalta."""
+    kept = []
+    used = 0
+    for sentence in sentences:
+        cost = len(sentence) + (1 if kept else 0)
+        if used + cost > max_chars:
+            if not kept:
+                cut = sentence.rfind(" ", 0, max_chars)
+                kept.append(sentence[:cut if cut > 0 else max_chars])
+            break
+        kept.append(sentence)
+        used += cost
+    return " ".join(kept) + " …"
+
+
+def pack_context(
+    docs: Sequence[Any],
+    budget: int | None = None,
+) -> PackedContext:
+    """Järjestä, deduplikoi ja leikkaa docs budjettiin (tokeneina)."""
+    budget = DEFAULT_CONTEXT_TOKEN_BUDGET if budget is None else budget
+    if budget <= 0:
+        raise ValueError("budget must be > 0")
+    tokens_in = estimate_tokens(
+        "\n".join([HEADER, *(_block(doc, _content(doc)) for doc in docs)])
+    ) if docs else 0
+    if not docs:
+        return PackedContext(EMPTY, estimate_tokens(EMPTY), tokens_in, 0, 0)
+
+    # sorted() is stable: unscored documents keep retrieval order
+    ordered = sorted(
+        docs,
+        key=lambda doc: -float(_metadata(doc).get("relevance_score", 0.0) or 0.0),
+    )
+    parts = [HEADER]
+    used = estimate_tokens(HEADER)
+    seen = set()
+    for doc in ordered:
+        sentences = []
+        for sentence in _sentences(_content(doc)):
+            key = _sentence_key(sentence)
+            if len(key) >= MIN_DEDUP_CHARS:
+                if key in seen:
+                    continue
+                seen.add(key)
+            sentences.append(sentence)
+        if not sentences:
+            continue
+        block = _block(doc, " ".join(sentences))
+        cost = estimate_tokens(block) + 1
+        if used + cost <= budget:
+            parts.append(block)
+            used += cost
+            continue
+        # Partial last document, cut at a sentence boundary
+        overhead = estimate_tokens(_block(doc, "")) + 1
+        room = budget - used - overhead
+        if room >= MIN_PARTIAL_TOKENS:
+            block = _block(doc, _truncate(sentences, int(room * CHARS_PER_TOKEN) - 2))
+            parts.append(block)
+            used += estimate_tokens(block) + 1
+        break
+
+    text = "\n".join(parts)
+    return PackedContext(text, estimate_tokens(text), tokens_in, len(docs), len(parts) - 1)
+
+
+# Running totals per agent in session state (state["context_packing"])
+PACKING_FIELDS = ("calls", "tokens", "tokens_saved", "documents")
+
+
+def record_packing(state: MutableMapping[str, Any], agent: str, packed: PackedContext) -> None:
+    """Lisää pakkauksen luvut agentin summiin: state["context_packing"][agent]."""
+    totals = state.get("context_packing")
+    if not isinstance(totals, dict):
+        totals = {}
+    current = totals.get(agent) or dict.fromkeys(PACKING_FIELDS, 0)
+    totals[agent] = {
+        "calls": current["calls"] + 1,
+        "tokens": current["tokens"] + packed.tokens,
+        "tokens_saved": current["tokens_saved"] + packed.tokens_saved,
+        "documents": current["documents"] + packed.documents_out,
+    }
+    # Reassigned so the state delta is recorded
+    state["context_packing"] = totals
@@ -14,6 +14,7 @@
 
 import os
 import re
+import secrets
 import uuid
 from urllib.parse import quote
 from pathlib import Path
@@ -22,12 +23,13 @@ import zipfile
 import xml.etree.ElementTree as ElementTree
 
 import google.auth
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi import Depends, FastAPI, File, Form, Header, HTTPException, UploadFile
 from google.adk.cli.fast_api import get_fast_api_app
 from google.cloud import logging as google_cloud_logging
 
 from app.app_utils.telemetry import setup_telemetry
 from app.app_utils.typing import Feedback
+from app.retrieval_cache import get_retrieval_cache
 
 setup_telemetry()
 _, project_id = google.auth.default()
@@ -46,6 +48,8 @@ MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "200"))
 MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
 UPLOAD_PREVIEW_CHARS = int(os.environ.get("UPLOAD_PREVIEW_CHARS", "12000"))
 ALLOWED_UPLOAD_EXTENSIONS = {".pdf", ".docx", ".xlsx", ".csv", ".txt"}
+# Shared secret for the admin routes (X-Admin-Token header); unset = routes disabled
+ADMIN_API_TOKEN = os.environ.get("ADMIN_API_TOKEN", "")
 
 
 def _sanitize_segment(value: Optional[str]) -> str:
@@ -88,6 +92,13 @@ def _extract_preview(file_path: Path, extension: str) -> tuple[Optional[str], bo
         return None, False
     return None, False
 
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin routes are disabled")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_API_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
 # Cloud SQL session configuration
 db_user = os.environ.get("DB_USER", "postgres")
 db_name = os.environ.get("DB_NAME", "postgres")
@@ -199,6 +210,34 @@ def collect_feedback(feedback: Feedback) -> dict[str, str]:
     return {"status": "success"}
 
 
+@app.post("/retrieval-cache/invalidate", dependencies=[Depends(require_admin_token)])
+def invalidate_retrieval_cache(data_store_id: Optional[str] = Form(None)) -> dict[str, object]:
+    """Drop cached retrieve_docs results after ingestion into a data store.
+
+    The cache lives in process memory, so this clears only the instance
+    that receives the request. With several instances, call every instance
+    or wait for RETRIEVAL_CACHE_TTL.
+
+    Args:
+        data_store_id: Data store that was re-ingested (empty = all)
+
+    Returns:
+        Number of dropped results
+    """
+    dropped = get_retrieval_cache().invalidate(data_store_id or None)
+    logger.log_struct(
+        {"event": "retrieval_cache_invalidate", "data_store_id": data_store_id, "dropped": dropped},
+        severity="INFO",
+    )
+    return {"status": "success", "dropped": dropped}
+
+
+@app.get("/retrieval-cache/stats", dependencies=[Depends(require_admin_token)])
+def retrieval_cache_stats() -> dict[str, object]:
+    """Hit rates and saved search latency of this instance's retrieve_docs cache."""
+    return get_retrieval_cache().stats()
+
+
 # Main execution
 if __name__ == "__main__":
     import uvicorn
@@ -18,7 +18,8 @@ from app.pdf_tools import read_pdf_content, get_pdf_metadata
 from app.advanced_tools import process_meeting_transcript, schedule_samha_meeting
 
 # Import Shared Tools
-from app.tools_base import retrieve_docs, LLM, LONG_OUTPUT_CONFIG
+from app.tools_base import LLM, LONG_OUTPUT_CONFIG
+from app.retrieval_tools_async import retrieve_docs
 
 KUMPPANI_CONFIG = genai_types.GenerateContentConfig(
     temperature=0.8,  # Slightly higher for cultural nuances and relationship building
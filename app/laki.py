@@ -39,7 +39,7 @@ LONG_OUTPUT_CONFIG = genai_types.GenerateContentConfig(
     max_output_tokens=16384,
 )
 
-from app.tools_base import retrieve_docs
+from app.retrieval_tools_async import retrieve_docs
 
 # Tool mapping for Laki
 TOOL_MAP_LITE = {
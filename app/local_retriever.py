@@ -0,0 +1,435 @@
+"""
+Paikallinen hybridihaku kb_documents/-kansioon (ilman verkkoa).
+
+Varahaku kun Vertex AI Search ei ole käytettävissä, sekä verkoton
+testi- ja kehitystausta (RETRIEVER_BACKEND=local).
+
+- Lähteet: .md/.markdown/.txt suoraan, .pdf pypdf:llä; teksti pilkotaan
+  kappaleiden rajoilta ~CHUNK_CHARS merkin paloiksi
+- BM25: sanat taivutettuna ja ilman (fold + STEM_LENGTH-etuliite) +
+  yhdyssanojen loppuosat (app.archive_fts), termifrekvenssit levyllä
+- Upotukset: float16-matriisi (vectors.f16), luetaan np.memmapilla;
+  upotin on vaihdettavissa (Embedder-rajapinta, oletus HashingEmbedder)
+- Haku: BM25- ja vektorituloksen reciprocal rank fusion (mode="hybrid").
+  Oletusupottimella vektorihaku on hajautettu sana- ja trigrammivertailu
+  eli toinen leksikaalinen järjestäjä: se löytää taivutusmuodot ja
+  yhdyssanojen osat, mutta ei synonyymejä. Semanttinen hybridi vaatii
+  oikean mallin (RETRIEVER_BACKEND=local käyttää ARCHIVE_EMBEDDERiä)
+- Päivitys: refresh() vertaa tiedostojen mtime/kokoa indeksiin ja käsittelee
+  vain muuttuneet, uudet ja poistetut tiedostot. Haut lukevat edellistä
+  tilannekuvaa, kunnes uusi on valmis (yksi sijoitus)
+
+Käyttö:
+    index = LocalKnowledgeIndex("kb_documents", ".kb_index")
+    index.refresh()
+    hits = index.search("STEA-avustuksen raportointi", k=5)
+
+Indeksin rakennus etukäteen (esim. image-buildissa):
+    uv run python -m app.local_retriever
+"""
+
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from app.archive_fts import split_compounds
+from app.archive_vectors import Embedder, HashingEmbedder, normalize
+from app.rank_fusion import rrf_scores
+from app.retrieval_cache import DEGRADED
+from app.text_utils import fold
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+KB_DIR = Path(os.environ.get("LOCAL_KB_DIR", str(REPO_DIR / "kb_documents")))
+INDEX_DIR = Path(os.environ.get("LOCAL_KB_INDEX_DIR", str(REPO_DIR / ".kb_index")))
+
+SUFFIXES = (".md", ".markdown", ".txt", ".pdf")
+CHUNK_CHARS = 1500
+# Finnish inflects the word end: "hakemuksen", "hakemusta" → "hakemu"
+STEM_LENGTH = 6
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Candidates per ranker before fusion
+FUSION_DEPTH = 50
+# Rows scored per matmul block (bounds the float32 copy of the memmap)
+VECTOR_BLOCK = 8192
+# Seconds between background refresh() checks (app.retrievers); 0 = startup only
+REFRESH_INTERVAL = float(os.environ.get("LOCAL_KB_REFRESH_SECONDS", "60"))
+INDEX_VERSION = 1
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+
+@dataclass
+class LocalHit:
+    id: str
+    path: str
+    text: str
+    score: float
+
+
+def tokenize(text: str) -> list[str]:
+    """BM25-termit: sanat, niiden etuliitevartalot ja yhdyssanojen loppuosat."""
+    terms = []
+    for word in _WORD_RE.findall(fold(text)):
+        terms.append(word)
+        if len(word) > STEM_LENGTH:
+            terms.append(word[:STEM_LENGTH] + "*")
+    for part in split_compounds(text).split():
+        terms.append(part)
+        if len(part) > STEM_LENGTH:
+            terms.append(part[:STEM_LENGTH] + "*")
+    return terms
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS) -> list[str]:
+    """Kappaleet yhdistettynä ~size merkin paloiksi; ylipitkät kappaleet sanarajoilta."""
+    chunks: list[str] = []
+    current = ""
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        while len(paragraph) > size:
+            cut = paragraph.rfind(" ", 0, size)
+            cut = cut if cut > size // 2 else size
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def read_document(path: Path) -> str:
+    if path.suffix.lower() == ".pdf":
+        from pypdf import PdfReader
+
+        reader = PdfReader(str(path))
+        return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+    return path.read_text(encoding="utf-8", errors="replace")
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # Write-then-rename: a crash never leaves a half-written index
+    tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+class LocalKnowledgeIndex:
+    """BM25 + float16-upotukset levyllä; haut lukevat muuttumatonta tilannekuvaa."""
+
+    def __init__(
+        self,
+        kb_dir: str | Path = KB_DIR,
+        index_dir: str | Path = INDEX_DIR,
+        embedder: Embedder | None = None,
+    ):
+        self.kb_dir = Path(kb_dir)
+        self.index_dir = Path(index_dir)
+        self.embedder = embedder or HashingEmbedder()
+        self._lock = threading.Lock()
+        self._manifest: dict = self._empty_manifest()
+        self._vectors: np.ndarray = np.zeros((0, 0), dtype=np.float16)
+        # Search snapshot: (chunks, postings, doc lengths, avgdl, vectors)
+        self._snapshot: tuple = ([], {}, np.zeros(0), 0.0, self._vectors)
+        self._loaded = False
+
+    # -------------------------------------------------------------------------
+    # Public API
+    # -------------------------------------------------------------------------
+
+    def refresh(self) -> dict[str, int]:
+        """Indeksoi muuttuneet tiedostot (mtime/koko) ja tallenna indeksi."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            old_files = self._manifest["files"]
+            current = self._scan()
+            unchanged = {
+                path for path, stat in current.items()
+                if old_files.get(path, {}).get("stat") == stat
+            }
+            changed = sorted(set(current) - unchanged)
+            removed = sorted(set(old_files) - set(current))
+            failed = self._rebuild(unchanged, current) if changed or removed else set()
+            indexed = [path for path in changed if path not in failed]
+            return {
+                "added": sum(path not in old_files for path in indexed),
+                "updated": sum(path in old_files for path in indexed),
+                "removed": len(removed),
+                "unchanged": len(unchanged),
+                "failed": len(failed),
+                "chunks": len(self._manifest["chunks"]),
+            }
+
+    def search(self, query: str, k: int = 10, mode: str = "hybrid") -> list[LocalHit]:
+        """Parhaat k palaa: mode = "hybrid" | "bm25" | "vector"."""
+        if mode not in ("hybrid", "bm25", "vector"):
+            raise ValueError(f"Unknown search mode: {mode!r} (hybrid | bm25 | vector)")
+        snapshot = self._snapshot
+        chunks = snapshot[0]
+        if not chunks or not query.strip():
+            return []
+        depth = max(k, FUSION_DEPTH)
+        ranked = []
+        if mode in ("hybrid", "bm25"):
+            ranked.append(self._bm25(snapshot, query, depth))
+        if mode in ("hybrid", "vector"):
+            ranked.append(self._vector(snapshot, query, depth))
+        if len(ranked) == 1:
+            top = ranked[0][:k]
+        else:
+            fused = rrf_scores([idx for idx, _ in results] for results in ranked)
+            top = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            LocalHit(chunks[idx]["id"], chunks[idx]["path"], chunks[idx]["text"], float(score))
+            for idx, score in top
+        ]
+
+    def stats(self) -> dict:
+        chunks, postings, _, _, vectors = self._snapshot
+        return {
+            "files": len(self._manifest["files"]),
+            "chunks": len(chunks),
+            "terms": len(postings),
+            "vector_bytes": int(vectors.nbytes),
+        }
+
+    # -------------------------------------------------------------------------
+    # Ranking
+    # -------------------------------------------------------------------------
+
+    def _bm25(self, snapshot: tuple, query: str, depth: int) -> list[tuple[int, float]]:
+        chunks, postings, lengths, avgdl, _ = snapshot
+        scores = np.zeros(len(chunks), dtype=np.float32)
+        n = len(chunks)
+        for term in set(tokenize(query)):
+            posting = postings.get(term)
+            if posting is None:
+                continue
+            idx, tf = posting
+            idf = math.log(1 + (n - len(idx) + 0.5) / (len(idx) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[idx] / avgdl)
+            scores[idx] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        top = np.argsort(-scores, kind="stable")[:depth]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def _vector(self, snapshot: tuple, query: str, depth: int) -> list[tuple[int, float]]:
+        vectors = snapshot[4]
+        q = normalize(self.embedder.embed_query(query))
+        scores = np.concatenate([
+            vectors[start:start + VECTOR_BLOCK].astype(np.float32) @ q
+            for start in range(0, len(vectors), VECTOR_BLOCK)
+        ])
+        top = np.argsort(-scores, kind="stable")[:depth]
+        return [(int(i), float(scores[i])) for i in top]
+
+    # -------------------------------------------------------------------------
+    # Persistence (call with self._lock held)
+    # -------------------------------------------------------------------------
+
+    def _embedder_id(self) -> str:
+        dim = getattr(self.embedder, "dim", None) or len(self.embedder.embed_query("dim"))
+        return f"{type(self.embedder).__name__}:{dim}"
+
+    def _empty_manifest(self) -> dict:
+        return {"version": INDEX_VERSION, "embedder": None, "files": {}, "chunks": []}
+
+    def _load(self) -> None:
+        self._loaded = True
+        manifest_path = self.index_dir / "index.json"
+        if not manifest_path.exists():
+            self._manifest["embedder"] = self._embedder_id()
+            return
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        embedder_id = self._embedder_id()
+        if manifest.get("version") != INDEX_VERSION or manifest.get("embedder") != embedder_id:
+            # Different embedder or format: re-index everything
+            print(f"Local KB index at {self.index_dir} is stale, rebuilding")
+            self._manifest = self._empty_manifest()
+            self._manifest["embedder"] = embedder_id
+            return
+        self._manifest = manifest
+        self._vectors = self._open_vectors(int(embedder_id.rsplit(":", 1)[1]))
+        self._publish()
+
+    def _open_vectors(self, dim: int) -> np.ndarray:
+        path = self.index_dir / "vectors.f16"
+        rows = len(self._manifest["chunks"])
+        if rows == 0 or not path.exists():
+            return np.zeros((0, dim), dtype=np.float16)
+        return np.memmap(path, dtype=np.float16, mode="r", shape=(rows, dim))
+
+    def _scan(self) -> dict[str, list[int]]:
+        """Relatiivinen polku → [mtime_ns, koko] kaikille lähdetiedostoille."""
+        files = {}
+        if self.kb_dir.is_dir():
+            for path in sorted(self.kb_dir.rglob("*")):
+                if path.is_file() and path.suffix.lower() in SUFFIXES:
+                    stat = path.stat()
+                    files[path.relative_to(self.kb_dir).as_posix()] = [stat.st_mtime_ns, stat.st_size]
+        return files
+
+    def _rebuild(self, unchanged: set, current: dict[str, list[int]]) -> set:
+        """Kirjoita indeksi uudelleen; palauttaa lukukelvottomat polut (yritetään uudelleen)."""
+        old_files = self._manifest["files"]
+        old_chunks = self._manifest["chunks"]
+        files: dict[str, dict] = {}
+        chunks: list[dict] = []
+        kept_rows: list[int] = []
+        new_texts: list[str] = []
+        failed = set()
+
+        for path in sorted(current):
+            start = len(chunks)
+            if path in unchanged:
+                info = old_files[path]
+                rows = range(info["start"], info["start"] + info["count"])
+                chunks.extend(old_chunks[row] for row in rows)
+                kept_rows.extend(rows)
+            else:
+                try:
+                    text = read_document(self.kb_dir / path)
+                except Exception as e:
+                    # Left out of the manifest: the next refresh tries again
+                    print(f"⚠️ Local KB: cannot read {path}: {type(e).__name__}: {e}")
+                    failed.add(path)
+                    continue
+                for n, piece in enumerate(chunk_text(text)):
+                    chunks.append({
+                        "id": f"{path}#{n}",
+                        "path": path,
+                        "text": piece,
+                        "terms": dict(Counter(tokenize(piece))),
+                    })
+                    new_texts.append(piece)
+            files[path] = {"stat": current[path], "start": start, "count": len(chunks) - start}
+
+        dim = int(self._manifest["embedder"].rsplit(":", 1)[1])
+        new_vectors = (
+            normalize(self.embedder.embed_documents(new_texts))
+            if new_texts else np.zeros((0, dim), dtype=np.float32)
+        )
+        # Kept rows and new rows in file order
+        matrix = np.zeros((len(chunks), dim), dtype=np.float16)
+        kept = iter(kept_rows)
+        fresh = iter(new_vectors)
+        for row, chunk in enumerate(chunks):
+            if chunk["path"] in unchanged:
+                matrix[row] = self._vectors[next(kept)]
+            else:
+                matrix[row] = next(fresh)
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._manifest = {**self._manifest, "files": files, "chunks": chunks}
+        _write_atomic(self.index_dir / "vectors.f16", matrix.tobytes())
+        _write_atomic(
+            self.index_dir / "index.json",
+            json.dumps(self._manifest, ensure_ascii=False).encode("utf-8"),
+        )
+        self._vectors = self._open_vectors(dim)
+        self._publish()
+        return failed
+
+    def _publish(self) -> None:
+        """Rakenna haun tilannekuva manifestista (termi → (rivit, tf))."""
+        chunks = self._manifest["chunks"]
+        rows: dict[str, list[int]] = {}
+        freqs: dict[str, list[int]] = {}
+        lengths = np.zeros(len(chunks), dtype=np.float32)
+        for row, chunk in enumerate(chunks):
+            for term, tf in chunk["terms"].items():
+                rows.setdefault(term, []).append(row)
+                freqs.setdefault(term, []).append(tf)
+                lengths[row] += tf
+        postings = {
+            term: (np.array(rows[term]), np.array(freqs[term], dtype=np.float32))
+            for term in rows
+        }
+        avgdl = float(lengths.mean()) if len(chunks) else 0.0
+        self._snapshot = (chunks, postings, lengths, avgdl or 1.0, self._vectors)
+
+
+def get_local_retriever(
+    kb_dir: str | Path = KB_DIR,
+    index_dir: str | Path = INDEX_DIR,
+    embedder: Embedder | None = None,
+    max_documents: int = 10,
+    mode: str = "hybrid",
+    fallback: bool = False,
+):
+    """
+    LocalKnowledgeIndex LangChainin BaseRetriever-rajapinnalla.
+
+    Indeksi rakennetaan ja päivitetään refresh():llä taustasäikeessä
+    (get_retriever, REFRESH_INTERVAL sekunnin välein); haku ei päivitä.
+    Jos indeksiä ei ole vielä rakennettu, ensimmäinen haku odottaa sitä.
+
+    Args:
+        fallback: Vertex AI Searchin varahaku; dokumentit merkitään
+            heikennetyiksi (metadata[DEGRADED]), joten välimuisti ei pidä niitä
+    """
+    from langchain_core.callbacks import CallbackManagerForRetrieverRun
+    from langchain_core.documents import Document
+    from langchain_core.retrievers import BaseRetriever
+    from pydantic import ConfigDict
+
+    class LocalRetriever(BaseRetriever):
+        model_config = ConfigDict(arbitrary_types_allowed=True)
+
+        index: LocalKnowledgeIndex
+        max_documents: int = 10
+        mode: str = "hybrid"
+        fallback: bool = False
+        refreshed_at: float = 0.0
+
+        def refresh(self) -> dict[str, int]:
+            stats = self.index.refresh()
+            self.refreshed_at = time.monotonic()
+            return stats
+
+        def _get_relevant_documents(
+            self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+        ) -> list[Document]:
+            if not self.refreshed_at:
+                # Waits for a build already running in the background
+                self.refresh()
+            extra = {DEGRADED: "local_fallback"} if self.fallback else {}
+            return [
+                Document(
+                    page_content=hit.text,
+                    metadata={
+                        "id": hit.id, "name": hit.path, "link": hit.path, "score": hit.score,
+                        **extra,
+                    },
+                )
+                for hit in self.index.search(query, k=self.max_documents, mode=self.mode)
+            ]
+
+    return LocalRetriever(
+        index=LocalKnowledgeIndex(kb_dir, index_dir, embedder),
+        max_documents=max_documents,
+        mode=mode,
+        fallback=fallback,
+    )
+
+
+if __name__ == "__main__":
+    index = LocalKnowledgeIndex()
+    print(json.dumps({**index.refresh(), **index.stats()}, indent=2))
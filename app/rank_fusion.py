@@ -0,0 +1,53 @@
+"""
+Reciprocal rank fusion (RRF) usean hakutuloslistan yhdistämiseen.
+
+Pisteet = Σ 1 / (RRF_K + sijoitus) jokaisesta listasta, jossa tulos
+esiintyy. Käyttäjät: retrieve_docs-alikyselyjen fuusio (app.retrieval_async)
+ja paikallisen tietokannan BM25 + vektorihaku (app.local_retriever).
+"""
+
+import hashlib
+from collections.abc import Hashable, Iterable, Sequence
+from typing import Any
+
+# Standard RRF constant: damps the weight of the very top ranks
+RRF_K = 60
+
+
+def rrf_scores(rankings: Iterable[Iterable[Hashable]], k: int = RRF_K) -> dict[Hashable, float]:
+    """Avain → RRF-piste; toistuva avain samassa listassa lasketaan kerran."""
+    scores: dict[Hashable, float] = {}
+    for ranking in rankings:
+        seen = set()
+        for rank, key in enumerate(ranking, start=1):
+            if key in seen:
+                continue
+            seen.add(key)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+def doc_key(doc: Any) -> str:
+    """Dokumentin tunniste deduplikointiin: metadata id, name tai sisällön hash."""
+    metadata = getattr(doc, "metadata", None) or {}
+    key = metadata.get("id") or metadata.get("name")
+    if key:
+        return str(key)
+    content = getattr(doc, "page_content", str(doc))
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def rrf_fuse(result_lists: Sequence[Sequence[Any]], k: int = RRF_K) -> list[Any]:
+    """Yhdistä dokumenttilistat RRF-pisteillä; tasapisteissä ensin nähty ensin."""
+    docs: dict[str, Any] = {}
+    rankings = []
+    for results in result_lists:
+        keys = []
+        for doc in results:
+            key = doc_key(doc)
+            docs.setdefault(key, doc)
+            keys.append(key)
+        rankings.append(keys)
+    scores = rrf_scores(rankings, k)
+    # sorted() is stable: ties keep first-seen order
+    return [docs[key] for key in sorted(scores, key=scores.__getitem__, reverse=True)]
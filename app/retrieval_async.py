@@ -0,0 +1,146 @@
+"""
+retrieve_docs-putken async-ydin: rinnakkaiset haut, RRF-fuusio ja rerank.
+
+- Haut: jokainen alikysely haetaan retriever.ainvoke():lla samanaikaisesti
+  (Vertex AI Search -haku SearchServiceAsyncClientilla, ks. app.retrievers)
+- Fuusio: reciprocal rank fusion (app.rank_fusion); sama dokumentti
+  (metadata id) vain kerran
+- Rerank: fuusioidut ehdokkaat (RERANK_CANDIDATES) jaetaan
+  RERANK_BATCH_SIZE-kokoisiin eriin, jotka järjestetään rinnakkain
+  säiepoolissa (VertexAIRankilla ei ole async-rajapintaa) ja yhdistetään
+  relevance_scoren mukaan; oletuksilla 30 ehdokasta = 3 samanaikaista
+  kutsua. Jos ranking-palvelu ei vastaa jollekin erälle, kaikki ehdokkaat
+  palautetaan fuusion järjestyksessä
+
+Toimii minkä tahansa LangChain-retrieverin ja -kompressorin kanssa; itse
+työkalu on app.retrieval_tools_async.retrieve_docs.
+
+Käyttö:
+    queries = split_queries("STEA-rahoitus", "nuorisotyön menetelmät; antirasismi")
+    docs = await search_and_rerank(retriever, compressor, queries)
+"""
+
+import asyncio
+import os
+from collections.abc import Sequence
+from typing import Any
+
+from app.rank_fusion import rrf_fuse
+from app.retrieval_cache import DEGRADED, normalize_query
+
+# Fused candidates sent to the reranker
+RERANK_CANDIDATES = int(os.environ.get("RETRIEVAL_RERANK_CANDIDATES", "30"))
+# Ranking API limit is 200 records per request
+MAX_RERANK_BATCH_SIZE = 200
+# Candidates per rerank call; smaller batches run in parallel (ranking
+# latency grows with the records per request)
+RERANK_BATCH_SIZE = min(
+    int(os.environ.get("RETRIEVAL_RERANK_BATCH_SIZE", "10")), MAX_RERANK_BATCH_SIZE
+)
+MAX_QUERIES = 5
+
+
+def split_queries(query: str, sub_queries: str = "") -> list[str]:
+    """
+    Pääkysely + puolipisteellä tai rivinvaihdolla erotellut alikyselyt.
+
+    Tyhjät ja normalisoituna samat kyselyt pudotetaan, enintään MAX_QUERIES.
+    """
+    queries: list[str] = []
+    seen = set()
+    for part in [query, *sub_queries.replace("\n", ";").split(";")]:
+        part = part.strip()
+        key = normalize_query(part)
+        if key and key not in seen:
+            seen.add(key)
+            queries.append(part)
+    if not queries:
+        raise ValueError("query must not be empty")
+    return queries[:MAX_QUERIES]
+
+
+async def multi_search(retriever: Any, queries: Sequence[str]) -> list[list[Any]]:
+    """
+    Hae kaikki kyselyt samanaikaisesti.
+
+    Yksittäisen alikyselyn virhe tulostetaan ja ohitetaan; jos kaikki
+    epäonnistuvat, ensimmäinen virhe nostetaan.
+    """
+    results = await asyncio.gather(
+        *(retriever.ainvoke(query) for query in queries), return_exceptions=True
+    )
+    found = []
+    errors = []
+    for query, result in zip(queries, results, strict=True):
+        if isinstance(result, BaseException):
+            print(f"⚠️ Retrieval failed for '{query}': {type(result).__name__}: {result}")
+            errors.append(result)
+        else:
+            found.append(list(result))
+    if errors and not found:
+        raise errors[0]
+    return found
+
+
+def _rank(compressor: Any, query: str, docs: Sequence[Any]) -> list[Any] | None:
+    """compressor.compress_documents; None jos ranking-palvelu ei vastaa."""
+    try:
+        return list(compressor.compress_documents(documents=list(docs), query=query))
+    except Exception as e:
+        print(f"⚠️ Rerank failed ({type(e).__name__}: {e}), keeping retrieval order")
+        return None
+
+
+def _passthrough(compressor: Any, docs: Sequence[Any]) -> list[Any]:
+    top_n = getattr(compressor, "top_n", None)
+    passthrough = list(docs)[:top_n] if isinstance(top_n, int) else list(docs)
+    for doc in passthrough:
+        doc.metadata.setdefault(DEGRADED, "unranked")
+    return passthrough
+
+
+def compress_or_passthrough(compressor: Any, query: str, docs: Sequence[Any]) -> list[Any]:
+    """
+    compressor.compress_documents; jos ranking-palvelu ei vastaa, haun oma
+    järjestys (top_n ensimmäistä), jotta paikallinen varahaku toimii yksin.
+    Järjestämättömät dokumentit merkitään (metadata[DEGRADED] = "unranked"),
+    joten välimuisti ei pidä niitä koko TTL:ää.
+    """
+    ranked = _rank(compressor, query, docs)
+    return ranked if ranked is not None else _passthrough(compressor, docs)
+
+
+async def rerank(
+    compressor: Any, query: str, docs: Sequence[Any], batch_size: int = RERANK_BATCH_SIZE
+) -> list[Any]:
+    """Järjestä docs compressorilla; isot ehdokasjoukot erissä rinnakkain."""
+    if len(docs) <= batch_size:
+        return await asyncio.to_thread(compress_or_passthrough, compressor, query, docs)
+    batches = await asyncio.gather(*(
+        asyncio.to_thread(_rank, compressor, query, docs[i:i + batch_size])
+        for i in range(0, len(docs), batch_size)
+    ))
+    if any(batch is None for batch in batches):
+        # A failed batch has no relevance_score to merge by: the fusion order
+        # of all candidates beats ranked batches followed by unranked ones
+        return _passthrough(compressor, docs)
+    merged = sorted(
+        (doc for batch in batches for doc in batch),
+        key=lambda doc: float(doc.metadata.get("relevance_score", 0.0)),
+        reverse=True,
+    )
+    top_n = getattr(compressor, "top_n", None)
+    return merged[:top_n] if isinstance(top_n, int) else merged
+
+
+async def search_and_rerank(
+    retriever: Any,
+    compressor: Any,
+    queries: Sequence[str],
+    candidates: int = RERANK_CANDIDATES,
+) -> list[Any]:
+    """Rinnakkaiset haut → RRF + deduplikointi → yksi rerank kaikkia kyselyitä vasten."""
+    fused = rrf_fuse(await multi_search(retriever, queries))[:candidates]
+    if not fused:
+        return []
+    return await rerank(compressor, "; ".join(queries), fused)
@@ -0,0 +1,349 @@
+"""
+retrieve_docs-tulosten välimuisti (Vertex AI Search + VertexAIRank).
+
+Saman pipeline-ajon agentit (tutkija, sote, yhdenvertaisuus, koulutus_draft)
+kysyvät usein saman tai lähes saman kysymyksen. Kaksi tasoa:
+
+Arvo on järjestetty dokumenttilista; kontekstiksi se pakataan vasta
+kutsujan budjetilla (app.context_packer), joten agentit jakavat tulokset.
+
+- Tarkka taso: normalisoitu kysely (NFKC, casefold, välilyönnit, loppuvälimerkit)
+  → LRU, rajattu kirjausmäärällä ja TTL:llä
+- Semanttinen taso (valinnainen): kyselyn upotus verrataan saman datastoren
+  välimuistissa oleviin kyselyihin; kosinisamankaltaisuus >= threshold
+  → käytetään olemassa olevaa tulosta (parafraasit)
+- Avaimessa on datastore-id: invalidate(data_store_id) ingestion jälkeen
+  tyhjentää vain sen datastoren tulokset
+- Heikennetyt tulokset (dokumentin metadata["degraded"]: paikallinen
+  varahaku, järjestämätön rerank) tallennetaan vain degraded_ttl sekunniksi
+  (oletus 0 = ei lainkaan), joten katkon jälkeen seuraava haku yrittää uudelleen
+- Tilastot: osumat per taso, ohitukset, säästetty hakuaika; samat
+  OpenTelemetry-mittareina (retrieval_cache.*) kun opentelemetry on asennettu
+
+Käyttö:
+    cache = get_retrieval_cache()
+    docs = cache.get_or_compute(data_store_id, query, lambda: search_and_rank(query))
+    docs = await cache.aget_or_compute(data_store_id, query, async_search_and_rank)
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+try:
+    from opentelemetry import metrics as otel_metrics
+except ImportError:
+    otel_metrics = None  # optional: pip install opentelemetry-api
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL = 900.0
+# Paraphrases of the same question score ~0.93-0.97 with text-embedding-005;
+# related but different questions stay below ~0.9
+DEFAULT_SEMANTIC_THRESHOLD = 0.95
+# Degraded results are not cached by default
+DEFAULT_DEGRADED_TTL = 0.0
+# Document.metadata key a degraded pipeline sets, value = reason
+DEGRADED = "degraded"
+
+_TRAILING_PUNCT = re.compile(r"[\s?!.,;:]+$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Tarkan tason avain: "  Mikä on  STEA? " ja "mikä on stea" ovat sama kysely."""
+    text = unicodedata.normalize("NFKC", query).casefold()
+    return _TRAILING_PUNCT.sub("", _WHITESPACE.sub(" ", text).strip())
+
+
+def is_degraded(value: Any) -> bool:
+    """Onko tuloksessa heikennetyn haun dokumentteja (metadata[DEGRADED])."""
+    return isinstance(value, list) and any(
+        (getattr(doc, "metadata", None) or {}).get(DEGRADED) for doc in value
+    )
+
+
+@dataclass
+class _Entry:
+    stored_at: float
+    value: Any
+    # Seconds the original search + rerank took (saved on every hit)
+    cost: float
+    # L2-normalized query embedding, None when the semantic tier is off
+    vector: np.ndarray | None = None
+    # Seconds the entry stays valid
+    ttl: float = DEFAULT_TTL
+
+
+class RetrievalCache:
+    """Säieturvallinen kaksitasoinen (tarkka + semanttinen) hakutulosvälimuisti."""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+        embed: Callable[[str], list[float]] | None = None,
+        semantic_threshold: float = DEFAULT_SEMANTIC_THRESHOLD,
+        degraded_ttl: float = DEFAULT_DEGRADED_TTL,
+    ):
+        """
+        Args:
+            embed: kyselyn upotusfunktio (esim. VertexAIEmbeddings.embed_query);
+                None = vain tarkka taso
+            semantic_threshold: pienin kosinisamankaltaisuus semanttiselle osumalle
+            degraded_ttl: heikennettyjen tulosten TTL (is_degraded); 0 = ei tallenneta
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        if not 0.0 < semantic_threshold <= 1.0:
+            raise ValueError("semantic_threshold must be in (0, 1]")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed = embed
+        self.semantic_threshold = semantic_threshold
+        self.degraded_ttl = degraded_ttl
+        self._lock = threading.Lock()
+        # (data_store_id, normalized query) -> entry, least recently used first
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        self._stats: dict[str, float] = dict.fromkeys((
+            "hits", "exact_hits", "semantic_hits", "misses", "evictions",
+            "expirations", "invalidations", "embed_errors", "degraded_skips",
+        ), 0)
+        self._stats["saved_seconds"] = 0.0
+
+    # -------------------------------------------------------------------------
+    # Public API
+    # -------------------------------------------------------------------------
+
+    def get_or_compute(
+        self, data_store_id: str, query: str, compute: Callable[[], Any]
+    ) -> Any:
+        """
+        Palauta välimuistissa oleva tulos tai laske compute() ja tallenna se.
+
+        compute():n poikkeukset nousevat kutsujalle eikä niitä tallenneta;
+        heikennetyt tulokset vain degraded_ttl:n ajaksi.
+        """
+        key = (data_store_id, normalize_query(query))
+        value = self._get_exact(key)
+        if value is not None:
+            return value
+        value, vector = self._get_semantic(data_store_id, query)
+        if value is not None:
+            return value
+
+        self._record_miss()
+        start = time.perf_counter()
+        value = compute()
+        self.put(key, value, time.perf_counter() - start, vector)
+        return value
+
+    async def aget_or_compute(
+        self, data_store_id: str, query: str, compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """get_or_compute async-laskennalle; kyselyn upotus ajetaan säiepoolissa."""
+        key = (data_store_id, normalize_query(query))
+        value = self._get_exact(key)
+        if value is not None:
+            return value
+        value, vector = None, None
+        if self.embed is not None:
+            value, vector = await asyncio.to_thread(self._get_semantic, data_store_id, query)
+            if value is not None:
+                return value
+
+        self._record_miss()
+        start = time.perf_counter()
+        value = await compute()
+        self.put(key, value, time.perf_counter() - start, vector)
+        return value
+
+    def put(
+        self,
+        key: tuple[str, str],
+        value: Any,
+        cost: float = 0.0,
+        vector: np.ndarray | None = None,
+    ) -> None:
+        ttl = self.ttl
+        if is_degraded(value):
+            ttl = min(ttl, self.degraded_ttl)
+            if ttl <= 0:
+                with self._lock:
+                    self._stats["degraded_skips"] += 1
+                return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = _Entry(time.time(), value, cost, vector, ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, data_store_id: str | None = None) -> int:
+        """Poista datastoren (None = kaikki) tulokset. Palauttaa poistettujen määrän."""
+        with self._lock:
+            if data_store_id is None:
+                keys = list(self._entries)
+            else:
+                keys = [key for key in self._entries if key[0] == data_store_id]
+            for key in keys:
+                del self._entries[key]
+            self._stats["invalidations"] += len(keys)
+            return len(keys)
+
+    def stats(self) -> dict:
+        """Osumat per taso, ohitukset, säästetty aika ja nykyinen koko."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    # -------------------------------------------------------------------------
+    # Tiers
+    # -------------------------------------------------------------------------
+
+    def _get_exact(self, key: tuple[str, str]) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry.stored_at > entry.ttl:
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._record_hit("exact_hits", entry)
+            return entry.value
+
+    def _get_semantic(
+        self, data_store_id: str, query: str
+    ) -> tuple[Any | None, np.ndarray | None]:
+        """(osuma tai None, kyselyn upotus tallennusta varten)."""
+        vector = self._embed(query)
+        if vector is None:
+            return None, None
+        now = time.time()
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if key[0] == data_store_id
+                and entry.vector is not None
+                and now - entry.stored_at <= entry.ttl
+            ]
+            if not candidates:
+                return None, vector
+            scores = np.stack([entry.vector for _, entry in candidates]) @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.semantic_threshold:
+                return None, vector
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self._record_hit("semantic_hits", entry)
+            return entry.value, vector
+
+    def _embed(self, query: str) -> np.ndarray | None:
+        if self.embed is None:
+            return None
+        try:
+            vector = np.asarray(self.embed(query), dtype=np.float32)
+        except Exception as e:
+            # The exact tier still works; a failing embedder must not fail retrieval
+            print(f"⚠️ Retrieval cache embedding failed: {type(e).__name__}: {e}")
+            with self._lock:
+                self._stats["embed_errors"] += 1
+            return None
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def _record_miss(self) -> None:
+        with self._lock:
+            self._stats["misses"] += 1
+
+    def _record_hit(self, tier: str, entry: _Entry) -> None:
+        self._stats["hits"] += 1
+        self._stats[tier] += 1
+        self._stats["saved_seconds"] += entry.cost
+
+
+def register_metrics(cache: RetrievalCache) -> bool:
+    """
+    Julkaise cache.stats() OpenTelemetry-mittareina (retrieval_cache.*).
+
+    Palauttaa False jos opentelemetry ei ole asennettu. Ilman
+    MeterProvideria mittarit ovat no-op.
+    """
+    if otel_metrics is None:
+        return False
+    meter = otel_metrics.get_meter("app.retrieval_cache")
+
+    def observe(name: str):
+        def callback(options):
+            yield otel_metrics.Observation(cache.stats()[name])
+        return callback
+
+    for name, unit in (
+        ("hits", "{lookup}"), ("exact_hits", "{lookup}"), ("semantic_hits", "{lookup}"),
+        ("misses", "{lookup}"), ("evictions", "{entry}"), ("saved_seconds", "s"),
+    ):
+        meter.create_observable_counter(
+            f"retrieval_cache.{name}", callbacks=[observe(name)], unit=unit
+        )
+    meter.create_observable_gauge(
+        "retrieval_cache.hit_rate", callbacks=[observe("hit_rate")], unit="1"
+    )
+    meter.create_observable_gauge(
+        "retrieval_cache.entries", callbacks=[observe("entries")], unit="{entry}"
+    )
+    return True
+
+
+_retrieval_cache: RetrievalCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_retrieval_cache(
+    embed: Callable[[str], list[float]] | None = None,
+) -> RetrievalCache:
+    """
+    Prosessin yhteinen RetrievalCache ympäristömuuttujista (RETRIEVAL_CACHE_*).
+
+    RETRIEVAL_CACHE_MAX_ENTRIES, RETRIEVAL_CACHE_TTL, RETRIEVAL_CACHE_SEMANTIC=1
+    (käytä embed-funktiota semanttiseen tasoon), RETRIEVAL_CACHE_SEMANTIC_THRESHOLD,
+    RETRIEVAL_CACHE_DEGRADED_TTL.
+    Kutsujat ilman embediä (esim. /retrieval-cache/stats ennen ensimmäistä
+    agenttia) eivät sammuta semanttista tasoa: myöhempi kutsu embedin kanssa
+    kytkee sen välimuistiin, jolla sitä ei vielä ole.
+    """
+    global _retrieval_cache
+    semantic = os.environ.get("RETRIEVAL_CACHE_SEMANTIC", "0") == "1"
+    with _cache_lock:
+        if _retrieval_cache is not None:
+            if semantic and embed is not None and _retrieval_cache.embed is None:
+                _retrieval_cache.embed = embed
+        else:
+            _retrieval_cache = RetrievalCache(
+                max_entries=int(os.environ.get(
+                    "RETRIEVAL_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES)
+                )),
+                ttl=float(os.environ.get("RETRIEVAL_CACHE_TTL", str(DEFAULT_TTL))),
+                embed=embed if semantic else None,
+                semantic_threshold=float(os.environ.get(
+                    "RETRIEVAL_CACHE_SEMANTIC_THRESHOLD", str(DEFAULT_SEMANTIC_THRESHOLD)
+                )),
+                degraded_ttl=float(os.environ.get(
+                    "RETRIEVAL_CACHE_DEGRADED_TTL", str(DEFAULT_DEGRADED_TTL)
+                )),
+            )
+            register_metrics(_retrieval_cache)
+        return _retrieval_cache
@@ -0,0 +1,56 @@
+"""
+retrieve_docs-työkalun async-versio ADK-agenteille.
+
+Sama nimi ja vastausmuoto kuin app.tools_base.retrieve_docs (työkalun nimi =
+funktion nimi), mutta haku ei blokkaa tapahtumasilmukkaa ja agentti voi
+antaa useamman alikyselyn kerralla (app.retrieval_async). Tulokset jakavat
+saman välimuistin synkronisen version kanssa. Synkroninen versio jää
+skripteille.
+
+Konteksti pakataan kutsuvan agentin token-budjettiin
+(AgentMetadata.context_token_budget); käytetyt ja säästetyt tokenit
+kirjataan session stateen agenttikohtaisina juoksevina summina
+(context_packing), joten state ei kasva kutsujen mukana.
+"""
+
+
+from google.adk.tools import ToolContext
+
+from app.agents_registry import get_context_token_budget
+from app.context_packer import record_packing
+from app.observability import resolve_agent_name
+from app.retrieval_async import search_and_rerank, split_queries
+from app.tools_base import (
+    compressor,
+    data_store_id,
+    pack_ranked_docs,
+    retrieval_cache,
+    retriever,
+)
+
+
+async def retrieve_docs(
+    query: str, sub_queries: str = "", tool_context: ToolContext | None = None
+) -> str:
+    """
+    Etsii tietoa Samhan sisäisestä tietokannasta (RAG).
+    Käytä kun tarvitset tarkkoja faktoja: henkilöt, projektit, luvut, päivämäärät.
+    sub_queries: lisähaut puolipisteellä eroteltuina, haetaan rinnakkain
+    (esim. "STEA-rahoitus nuorille; antirasismihankkeet").
+    """
+    try:
+        queries = split_queries(query, sub_queries)
+
+        async def compute() -> list:
+            return await search_and_rerank(retriever, compressor, queries)
+
+        ranked_docs = await retrieval_cache.aget_or_compute(
+            data_store_id, "; ".join(queries), compute
+        )
+        agent = resolve_agent_name(tool_context) if tool_context else "unknown"
+        packed = pack_ranked_docs(ranked_docs, get_context_token_budget(agent), agent)
+        if tool_context is not None:
+            record_packing(tool_context.state, agent, packed)
+        return packed.text
+    except Exception as e:
+        return f"Retrieval error: {type(e).__name__}: {e}"
@@ -14,13 +14,147 @@
 # ruff: noqa
 # mypy: disable-error-code="no-untyped-def"
 
+import asyncio
+import itertools
 import os
+import threading
+import time
+import weakref
+from typing import Any, Callable, Generic, List, Optional, TypeVar
 
 from unittest.mock import MagicMock
 from langchain_google_community.vertex_rank import VertexAIRank
 from langchain_google_vertexai import VertexAIEmbeddings
 from langchain_google_community import VertexAISearchRetriever
 
+from app.archive_vectors import embedder_from_env
+from app.local_retriever import REFRESH_INTERVAL, get_local_retriever
+
+try:
+    from google.api_core.exceptions import DeadlineExceeded, ServiceUnavailable
+    # Search errors the local fallback answers; anything else (bad request,
+    # permissions) is a real error and is raised
+    TRANSIENT_ERRORS: tuple = (ServiceUnavailable, DeadlineExceeded)
+except ImportError:
+    TRANSIENT_ERRORS = ()
+
+T = TypeVar("T")
+
+# =============================================================================
+# Discovery Engine clients (process-wide)
+# =============================================================================
+# One client per channel, created on first use and reused by every
+# retrieve_docs call: the gRPC channel setup and the auth token fetch are
+# paid once per process, not per query.
+
+# Channels in the round-robin pool (one HTTP/2 connection each; a channel
+# multiplexes ~100 concurrent calls before they start queueing)
+SEARCH_CHANNELS = int(os.environ.get("DISCOVERY_SEARCH_CHANNELS", "2"))
+# host[:port]; empty = Google endpoint. localhost = plaintext stand-in (benchmarks)
+SEARCH_ENDPOINT = os.environ.get("DISCOVERY_ENGINE_ENDPOINT", "")
+
+CHANNEL_OPTIONS = [
+    # Keep idle connections open between agent turns
+    ("grpc.keepalive_time_ms", 30_000),
+    ("grpc.keepalive_timeout_ms", 10_000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.max_receive_message_length", -1),
+]
+
+_LOCAL_HOSTS = ("localhost", "127.0.0.1", "[::1]")
+
+
+class ClientPool(Generic[T]):
+    """Round-robin-pooli asiakkaita, kukin luodaan ensimmäisellä käytöllä."""
+
+    def __init__(self, factory: Callable[[], T], size: int):
+        self._factory = factory
+        self._clients: List[Optional[T]] = [None] * max(1, size)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        slot = next(self._counter) % len(self._clients)
+        client = self._clients[slot]
+        if client is None:
+            with self._lock:
+                client = self._clients[slot]
+                if client is None:
+                    client = self._clients[slot] = self._factory()
+        return client
+
+    def created(self) -> int:
+        return sum(client is not None for client in self._clients)
+
+
+def _endpoint(default_host: str) -> tuple:
+    """(host, target, plaintext) for the configured endpoint."""
+    host = SEARCH_ENDPOINT or default_host
+    target = host if ":" in host.rsplit("]", 1)[-1] else f"{host}:443"
+    return host, target, host.startswith(_LOCAL_HOSTS)
+
+
+def _new_search_client():
+    import grpc
+    from google.cloud import discoveryengine_v1 as discoveryengine
+    from google.cloud.discoveryengine_v1.services.search_service.transports import (
+        SearchServiceGrpcTransport,
+    )
+
+    host, target, plaintext = _endpoint(SearchServiceGrpcTransport.DEFAULT_HOST)
+    if plaintext:
+        channel = grpc.insecure_channel(target, options=CHANNEL_OPTIONS)
+    else:
+        channel = SearchServiceGrpcTransport.create_channel(target, options=CHANNEL_OPTIONS)
+    return discoveryengine.SearchServiceClient(
+        transport=SearchServiceGrpcTransport(host=host, channel=channel)
+    )
+
+
+def _new_async_search_client():
+    import grpc
+    from google.cloud import discoveryengine_v1 as discoveryengine
+    from google.cloud.discoveryengine_v1.services.search_service.transports import (
+        SearchServiceGrpcAsyncIOTransport,
+    )
+
+    host, target, plaintext = _endpoint(SearchServiceGrpcAsyncIOTransport.DEFAULT_HOST)
+    if plaintext:
+        channel = grpc.aio.insecure_channel(target, options=CHANNEL_OPTIONS)
+    else:
+        channel = SearchServiceGrpcAsyncIOTransport.create_channel(
+            target, options=CHANNEL_OPTIONS
+        )
+    return discoveryengine.SearchServiceAsyncClient(
+        transport=SearchServiceGrpcAsyncIOTransport(host=host, channel=channel)
+    )
+
+
+_search_clients = ClientPool(_new_search_client, SEARCH_CHANNELS)
+# grpc.aio channels belong to the event loop they were created in
+_async_search_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ClientPool]" = (
+    weakref.WeakKeyDictionary()
+)
+_async_lock = threading.Lock()
+
+
+def get_search_client():
+    """Prosessin yhteinen discoveryengine.SearchServiceClient (säieturvallinen)."""
+    return _search_clients.get()
+
+
+def get_async_search_client():
+    """SearchServiceAsyncClient kutsuvan tapahtumasilmukan omasta poolista."""
+    loop = asyncio.get_running_loop()
+    with _async_lock:
+        pool = _async_search_clients.get(loop)
+        if pool is None:
+            pool = _async_search_clients[loop] = ClientPool(
+                _new_async_search_client, SEARCH_CHANNELS
+            )
+    return pool.get()
+
 
 def get_retriever(
     project_id: str,
@@ -36,31 +170,44 @@ def get_retriever(
 
     Uses mock service if the INTEGRATION_TEST environment variable is set to "TRUE",
     otherwise initializes real Vertex AI retriever.
+
+    RETRIEVER_BACKEND=local serves kb_documents/ from the local index
+    (app.local_retriever) without network access. With LOCAL_KB_FALLBACK=1
+    (opt-in) the local index also answers when the Vertex client cannot be
+    built, or when a search is unavailable or times out. Fallback documents
+    are marked degraded, so the retrieval cache does not keep them. The local
+    index is built in the background at startup.
     """
+    if os.environ.get("RETRIEVER_BACKEND", "vertex").strip().lower() == "local":
+        # A configured embedder makes the local vector ranker semantic
+        return _build_in_background(
+            get_local_retriever(embedder=embedder_from_env(), max_documents=max_documents)
+        )
+    fallback = _local_fallback(max_documents)
     try:
         from google.cloud import discoveryengine_v1 as discoveryengine
         from langchain_core.retrievers import BaseRetriever
-        from langchain_core.callbacks import CallbackManagerForRetrieverRun
+        from langchain_core.callbacks import (
+            AsyncCallbackManagerForRetrieverRun,
+            CallbackManagerForRetrieverRun,
+        )
         from langchain_core.documents import Document
-        from typing import List
         
         class CustomVertexAISearchRetriever(BaseRetriever):
             project_id: str
             location_id: str
             data_store_id: str
             max_documents: int = 10
+            # Answers when Vertex AI Search fails (local kb_documents/ index)
+            fallback: Optional[Any] = None
             
-            def _get_relevant_documents(
-                self, query: str, *, run_manager: CallbackManagerForRetrieverRun
-            ) -> List[Document]:
-                client = discoveryengine.SearchServiceClient()
-                
+            def _search_request(self, query: str) -> "discoveryengine.SearchRequest":
                 # Construct the serving config path with 'engines' instead of 'dataStores'
                 serving_config = f"projects/{self.project_id}/locations/{self.location_id}/collections/default_collection/engines/{self.data_store_id}/servingConfigs/default_search"
                 
                 print(f"DEBUG: CustomRetriever using serving_config: {serving_config}")
                 
-                request = discoveryengine.SearchRequest(
+                return discoveryengine.SearchRequest(
                     serving_config=serving_config,
                     query=query,
                     page_size=self.max_documents,
@@ -75,11 +222,11 @@ def get_retriever(
                     query_expansion_spec={"condition": "AUTO"},
                     spell_correction_spec={"mode": "AUTO"},
                 )
-                
-                response = client.search(request)
-                
+            
+            @staticmethod
+            def _to_documents(results) -> List[Document]:
                 documents = []
-                for result in response.results:
+                for result in results:
                     content = ""
                     metadata = {"id": result.document.id, "name": result.document.name}
                     
@@ -107,27 +254,102 @@ def get_retriever(
                 
                 print(f"DEBUG: CustomRetriever found {len(documents)} documents")
                 return documents
+            
+            def _get_relevant_documents(
+                self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+            ) -> List[Document]:
+                try:
+                    response = get_search_client().search(self._search_request(query))
+                except TRANSIENT_ERRORS as e:
+                    if self.fallback is None:
+                        raise
+                    print(f"⚠️ Vertex AI Search failed ({type(e).__name__}: {e}), using local index")
+                    return self.fallback.invoke(query)
+                return self._to_documents(response.results)
+            
+            async def _aget_relevant_documents(
+                self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+            ) -> List[Document]:
+                try:
+                    response = await get_async_search_client().search(self._search_request(query))
+                except TRANSIENT_ERRORS as e:
+                    if self.fallback is None:
+                        raise
+                    print(f"⚠️ Vertex AI Search failed ({type(e).__name__}: {e}), using local index")
+                    return await self.fallback.ainvoke(query)
+                return self._to_documents(response.results)
 
         return CustomVertexAISearchRetriever(
             project_id=project_id,
             location_id=data_store_region,
             data_store_id=data_store_id,
-            max_documents=max_documents
+            max_documents=max_documents,
+            fallback=fallback,
         )
     except Exception as e:
         print(f"DEBUG: Retriever initialization ERROR: {type(e).__name__}: {e}")
         import traceback
         traceback.print_exc()
+        if fallback is not None:
+            print("DEBUG: Using local kb_documents/ index as retriever")
+            return fallback
         retriever = MagicMock()
+        # e is unbound once the except block ends
+        message = f"Retriever not available: {e}"
 
         def raise_exception(*args, **kwargs) -> None:
             """Function that raises an exception when the retriever is not available."""
-            raise Exception(f"Retriever not available: {e}")
+            raise Exception(message)
+
+        async def araise_exception(*args, **kwargs) -> None:
+            """Async version for retrieve_docs (app.retrieval_tools_async)."""
+            raise_exception()
 
         retriever.invoke = raise_exception
+        retriever.ainvoke = araise_exception
         return retriever
 
 
+def _local_fallback(max_documents: int):
+    """Local retriever for get_retriever's fallback, None when disabled or unavailable."""
+    if os.environ.get("LOCAL_KB_FALLBACK", "0") != "1":
+        return None
+    try:
+        # Answers while Vertex AI is unreachable, so it keeps the local
+        # HashingEmbedder: a hashed lexical ranker, not a semantic one
+        return _build_in_background(
+            get_local_retriever(max_documents=max_documents, fallback=True)
+        )
+    except Exception as e:
+        print(f"DEBUG: Local retriever unavailable: {type(e).__name__}: {e}")
+        return None
+
+
+def _build_in_background(retriever):
+    """
+    Index kb_documents/ at startup, then pick up changed files every
+    REFRESH_INTERVAL seconds. Queries keep searching the previous snapshot
+    while a refresh runs; a query arriving before the first build waits for it.
+    """
+
+    def build() -> None:
+        built = False
+        while True:
+            try:
+                stats = retriever.refresh()
+                if not built or stats["added"] or stats["updated"] or stats["removed"]:
+                    print(f"DEBUG: Local index ready: {stats}")
+                built = True
+            except Exception as e:
+                print(f"DEBUG: Local index refresh failed: {type(e).__name__}: {e}")
+            if REFRESH_INTERVAL <= 0:
+                return
+            time.sleep(REFRESH_INTERVAL)
+
+    threading.Thread(target=build, name="local-kb-index", daemon=True).start()
+    return retriever
+
+
 def get_compressor(project_id: str, top_n: int = 5) -> VertexAIRank:
     """
     Creates and returns an instance of the compressor service.
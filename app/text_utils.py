@@ -0,0 +1,13 @@
+"""
+Yhteiset tekstin normalisoinnit haulle ja kontekstin pakkaukselle.
+
+fold() vastaa FTS5-tokenizerin (unicode61 remove_diacritics 2) taittoa,
+joten arkiston, paikallisen tietokannan ja kontekstin pakkauksen sanat
+vertautuvat samalla tavalla.
+"""
+
+
+def fold(text: str) -> str:
+    """Pienaakkoset + skandinaaviset diakriitit pois (kuten tokenizer)."""
+    # str.replace is several times faster than str.translate here
+    return text.lower().replace("ä", "a").replace("ö", "o").replace("å", "a")
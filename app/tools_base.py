@@ -4,6 +4,9 @@ from google.genai import types as genai_types
 from langchain_google_vertexai import VertexAIEmbeddings
 from app.retrievers import get_retriever, get_compressor
 from app.hard_gates import detect_gate_signals
+from app.retrieval_cache import get_retrieval_cache
+from app.retrieval_async import compress_or_passthrough
+from app.context_packer import PackedContext, pack_context
 import ast
 import math
 import pandas as pd
@@ -40,6 +43,25 @@ retriever = get_retriever(
 )
 
 compressor = get_compressor(project_id=project_id)
+retrieval_cache = get_retrieval_cache(embed=embeddings.embed_query)
+
+def pack_ranked_docs(ranked_docs, budget: Optional[int] = None, agent: str = "") -> PackedContext:
+    """
+    retrieve_docs-vastaus: dokumentit pakattuna token-budjettiin (app.context_packer).
+
+    budget None = DEFAULT_CONTEXT_TOKEN_BUDGET (CONTEXT_TOKEN_BUDGET-ympäristömuuttuja).
+    """
+    packed = pack_context(ranked_docs, budget)
+    if packed.tokens_saved:
+        print(
+            f"📦 Context packed{f' for {agent}' if agent else ''}: {packed.tokens} tokens "
+            f"({packed.documents_out}/{packed.documents_in} docs), saved ~{packed.tokens_saved}"
+        )
+    return packed
+
+def _search_and_rank(query: str) -> list:
+    retrieved_docs = retriever.invoke(query)
+    return compress_or_passthrough(compressor, query, retrieved_docs)
 
 def retrieve_docs(query: str) -> str:
     """
@@ -47,18 +69,12 @@ def retrieve_docs(query: str) -> str:
     Käytä kun tarvitset tarkkoja faktoja: henkilöt, projektit, luvut, päivämäärät.
     """
     try:
-        retrieved_docs = retriever.invoke(query)
-        ranked_docs = compressor.compress_documents(documents=retrieved_docs, query=query)
-        
-        if not ranked_docs:
-            return "Ei löytynyt dokumentteja tähän hakuun."
-        
-        formatted_parts = ["## Context provided:"]
-        for doc in ranked_docs:
-            content = doc.page_content if hasattr(doc, 'page_content') else str(doc)
-            formatted_parts.append(f"<Document>\n{content}\n</Document>")
-        
-        return "\n".join(formatted_parts)
+        ranked_docs = retrieval_cache.get_or_compute(
+            data_store_id, query, lambda: _search_and_rank(query)
+        )
+        # No tool_context here, so no calling agent: scripts get the default
+        # budget (CONTEXT_TOKEN_BUDGET); agents use the async version
+        return pack_ranked_docs(ranked_docs).text
     except Exception as e:
         return f"Retrieval error: {type(e).__name__}: {e}"
 
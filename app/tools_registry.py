@@ -1,6 +1,5 @@
 from app.tool_ids import ToolId
 from app.tools_base import (
-    retrieve_docs,
     read_excel,
     read_csv,
     analyze_excel_summary,
@@ -11,7 +10,8 @@ from app.web_search import search_web, search_verified_sources, search_news, sea
 from app.pdf_tools import read_pdf_content, get_pdf_metadata
 from app.advanced_tools import process_meeting_transcript, generate_data_chart, schedule_samha_meeting
 from app.image_tools import generate_samha_image
-from app.archive_tools import save_to_archive, search_archive, get_archived_content
+from app.retrieval_tools_async import retrieve_docs
+from app.archive_tools_async import save_to_archive, search_archive, get_archived_content
 from app.viestinta import translate_text, format_social_post, create_newsletter_section
 
 TOOL_MAP = {
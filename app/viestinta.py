@@ -17,7 +17,8 @@ from app.prompt_packs import ORG_PACK_V1
 from app.contracts_loader import load_contract
 
 # Import Shared Tools
-from app.tools_base import retrieve_docs, LLM, LONG_OUTPUT_CONFIG
+from app.tools_base import LLM, LONG_OUTPUT_CONFIG
+from app.retrieval_tools_async import retrieve_docs
 
 # Import ImageGen tool
 from app.image_tools import generate_samha_image
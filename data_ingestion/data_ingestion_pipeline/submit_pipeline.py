@@ -16,6 +16,8 @@ import argparse
 import logging
 import os
 import sys
+import urllib.parse
+import urllib.request
 
 import backoff
 from data_ingestion_pipeline.pipeline import pipeline
@@ -89,6 +91,11 @@ def parse_args() -> argparse.Namespace:
         default=os.getenv("GCS_INPUT_PREFIX", "kb_documents/"),
         help="GCS prefix for input documents",
     )
+    parser.add_argument(
+        "--invalidate-cache-url",
+        default=os.getenv("RETRIEVAL_CACHE_INVALIDATE_URL"),
+        help="Agent service /retrieval-cache/invalidate URL, called after ingestion",
+    )
     parsed_args = parser.parse_args()
 
     # Validate required parameters
@@ -135,6 +142,17 @@ def submit_and_wait_pipeline(pipeline_job_params: dict, service_account: str) ->
     job.wait()
 
 
+def invalidate_retrieval_cache(url: str, data_store_id: str) -> None:
+    """Drop the agent service's cached retrieve_docs results for the data store."""
+    body = urllib.parse.urlencode({"data_store_id": data_store_id}).encode()
+    try:
+        with urllib.request.urlopen(url, data=body, timeout=30) as response:
+            logging.info("Retrieval cache invalidated: %s", response.read().decode())
+    except Exception as e:
+        # Stale results still expire after RETRIEVAL_CACHE_TTL
+        logging.warning(f"Retrieval cache invalidation failed: {e}")
+
+
 if __name__ == "__main__":
     args = parse_args()
 
@@ -175,6 +193,8 @@ if __name__ == "__main__":
         logging.info("Running pipeline and waiting for completion...")
         submit_and_wait_pipeline(pipeline_job_params, args.service_account)
         logging.info("Pipeline completed!")
+        if args.invalidate_cache_url:
+            invalidate_retrieval_cache(args.invalidate_cache_url, args.data_store_id)
 
     if args.cron_schedule and args.schedule_only:
         # Create pipeline job instance for scheduling
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Arkiston ylläpitokomennot.
+
+    uv run python scripts/archive_admin.py migrate-inline [--db ./archive/samha_archive.db]
+    uv run python scripts/archive_admin.py import-jsonl drafts.jsonl [--batch-size 500]
+    uv run python scripts/archive_admin.py gc-blobs [--grace 3600]
+    ARCHIVE_EMBEDDER=vertex uv run python scripts/archive_admin.py index-vectors [--rebuild]
+    uv run python scripts/archive_admin.py export-parquet ./exports/archive [--incremental]
+    uv run python scripts/archive_admin.py retention [--dry-run] [--policy retention.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from app.archive import ArchiveService, get_archive_service
+from app.archive_backends import SQLiteOnlyError, backend_name
+from app.archive_import import DEFAULT_BATCH_SIZE, import_jsonl
+from app.archive_retention import load_policy, run_retention
+from app.archive_vectors import embedder_from_env
+
+
+def cmd_migrate_inline(args: argparse.Namespace) -> None:
+    archive = ArchiveService(db_path=args.db, storage="inline")
+    stats = archive.migrate_to_inline(
+        train=not args.no_train,
+        remove_artifacts=args.remove_artifacts,
+    )
+    print(json.dumps(stats, indent=2))
+
+
+def print_progress(stats: dict) -> None:
+    total = stats["total_bytes"] or 1
+    rate = stats["imported"] / stats["seconds"] if stats["seconds"] else 0.0
+    sys.stderr.write(
+        f"\r{stats['bytes_read'] / total:6.1%}  {stats['imported']} imported, "
+        f"{stats['errors']} errors  ({rate:.0f}/s)"
+    )
+    sys.stderr.flush()
+
+
+def cmd_import_jsonl(args: argparse.Namespace) -> None:
+    archive = ArchiveService(db_path=args.db, storage=args.storage, dedup=args.dedup)
+    stats = import_jsonl(
+        archive,
+        args.path,
+        batch_size=args.batch_size,
+        state_path=args.state,
+        resume=not args.restart,
+        progress=None if args.quiet else print_progress,
+    )
+    if not args.quiet:
+        sys.stderr.write("\n")
+    print(json.dumps(stats, indent=2, ensure_ascii=False))
+
+
+def maintenance_archive(args: argparse.Namespace, operation: str) -> ArchiveService:
+    """SQLite-arkisto ylläpitokomennoille; ARCHIVE_BACKEND=postgres → SQLiteOnlyError."""
+    if backend_name() == "postgres":
+        raise SQLiteOnlyError(operation)
+    if os.environ.get("ARCHIVE_GCS_BUCKET"):
+        # Bodies and the cold tier live in the bucket: use the GCS service
+        return get_archive_service()
+    return ArchiveService(db_path=args.db)
+
+
+def cmd_gc_blobs(args: argparse.Namespace) -> None:
+    archive = maintenance_archive(args, "gc-blobs")
+    print(json.dumps(archive.gc_blobs(grace_seconds=args.grace), indent=2))
+
+
+def cmd_index_vectors(args: argparse.Namespace) -> None:
+    archive = ArchiveService(db_path=args.db, embedder=embedder_from_env())
+    indexed = archive.reindex_vectors(batch_size=args.batch_size, rebuild=args.rebuild)
+    if args.lists:
+        archive.train_vector_index(lists=args.lists)
+    print(json.dumps({"indexed": indexed, **archive.vector_stats()}, indent=2))
+
+
+def cmd_export_parquet(args: argparse.Namespace) -> None:
+    archive = maintenance_archive(args, "export-parquet")
+    stats = archive.export_parquet(
+        args.out_dir,
+        incremental=args.incremental,
+        include_content=not args.no_content,
+        progress=None if args.quiet else lambda s: sys.stderr.write(
+            f"\r{s['exported']} exported ({s['exported'] / (s['seconds'] or 1):.0f}/s)"
+        ),
+    )
+    if not args.quiet:
+        sys.stderr.write("\n")
+    print(json.dumps(stats, indent=2))
+
+
+def cmd_retention(args: argparse.Namespace) -> None:
+    archive = maintenance_archive(args, "retention")
+    report = run_retention(
+        archive,
+        load_policy(args.policy),
+        dry_run=args.dry_run,
+        compact=not args.no_compact,
+        full_vacuum=args.full_vacuum,
+    )
+    print(json.dumps(report, indent=2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default="./archive/samha_archive.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate-inline", help="move JSON artifacts into compressed BLOBs")
+    p.add_argument("--no-train", action="store_true", help="skip zstd dictionary training")
+    p.add_argument("--remove-artifacts", action="store_true", help="delete migrated JSON files")
+    p.set_defaults(func=cmd_migrate_inline)
+
+    p = sub.add_parser("import-jsonl", help="bulk import ArchiveEntry JSON lines (resumable)")
+    p.add_argument("path", help="JSONL file, one ArchiveEntry per line")
+    p.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    p.add_argument(
+        "--storage", choices=["file", "inline"],
+        default=os.environ.get("ARCHIVE_STORAGE", "file"),
+    )
+    p.add_argument("--state", help="resume state file (default: <path>.import-state)")
+    p.add_argument("--restart", action="store_true", help="ignore saved state, start from line 1")
+    p.add_argument("--quiet", action="store_true", help="no progress output")
+    p.add_argument(
+        "--dedup", action="store_true",
+        default=os.environ.get("ARCHIVE_DEDUP", "").lower() in ("1", "true", "yes"),
+        help="store bodies once by content hash",
+    )
+    p.set_defaults(func=cmd_import_jsonl)
+
+    p = sub.add_parser("gc-blobs", help="delete content blobs no entry references")
+    p.add_argument(
+        "--grace", type=float, default=3600.0,
+        help="keep blobs used within this many seconds (default 3600)",
+    )
+    p.set_defaults(func=cmd_gc_blobs)
+
+    p = sub.add_parser("index-vectors", help="embed entries missing from the vector index")
+    p.add_argument("--batch-size", type=int, default=64)
+    p.add_argument("--rebuild", action="store_true", help="drop all vectors first (new embedder)")
+    p.add_argument("--lists", type=int, help="retrain IVF with this many lists afterwards")
+    p.set_defaults(func=cmd_index_vectors)
+
+    p = sub.add_parser("export-parquet", help="partitioned Parquet snapshot for analytics")
+    p.add_argument("out_dir")
+    p.add_argument("--incremental", action="store_true", help="only rows changed since last run")
+    p.add_argument("--no-content", action="store_true", help="metadata columns only")
+    p.add_argument("--quiet", action="store_true", help="no progress output")
+    p.set_defaults(func=cmd_export_parquet)
+
+    p = sub.add_parser("retention", help="apply retention policy, tier to cold, compact")
+    p.add_argument(
+        "--policy",
+        help="policy JSON (default: $ARCHIVE_RETENTION_POLICY or the built-in, non-destructive one)"
+    )
+    p.add_argument("--dry-run", action="store_true", help="report what would change")
+    p.add_argument("--no-compact", action="store_true", help="skip gc-blobs/FTS optimize/vacuum")
+    p.add_argument(
+        "--full-vacuum", action="store_true",
+        help="one-off full VACUUM (converts databases created before auto_vacuum)"
+    )
+    p.set_defaults(func=cmd_retention)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    except SQLiteOnlyError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+"""
+Archive benchmarks.
+
+Runs against a throwaway database in a temp directory, never ./archive/.
+
+    uv run python tests/benchmarks/bench_archive.py throughput
+    uv run python tests/benchmarks/bench_archive.py projection --entries 50000
+    uv run python tests/benchmarks/bench_archive.py pagination --entries 50000
+    uv run python tests/benchmarks/bench_archive.py lineage --lineages 300 --depth 100
+    uv run python tests/benchmarks/bench_archive.py fts --entries 100000
+    uv run python tests/benchmarks/bench_archive.py tags --entries 100000
+    uv run python tests/benchmarks/bench_archive.py bulk --entries 20000
+    uv run python tests/benchmarks/bench_archive.py delta --revisions 100 --words 5000
+    uv run python tests/benchmarks/bench_archive.py stats --entries 100000
+    uv run python tests/benchmarks/bench_archive.py vectors --entries 50000
+    uv run python tests/benchmarks/bench_archive.py export --entries 1000000
+"""
+
+import argparse
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Iterator
+
+from app.archive import ArchiveEntry, ArchiveSearchQuery, ArchiveService
+from app.archive_db import close_pools
+from app.archive_import import import_jsonl
+from app.archive_vectors import HashingEmbedder
+
+DOC_TYPES = ["hakemus", "raportti", "artikkeli", "koulutus", "memo"]
+TAGS = ["nuoret", "mielenterveys", "antirasismi", "erasmus", "stea", "koulutus"]
+
+
+FINNISH_WORDS = (
+    "avustushakemus hankesuunnitelma nuorten mielenterveys osallisuus toiminta "
+    "yhdenvertaisuus koulutus vapaaehtoistyö kumppanuus raportointi budjetti "
+    "tavoite tulos arviointi ryhmätoiminta kohderyhmä päätös käsittely"
+).split()
+
+
+def make_entry(i: int, content_words: int = 300) -> ArchiveEntry:
+    return ArchiveEntry(
+        title=f"Hakemus {i}",
+        summary=f"Tiivistelmä {i}: nuorten hyvinvointi ja osallisuus.",
+        content=" ".join(
+            FINNISH_WORDS[(i * 7 + j) % len(FINNISH_WORDS)] if j % 3 == 0 else f"sana{j % 500}"
+            for j in range(content_words)
+        ),
+        document_type=DOC_TYPES[i % len(DOC_TYPES)],
+        program="stea",
+        tags=[TAGS[i % len(TAGS)], TAGS[(i + 2) % len(TAGS)]],
+        agent_name="kirjoittaja",
+    )
+
+
+class ConnectPerCall:
+    """Baseline behaviour: fresh connection per call, rollback journal."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = str(db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def write(self, fn: Callable):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                return fn(conn)
+        finally:
+            conn.close()
+
+
+def run_parallel(workers: int, n: int, fn: Callable[[int], object]) -> float:
+    """Return operations per second for n calls of fn spread over workers."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(fn, range(n)))
+    return n / (time.perf_counter() - start)
+
+
+def bench_throughput(args: argparse.Namespace) -> None:
+    print(f"{'mode':<10}{'workers':>8}{'save/s':>12}{'search/s':>12}")
+    for mode in ("before", "after"):
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as tmp:
+                db_path = Path(tmp) / "bench.db"
+                pool = ConnectPerCall(db_path) if mode == "before" else None
+                archive = ArchiveService(db_path=str(db_path), pool=pool)
+
+                counter = iter(range(10**9))
+                save_rate = run_parallel(
+                    workers, args.ops, lambda _: archive.save(make_entry(next(counter)))
+                )
+                search_rate = run_parallel(
+                    workers,
+                    args.ops,
+                    lambda i: archive.search(
+                        ArchiveSearchQuery(document_type=DOC_TYPES[i % len(DOC_TYPES)])
+                    ),
+                )
+                close_pools()
+            print(f"{mode:<10}{workers:>8}{save_rate:>12.0f}{search_rate:>12.0f}")
+
+
+def populate(
+    archive: ArchiveService, n: int, words: int = 300, workers: int = 8
+) -> None:
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda i: archive.save(make_entry(i, words)), range(n)))
+
+
+def timed(fn: Callable[[], object], reps: int) -> float:
+    """Mean wall time in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - start) * 1000 / reps
+
+
+def bench_projection(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ArchiveService(db_path=str(Path(tmp) / "bench.db"), storage=args.storage)
+        print(f"Populating {args.entries} entries ({args.storage})...")
+        populate(archive, args.entries, words=args.words)
+
+        query = ArchiveSearchQuery(document_type="hakemus", limit=100)
+        sql = timed(lambda: archive._search_rows(query, columns="id"), args.reps)
+        full = timed(lambda: archive.search(query), args.reps)
+        slim = timed(lambda: archive.search(query, fields=["title", "summary"]), args.reps)
+        close_pools()
+
+    print(f"sql only     : {sql:8.2f} ms / page of 100 (count + filter + sort)")
+    print(f"full entries : {full:8.2f} ms / page of 100")
+    print(f"projected    : {slim:8.2f} ms / page of 100  ({full / slim:.1f}x)")
+
+
+def bench_pagination(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ArchiveService(db_path=str(Path(tmp) / "bench.db"), storage="inline")
+        print(f"Populating {args.entries} entries...")
+        populate(archive, args.entries, words=50)
+        fields = ["title"]
+
+        # Walk once to collect the cursor of each page
+        cursors = [None]
+        query = ArchiveSearchQuery(limit=100, count_mode="none")
+        while True:
+            result = archive.search(query.model_copy(update={"cursor": cursors[-1]}), fields=fields)
+            if result.next_cursor is None:
+                break
+            cursors.append(result.next_cursor)
+
+        print(f"{'page':>6}{'offset+count ms':>18}{'cursor ms':>12}")
+        for page in (0, len(cursors) // 4, len(cursors) // 2, len(cursors) - 1):
+            by_offset = ArchiveSearchQuery(limit=100, offset=page * 100)
+            by_cursor = query.model_copy(update={"cursor": cursors[page]})
+            t_offset = timed(lambda: archive.search(by_offset, fields=fields), args.reps)
+            t_cursor = timed(lambda: archive.search(by_cursor, fields=fields), args.reps)
+            print(f"{page:>6}{t_offset:>18.2f}{t_cursor:>12.2f}")
+
+        start = time.perf_counter()
+        n = sum(1 for _ in archive.iter_search(ArchiveSearchQuery(), fields=fields))
+        print(f"iter_search: {n} rows in {(time.perf_counter() - start) * 1000:.0f} ms")
+        close_pools()
+
+
+def bench_lineage(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ArchiveService(db_path=str(Path(tmp) / "bench.db"), storage="inline")
+        print(f"Building {args.lineages} lineages x {args.depth} versions...")
+
+        def build(i: int) -> None:
+            entry = make_entry(i, content_words=50)
+            archive.save(entry)
+            for v in range(1, args.depth):
+                # Titles drift between versions, as real drafts do
+                entry = archive.update(entry.id, {"title": f"Hakemus {i} v{v}"})
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(build, range(args.lineages)))
+
+        group_by_title = """
+            SELECT id FROM entries WHERE 1=1
+            GROUP BY title HAVING version = MAX(version)
+            ORDER BY created_at DESC LIMIT 20
+        """
+
+        def before() -> None:
+            with archive._pool.read() as conn:
+                conn.execute(group_by_title).fetchall()
+
+        query = ArchiveSearchQuery(latest_only=True, limit=20, count_mode="none")
+        t_before = timed(before, args.reps)
+        t_after = timed(lambda: archive.search(query, fields=["title"]), args.reps)
+        t_backfill = timed(archive.backfill_lineage, 1)
+        close_pools()
+
+    print(f"GROUP BY title (before): {t_before:8.2f} ms")
+    print(f"is_latest index (after): {t_after:8.2f} ms")
+    print(f"full backfill          : {t_backfill:8.2f} ms")
+
+
+def bench_fts(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ArchiveService(db_path=str(Path(tmp) / "bench.db"), storage="inline")
+        print(f"Populating {args.entries} entries...")
+        populate(archive, args.entries, words=args.words)
+
+        print(f"{'query':<28}{'hits':>8}{'ms/page':>10}")
+        for text in args.queries:
+            query = ArchiveSearchQuery(query=text, limit=20, count_mode="cached")
+            hits = archive.search(query).total_count
+            ms = timed(lambda: archive.search(query, fields=["title"]), args.reps)
+            print(f"{text:<28}{hits:>8}{ms:>10.2f}")
+        close_pools()
+
+
+def bench_tags(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ArchiveService(db_path=str(Path(tmp) / "bench.db"), storage="inline")
+        print(f"Populating {args.entries} entries...")
+
+        def save(i: int) -> None:
+            entry = make_entry(i, content_words=20)
+            if i % 1000 == 0:
+                entry.tags.append("harvinainen")
+            archive.save(entry)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(save, range(args.entries)))
+
+        def like(tags) -> Callable[[], object]:
+            # Previous implementation: one LIKE per tag over the joined string
+            where = " AND ".join("tags LIKE ?" for _ in tags)
+            sql = f"""
+                SELECT id, title FROM entries WHERE {where}
+                ORDER BY created_at DESC, id DESC LIMIT 20
+            """
+
+            def run() -> None:
+                with archive._pool.read() as conn:
+                    conn.execute(sql, [f"%{t}%" for t in tags]).fetchall()
+            return run
+
+        print(f"{'tags':<24}{'mode':>6}{'LIKE ms':>10}{'index ms':>10}")
+        for tags, mode in (
+            (["nuoret"], "all"),
+            (["harvinainen"], "all"),
+            (["nuoret", "antirasismi"], "all"),
+            (["nuoret", "erasmus"], "all"),  # common tags, empty intersection
+            (["harvinainen", "stea"], "any"),
+        ):
+            query = ArchiveSearchQuery(tags=tags, tag_mode=mode, limit=20, count_mode="none")
+            t_like = timed(like(tags), args.reps) if mode == "all" else float("nan")
+            t_index = timed(lambda: archive.search(query, fields=["title"]), args.reps)
+            print(f"{' '.join(tags):<24}{mode:>6}{t_like:>10.2f}{t_index:>10.2f}")
+
+        # LIKE timings are bare SQL; search() itself costs about this much
+        unfiltered = ArchiveSearchQuery(limit=20, count_mode="none")
+        t_base = timed(lambda: archive.search(unfiltered, fields=["title"]), args.reps)
+        print(f"search() without filters: {t_base:.2f} ms")
+        t_facets = timed(archive.tag_facets, args.reps)
+        print(f"tag_facets (whole archive): {t_facets:.2f} ms")
+        close_pools()
+
+
+def bench_bulk(args: argparse.Namespace) -> None:
+    entries = [make_entry(i, args.words) for i in range(args.entries)]
+    modes = ("before", "loop", "save_many", "import")
+    print(f"{'storage':<10}" + "".join(f"{m + '/s':>14}" for m in modes))
+    for storage in ("file", "inline"):
+        rates = []
+        for mode in modes:
+            with tempfile.TemporaryDirectory() as tmp:
+                db_path = Path(tmp) / "bench.db"
+                # before = per-entry save() on a connection-per-call baseline
+                pool = ConnectPerCall(db_path) if mode == "before" else None
+                archive = ArchiveService(db_path=str(db_path), pool=pool, storage=storage)
+                source = Path(tmp) / "entries.jsonl"
+                if mode == "import":
+                    source.write_text(
+                        "".join(e.model_dump_json() + "\n" for e in entries), encoding="utf-8"
+                    )
+                start = time.perf_counter()
+                if mode in ("before", "loop"):
+                    for entry in entries:
+                        archive.save(entry)
+                elif mode == "save_many":
+                    for i in range(0, len(entries), args.batch_size):
+                        archive.save_many(entries[i:i + args.batch_size])
+                else:
+                    import_jsonl(archive, source, batch_size=args.batch_size)
+                rates.append(len(entries) / (time.perf_counter() - start))
+                close_pools()
+        print(f"{storage:<10}" + "".join(f"{r:>14.0f}" for r in rates)
+              + f"   save_many vs before {rates[2] / rates[0]:.1f}x, vs loop {rates[2] / rates[1]:.1f}x")
+
+
+def bench_delta(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for mode in ("full", "dedup", "delta"):
+            archive = ArchiveService(
+                db_path=str(Path(tmp) / f"{mode}.db"), storage="inline",
+                dedup=mode == "dedup", delta_chains=mode == "delta",
+            )
+            words = make_entry(0, content_words=args.words).content.split()
+            entry = make_entry(0, content_words=args.words)
+            archive.save(entry)
+            ids = [entry.id]
+            for v in range(1, args.revisions):
+                # A revision rewrites a few sentences somewhere in the draft
+                for k in range(5):
+                    words[(v * 97 + k * 13) % len(words)] = f"muutos{v}_{k}"
+                entry = archive.update(entry.id, {"content": " ".join(words)})
+                ids.append(entry.id)
+
+            with archive._pool.read() as conn:
+                stored = conn.execute("""
+                    SELECT COALESCE(SUM(LENGTH(content_blob)), 0)
+                         + (SELECT COALESCE(SUM(LENGTH(data)), 0) FROM blobs)
+                    FROM entries
+                """).fetchone()[0]
+            latencies = sorted(timed(lambda: archive.get(i), args.reps) for i in ids)
+            results[mode] = (stored, latencies[len(latencies) // 2], latencies[-1])
+            close_pools()
+
+    print(f"{args.revisions} revisions of a {args.words}-word draft (inline storage)")
+    print(f"{'mode':<8}{'stored KB':>12}{'get p50 ms':>12}{'get max ms':>12}")
+    for mode, (stored, p50, worst) in results.items():
+        print(f"{mode:<8}{stored / 1024:>12.1f}{p50:>12.2f}{worst:>12.2f}")
+
+
+def bench_stats(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ArchiveService(db_path=str(Path(tmp) / "bench.db"), storage="inline")
+        print(f"Populating {args.entries} entries...")
+        populate(archive, args.entries, words=20)
+
+        def before() -> None:
+            # The four aggregates get_stats() used to run on every call
+            with archive._pool.read() as conn:
+                conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+                for column in ("document_type", "status", "program"):
+                    conn.execute(
+                        f"SELECT {column}, COUNT(*) FROM entries GROUP BY {column}"
+                    ).fetchall()
+
+        t_before = timed(before, args.reps)
+        t_after = timed(archive.get_stats, args.reps)
+        t_histogram = timed(archive.daily_histogram, args.reps)
+        close_pools()
+
+    print(f"aggregate queries (before): {t_before:8.2f} ms")
+    print(f"entry_stats get_stats     : {t_after:8.2f} ms")
+    print(f"daily_histogram           : {t_histogram:8.2f} ms")
+
+
+def bench_vectors(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ArchiveService(
+            db_path=str(Path(tmp) / "bench.db"), storage="inline", embedder=HashingEmbedder()
+        )
+        print(f"Populating {args.entries} entries (embedded on save)...")
+        start = time.perf_counter()
+        for i in range(0, args.entries, 500):
+            archive.save_many([make_entry(j, 100) for j in range(i, min(i + 500, args.entries))])
+        save_rate = args.entries / (time.perf_counter() - start)
+
+        queries = [
+            archive.embedder.embed_query(f"nuorten {FINNISH_WORDS[i % len(FINNISH_WORDS)]} {i}")
+            for i in range(args.reps)
+        ]
+        # Untrained index: exact scan, the recall reference
+        exact = [archive._vectors.search(q, k=10) for q in queries]
+        t_scan = timed(lambda: archive._vectors.search(queries[0], k=10), args.reps)
+
+        lists = archive.train_vector_index()
+        approx = [archive._vectors.search(q, k=10) for q in queries]
+        t_ivf = timed(lambda: archive._vectors.search(queries[0], k=10), args.reps)
+        recall = sum(
+            len({i for i, _ in a} & {i for i, _ in e}) for a, e in zip(approx, exact)
+        ) / (10 * len(queries))
+
+        query = ArchiveSearchQuery(query="nuorten osallisuus", limit=20)
+        t_keyword = timed(lambda: archive.search(query, fields=["title"]), args.reps)
+        t_hybrid = timed(
+            lambda: archive.search(query, fields=["title"], mode="hybrid"), args.reps
+        )
+        close_pools()
+
+    print(f"save_many with embedding  : {save_rate:8.0f} entries/s")
+    print(f"vector top-10, full scan  : {t_scan:8.2f} ms")
+    print(f"vector top-10, IVF ({lists} lists, nprobe 8): {t_ivf:8.2f} ms  recall@10 {recall:.2f}")
+    print(f"keyword search page       : {t_keyword:8.2f} ms")
+    print(f"hybrid search page        : {t_hybrid:8.2f} ms")
+
+
+def bench_export(args: argparse.Namespace) -> None:
+    import pyarrow
+
+    start_date = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ArchiveService(db_path=str(Path(tmp) / "bench.db"), storage="inline")
+        print(f"Populating {args.entries} entries over two years...")
+        for i in range(0, args.entries, 2000):
+            archive.save_many([
+                make_entry(j, args.words).model_copy(
+                    update={"created_at": start_date + timedelta(days=730 * j / args.entries)}
+                )
+                for j in range(i, min(i + 2000, args.entries))
+            ])
+
+        full = archive.export_parquet(Path(tmp) / "export")
+        # Second full run for memory: Python heap via tracemalloc (slow), Arrow
+        # buffers via its pool (RSS would mostly show SQLite's mmap of the db)
+        tracemalloc.start()
+        archive.export_parquet(Path(tmp) / "export")
+        heap_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        arrow_peak = pyarrow.default_memory_pool().max_memory() or 0
+
+        changed = max(1, args.entries // 100)
+        with archive._pool.read() as conn:
+            ids = [row[0] for row in conn.execute("SELECT id FROM entries LIMIT ?", (changed,))]
+        for entry_id in ids:
+            archive.patch_metadata(entry_id, status="ready")
+        incremental = archive.export_parquet(Path(tmp) / "export", incremental=True)
+        size = sum(p.stat().st_size for p in (Path(tmp) / "export").rglob("*.parquet"))
+        close_pools()
+
+    print(f"full export       : {full['exported'] / full['seconds']:8.0f} entries/s, "
+          f"{full['files']} files, {size / 1e6:.1f} MB")
+    print(f"peak memory       : {heap_peak / 1e6:8.1f} MB Python heap, "
+          f"{arrow_peak / 1e6:.1f} MB Arrow")
+    print(f"incremental ({changed} changed): {incremental['seconds'] * 1000:8.1f} ms "
+          f"vs full {full['seconds'] * 1000:.0f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("throughput", help="save/search ops/s at N concurrent workers")
+    p.add_argument("--ops", type=int, default=400)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 8, 32])
+    p.set_defaults(func=bench_throughput)
+
+    p = sub.add_parser("projection", help="full vs projected search page latency")
+    p.add_argument("--entries", type=int, default=50_000)
+    p.add_argument("--storage", choices=["file", "inline"], default="file")
+    p.add_argument("--words", type=int, default=1000, help="content words per entry")
+    p.add_argument("--reps", type=int, default=20)
+    p.set_defaults(func=bench_projection)
+
+    p = sub.add_parser("pagination", help="deep-page latency: OFFSET vs keyset cursor")
+    p.add_argument("--entries", type=int, default=50_000)
+    p.add_argument("--reps", type=int, default=20)
+    p.set_defaults(func=bench_pagination)
+
+    p = sub.add_parser("lineage", help="latest_only on deep version chains")
+    p.add_argument("--lineages", type=int, default=300)
+    p.add_argument("--depth", type=int, default=100)
+    p.add_argument("--reps", type=int, default=20)
+    p.set_defaults(func=bench_lineage)
+
+    p = sub.add_parser("fts", help="ranked full-text search latency")
+    p.add_argument("--entries", type=int, default=100_000)
+    p.add_argument("--words", type=int, default=100)
+    p.add_argument("--reps", type=int, default=20)
+    p.add_argument(
+        "--queries", nargs="+",
+        default=["hakemu*", "Hakemus 4242", '"nuorten mielenterveys"', "kasittely paatos"],
+    )
+    p.set_defaults(func=bench_fts)
+
+    p = sub.add_parser("tags", help="tag-filtered listing: LIKE vs entry_tags")
+    p.add_argument("--entries", type=int, default=100_000)
+    p.add_argument("--reps", type=int, default=20)
+    p.set_defaults(func=bench_tags)
+
+    p = sub.add_parser("bulk", help="per-entry save() loop vs save_many vs JSONL import")
+    p.add_argument("--entries", type=int, default=20_000)
+    p.add_argument("--words", type=int, default=300)
+    p.add_argument("--batch-size", type=int, default=500)
+    p.set_defaults(func=bench_bulk)
+
+    p = sub.add_parser("delta", help="storage and get() latency: full copies vs delta chains")
+    p.add_argument("--revisions", type=int, default=100)
+    p.add_argument("--words", type=int, default=5000)
+    p.add_argument("--reps", type=int, default=10)
+    p.set_defaults(func=bench_delta)
+
+    p = sub.add_parser("stats", help="get_stats latency: aggregates vs materialized counters")
+    p.add_argument("--entries", type=int, default=100_000)
+    p.add_argument("--reps", type=int, default=20)
+    p.set_defaults(func=bench_stats)
+
+    p = sub.add_parser("vectors", help="vector search: full scan vs IVF, keyword vs hybrid")
+    p.add_argument("--entries", type=int, default=50_000)
+    p.add_argument("--reps", type=int, default=20)
+    p.set_defaults(func=bench_vectors)
+
+    p = sub.add_parser("export", help="Parquet export rate, memory and incremental cost")
+    p.add_argument("--entries", type=int, default=200_000)
+    p.add_argument("--words", type=int, default=100)
+    p.set_defaults(func=bench_export)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
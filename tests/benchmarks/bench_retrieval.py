@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Retrieval benchmarks.
+
+Runs against a local gRPC stand-in for the Discovery Engine SearchService,
+never the real data store.
+
+    uv run python tests/benchmarks/bench_retrieval.py clients --queries 200
+    uv run python tests/benchmarks/bench_retrieval.py fanout --delay-ms 120 --rerank-ms 150
+    uv run python tests/benchmarks/bench_retrieval.py fanout --live
+
+fanout uses the Finnish queries in tests/test_semantic_rag.py; --live runs them
+against the configured data store and ranking API (needs credentials).
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+import zlib
+from concurrent import futures
+from pathlib import Path
+from typing import Callable, List
+
+import grpc
+from google.cloud import discoveryengine_v1 as discoveryengine
+
+from app import retrievers
+from app.retrieval_async import search_and_rerank
+
+SERVING_CONFIG = (
+    "projects/bench/locations/global/collections/default_collection/"
+    "engines/bench/servingConfigs/default_search"
+)
+
+
+def timed(fn: Callable[[], object], reps: int) -> float:
+    """Mean wall time in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - start) * 1000 / reps
+
+
+def start_stand_in(results: int, delay_ms: float, corpus: int = 60) -> tuple:
+    """Local SearchService answering each query with `results` snippets out of `corpus`."""
+
+    def search(request, context):
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        # Deterministic per query, overlapping between queries
+        first = zlib.crc32(request.query.encode("utf-8"))
+        ids = [(first + i * 7) % corpus for i in range(results)]
+        return discoveryengine.SearchResponse(results=[
+            {
+                "id": f"doc{i}",
+                "document": {
+                    "id": f"doc{i}",
+                    "name": f"doc{i}",
+                    "derived_struct_data": {
+                        "snippets": [{"snippet": f"Nuorten osallisuus, katkelma {i}."}],
+                        "link": f"gs://bench/doc{i}.pdf",
+                    },
+                },
+            }
+            for i in ids
+        ])
+
+    handler = grpc.method_handlers_generic_handler(
+        "google.cloud.discoveryengine.v1.SearchService",
+        {
+            "Search": grpc.unary_unary_rpc_method_handler(
+                search,
+                request_deserializer=discoveryengine.SearchRequest.deserialize,
+                response_serializer=discoveryengine.SearchResponse.serialize,
+            )
+        },
+    )
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=32))
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    return server, f"127.0.0.1:{port}"
+
+
+def bench_clients(args: argparse.Namespace) -> None:
+    server, endpoint = start_stand_in(args.results, args.delay_ms)
+    retrievers.SEARCH_ENDPOINT = endpoint
+    request = discoveryengine.SearchRequest(
+        serving_config=SERVING_CONFIG, query="nuorten osallisuus", page_size=args.results
+    )
+    try:
+        def cold() -> None:
+            # What _get_relevant_documents did before: a new client (and channel) per query
+            client = retrievers._new_search_client()
+            client.search(request)
+            client.transport.close()
+
+        def warm() -> None:
+            retrievers.get_search_client().search(request)
+
+        warm()  # connect once, like the first query of the process
+        print(f"Sync, {args.queries} queries ({args.results} results, {args.delay_ms} ms server time):")
+        print(f"  new client per query: {timed(cold, args.queries):7.2f} ms/query")
+        print(f"  shared client pool:   {timed(warm, args.queries):7.2f} ms/query "
+              f"({retrievers.SEARCH_CHANNELS} channels)")
+
+        async def fan_out() -> float:
+            await retrievers.get_async_search_client().search(request)
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                retrievers.get_async_search_client().search(request)
+                for _ in range(args.queries)
+            ))
+            return (time.perf_counter() - start) * 1000
+
+        elapsed = asyncio.run(fan_out())
+        print(f"Async, {args.queries} concurrent queries on the shared pool:")
+        print(f"  total {elapsed:.1f} ms, {args.queries / elapsed * 1000:,.0f} queries/s")
+    finally:
+        server.stop(grace=None)
+
+
+class LocalRanker:
+    """Stand-in for VertexAIRank: fixed latency, deterministic relevance_score."""
+
+    def __init__(self, delay_ms: float, top_n: int = 5):
+        self.delay_ms = delay_ms
+        self.top_n = top_n
+
+    def compress_documents(self, documents, query):
+        time.sleep(self.delay_ms / 1000)
+        for doc in documents:
+            key = f"{query}|{doc.metadata['id']}".encode("utf-8")
+            doc.metadata["relevance_score"] = zlib.crc32(key) % 1000 / 1000
+        return sorted(documents, key=lambda d: d.metadata["relevance_score"], reverse=True)[:self.top_n]
+
+
+def sub_queries(test: dict) -> List[str]:
+    """Main query + the topics of its expected intent ("Trauma + youth work → ...")."""
+    topics = test["intent"].split("→")[0]
+    return [test["query"], *(t.strip() for t in topics.split("+") if t.strip())]
+
+
+def bench_fanout(args: argparse.Namespace) -> None:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from test_semantic_rag import SEMANTIC_QUERIES
+
+    server = None
+    if args.live:
+        from app.tools_base import compressor, retriever
+    else:
+        server, endpoint = start_stand_in(10, args.delay_ms)
+        retrievers.SEARCH_ENDPOINT = endpoint
+        retriever = retrievers.get_retriever(
+            project_id="bench", data_store_id="bench", data_store_region="global",
+            embedding=None, max_documents=10,
+        )
+        compressor = LocalRanker(args.rerank_ms)
+    groups = [sub_queries(test) for test in SEMANTIC_QUERIES]
+    calls = sum(len(group) for group in groups)
+    try:
+        retriever.invoke(groups[0][0])  # connect once
+
+        def serial() -> None:
+            # Before: one blocking retrieve_docs call (search + rerank) per sub-query
+            for group in groups:
+                for query in group:
+                    compressor.compress_documents(documents=retriever.invoke(query), query=query)
+
+        start = time.perf_counter()
+        serial()
+        serial_ms = (time.perf_counter() - start) * 1000
+
+        async def fanned_out() -> float:
+            await retriever.ainvoke(groups[0][0])
+            start = time.perf_counter()
+            for group in groups:
+                await search_and_rerank(retriever, compressor, group)
+            return (time.perf_counter() - start) * 1000
+
+        fanout_ms = asyncio.run(fanned_out())
+
+        async def concurrent_agents() -> float:
+            await retriever.ainvoke(groups[0][0])
+            start = time.perf_counter()
+            await asyncio.gather(*(search_and_rerank(retriever, compressor, g) for g in groups))
+            return (time.perf_counter() - start) * 1000
+
+        concurrent_ms = asyncio.run(concurrent_agents())
+
+        print(f"{len(groups)} questions, {calls} sub-queries (tests/test_semantic_rag.py):")
+        print(f"  serial search + rerank per sub-query: {serial_ms / len(groups):7.1f} ms/question "
+              f"({calls} rerank calls)")
+        print(f"  async fan-out + RRF + batched rerank: {fanout_ms / len(groups):7.1f} ms/question "
+              f"({len(groups)} parallel rerank rounds)")
+        print(f"  all questions concurrently:           {concurrent_ms:7.1f} ms total")
+    finally:
+        if server is not None:
+            server.stop(grace=None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("clients", help="per-query latency: new client per query vs shared pool")
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--results", type=int, default=10)
+    p.add_argument("--delay-ms", type=float, default=0.0)
+    p.set_defaults(func=bench_clients)
+
+    p = sub.add_parser("fanout", help="serial retrieve+rerank vs async fan-out with RRF")
+    p.add_argument("--delay-ms", type=float, default=120.0, help="stand-in search latency")
+    p.add_argument("--rerank-ms", type=float, default=150.0, help="stand-in rerank latency")
+    p.add_argument("--live", action="store_true", help="use the real data store and ranker")
+    p.set_defaults(func=bench_fanout)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
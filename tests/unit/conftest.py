@@ -0,0 +1,15 @@
+"""Shared fixtures for the archive tests (tests/unit/test_archive*.py)."""
+
+from pathlib import Path
+
+import pytest
+
+from app.archive import ArchiveService
+from app.archive_db import close_pools
+
+
+@pytest.fixture
+def archive(tmp_path: Path):
+    service = ArchiveService(db_path=str(tmp_path / "archive.db"))
+    yield service
+    close_pools()
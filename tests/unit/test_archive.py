@@ -0,0 +1,818 @@
+"""Unit tests for the SQLite archive (app/archive.py, app/archive_db.py)."""
+
+import threading
+from pathlib import Path
+
+import pytest
+
+from app import archive_vectors
+from app.archive import ArchiveEntry, ArchiveSearchQuery, ArchiveService
+from app.archive_db import SQLitePool, close_pools
+from app.archive_vectors import HashingEmbedder, VectorIndex
+
+
+def test_save_get_roundtrip(archive: ArchiveService) -> None:
+    entry = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    assert archive.save(entry) == entry.id
+
+    loaded = archive.get(entry.id)
+    assert loaded is not None
+    assert loaded.title == entry.title
+    assert loaded.content == entry.content
+    assert archive.get("art_missing") is None
+
+
+def test_database_uses_wal(archive: ArchiveService) -> None:
+    with archive._pool.read() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_concurrent_saves_and_searches(archive: ArchiveService) -> None:
+    errors = []
+
+    def worker(n: int) -> None:
+        try:
+            for i in range(10):
+                archive.save(ArchiveEntry(
+                    title=f"Raportti {n}-{i}",
+                    summary="Hakemus nuorten mielenterveystyöhön.",
+                    content="Hankkeen tavoitteena on tukea nuoria.",
+                    document_type="raportti",
+                    agent_name="kirjoittaja",
+                ))
+                archive.search(ArchiveSearchQuery(document_type="raportti"))
+        except Exception as e:  # pragma: no cover - surfaced below
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert archive.get_stats()["by_type"] == {"raportti": 80}
+
+
+def test_failed_write_does_not_abort_batch(tmp_path: Path) -> None:
+    pool = SQLitePool(tmp_path / "pool.db")
+    pool.write(lambda conn: conn.execute("CREATE TABLE t (x INTEGER PRIMARY KEY)"))
+    pool.write(lambda conn: conn.execute("INSERT INTO t VALUES (1)"))
+
+    with pytest.raises(Exception):
+        pool.write(lambda conn: conn.execute("INSERT INTO t VALUES (1)"))
+    pool.write(lambda conn: conn.execute("INSERT INTO t VALUES (2)"))
+
+    with pool.read() as conn:
+        assert [r[0] for r in conn.execute("SELECT x FROM t ORDER BY x")] == [1, 2]
+    pool.close()
+
+
+def test_read_block_sees_one_snapshot(tmp_path: Path) -> None:
+    pool = SQLitePool(tmp_path / "pool.db")
+    pool.write(lambda conn: conn.execute("CREATE TABLE t (x INTEGER PRIMARY KEY)"))
+
+    with pool.read() as conn:
+        before = conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+        pool.write(lambda conn: conn.execute("INSERT INTO t VALUES (1)"))
+        with pool.read() as nested:
+            assert nested.execute("SELECT COUNT(*) FROM t").fetchone()[0] == before == 0
+    with pool.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+    pool.close()
+
+
+def test_dead_thread_readers_are_reaped(tmp_path: Path) -> None:
+    pool = SQLitePool(tmp_path / "pool.db")
+
+    def read() -> None:
+        with pool.read() as conn:
+            conn.execute("SELECT 1").fetchone()
+
+    for _ in range(5):
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+    read()
+
+    # Every finished worker's connection was closed when the next reader connected
+    assert list(pool._readers) == [threading.current_thread()]
+    pool.close()
+
+
+def test_inline_storage_skips_artifact_files(tmp_path: Path) -> None:
+    archive = ArchiveService(db_path=str(tmp_path / "inline.db"), storage="inline")
+    entry = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Äänestys ja yhdenvertaisuus. " * 50,
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        program="stea",
+    )
+    archive.save(entry)
+
+    assert list(archive.artifacts_dir.iterdir()) == []
+    assert archive.get(entry.id) == entry
+    assert archive.search(ArchiveSearchQuery(program="stea")).entries == [entry]
+    close_pools()
+
+
+def test_migrate_to_inline(tmp_path: Path) -> None:
+    db_path = str(tmp_path / "migrate.db")
+    legacy = ArchiveService(db_path=db_path)
+    entries = [ArchiveEntry(
+        title=f"Raportti {i}",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ) for i in range(3)]
+    for entry in entries:
+        legacy.save(entry)
+
+    archive = ArchiveService(db_path=db_path, storage="inline")
+    stats = archive.migrate_to_inline(train=False, remove_artifacts=True)
+
+    assert stats["migrated"] == 3
+    assert list(archive.artifacts_dir.iterdir()) == []
+    assert [archive.get(e.id) for e in entries] == entries
+    close_pools()
+
+
+def test_search_projection_returns_slim_rows(archive: ArchiveService) -> None:
+    entry = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save(entry)
+
+    result = archive.search(ArchiveSearchQuery(), fields=["title", "tags", "created_at"])
+    (view,) = result.entries
+    assert view.id == entry.id
+    assert view.title == entry.title
+    assert view.tags == entry.tags
+    assert view.created_at == entry.created_at
+    assert view.summary is None
+
+    with pytest.raises(ValueError):
+        archive.search(ArchiveSearchQuery(), fields=["content"])
+
+
+def test_keyset_pagination_and_iter_search(archive: ArchiveService) -> None:
+    saved = {archive.save(ArchiveEntry(
+        title=f"Muistio {i}",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="memo",
+        agent_name="kirjoittaja",
+    )) for i in range(25)}
+
+    seen = []
+    query = ArchiveSearchQuery(document_type="memo", limit=10)
+    while True:
+        result = archive.search(query, fields=["title"])
+        assert result.total_count == 25
+        seen.extend(view.id for view in result.entries)
+        if result.next_cursor is None:
+            break
+        query = query.model_copy(update={"cursor": result.next_cursor})
+
+    assert len(seen) == len(set(seen)) == 25
+    assert set(seen) == saved
+    assert [e.id for e in archive.iter_search(ArchiveSearchQuery(), batch_size=7)] == seen
+
+
+def test_cached_count_invalidated_by_write(archive: ArchiveService) -> None:
+    query = ArchiveSearchQuery(count_mode="cached")
+    archive.save(ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ))
+    assert archive.search(query).total_count == 1
+    archive.save(ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ))
+    assert archive.search(query).total_count == 2
+    assert archive.search(ArchiveSearchQuery(count_mode="none")).total_count is None
+
+
+def test_latest_only_follows_lineage_across_title_changes(
+    archive: ArchiveService
+) -> None:
+    first = ArchiveEntry(
+        title="Luonnos",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save(first)
+    second = archive.update(first.id, {"title": "STEA-hakemus, versio 2"})
+    third = archive.update(second.id, {"title": "STEA-hakemus, lopullinen"})
+    other = ArchiveEntry(
+        title="Erillinen muistio",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="memo",
+        agent_name="kirjoittaja",
+    )
+    archive.save(other)
+
+    latest = archive.list_latest()
+    assert {e.id for e in latest} == {third.id, other.id}
+    assert archive.search(ArchiveSearchQuery(latest_only=True)).total_count == 2
+
+
+def test_backfill_lineage(archive: ArchiveService) -> None:
+    first = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save(first)
+    second = archive.update(first.id, {"status": "ready"})
+    archive._pool.write(lambda conn: conn.execute("UPDATE entries SET root_id = NULL, is_latest = 1"))
+
+    assert archive.backfill_lineage() == 2
+    with archive._pool.read() as conn:
+        rows = {r["id"]: (r["root_id"], r["is_latest"]) for r in conn.execute("SELECT * FROM entries")}
+    assert rows == {first.id: (first.id, 0), second.id: (first.id, 1)}
+
+
+def test_fulltext_search_ranks_and_highlights(archive: ArchiveService) -> None:
+    body_hit = ArchiveEntry(
+        title="Vuosiraportti",
+        summary="Toiminnan yhteenveto.",
+        content="Raportissa kuvataan avustushakemuksen käsittely ja päätös.",
+        document_type="raportti",
+        agent_name="kirjoittaja",
+    )
+    title_hit = ArchiveEntry(
+        title="Hakemus Erasmus+",
+        summary="Lyhyt kuvaus.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save(body_hit)
+    archive.save(title_hit)
+    archive.save(ArchiveEntry(
+        title="Some-postaus",
+        summary="Kevään tapahtumat.",
+        content="Tervetuloa!",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ))
+
+    result = archive.search(ArchiveSearchQuery(query="hakemu*"))
+    assert [e.id for e in result.entries] == [title_hit.id, body_hit.id]
+    assert result.total_count == 2
+    assert "**" in result.snippets[body_hit.id]
+
+    # Diacritic folding and phrase queries
+    assert archive.search(ArchiveSearchQuery(query="kasittely")).total_count == 1
+    assert archive.search(ArchiveSearchQuery(query='"kevään tapahtumat"')).total_count == 1
+    # Punctuation in free text does not break the FTS5 query
+    assert archive.search(ArchiveSearchQuery(query="Erasmus+")).total_count == 1
+
+
+def test_relevance_ranks_all_matches_and_window_is_stable(
+    archive: ArchiveService, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    best = ArchiveEntry(
+        title="Hakemus hakemus hakemus",
+        summary="",
+        content="",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save(best)
+    newer = [
+        ArchiveEntry(
+            title=f"Muistio {i}",
+            summary="",
+            content=f"Liite hakemus {i} ja muuta tekstiä.",
+            document_type="hakemus",
+            agent_name="kirjoittaja",
+        )
+        for i in range(6)
+    ]
+    for entry in newer:
+        archive.save(entry)
+
+    # The oldest entry is the best bm25 match and leads page 1
+    assert archive.search(ArchiveSearchQuery(query="hakemus", limit=2)).entries[0].id == best.id
+
+    monkeypatch.setattr(ArchiveService, "RANK_WINDOW", 4)
+    pages = [
+        archive.search(ArchiveSearchQuery(query="hakemus", limit=3, offset=offset))
+        for offset in (0, 3)
+    ]
+    ids = [e.id for page in pages for e in page.entries]
+    assert pages[0].total_count == 4
+    assert len(ids) == len(set(ids)) == 4
+    assert set(ids) == {e.id for e in newer[-4:]}
+
+
+def test_resave_and_update_keep_fts_in_sync(archive: ArchiveService) -> None:
+    entry = ArchiveEntry(
+        title="Alkuperäinen otsikko",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save(entry)
+    archive.save(entry.model_copy(update={"title": "Korjattu otsikko"}))
+
+    assert archive.search(ArchiveSearchQuery(query="alkuperäinen")).total_count == 0
+    assert archive.search(ArchiveSearchQuery(query="korjattu")).total_count == 1
+    with archive._pool.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM entries_fts").fetchone()[0] == 1
+
+
+@pytest.mark.parametrize("selective_rows", [1000, 1])  # index-driven / per-row probes
+def test_tag_filter_and_or_without_substring_matches(
+    archive: ArchiveService, selective_rows: int
+) -> None:
+    archive.SELECTIVE_TAG_ROWS = selective_rows
+    both = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        tags=["AI", "nuoret"],
+    )
+    ai_only = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        tags=["ai"],
+    )
+    kaikki = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        tags=["kaikki", "nuoret"],
+    )
+    for entry in (both, ai_only, kaikki):
+        archive.save(entry)
+
+    def ids(**kwargs) -> set:
+        result = archive.search(ArchiveSearchQuery(**kwargs), fields=["title"])
+        return {e.id for e in result.entries}
+
+    assert ids(tags=["ai"]) == {both.id, ai_only.id}
+    assert ids(tags=["ai", "nuoret"]) == {both.id}
+    assert ids(tags=["ai", "nuoret"], tag_mode="any") == {both.id, ai_only.id, kaikki.id}
+
+    # Re-saving with new tags replaces the old tag rows
+    archive.save(kaikki.model_copy(update={"tags": ["ai"]}))
+    assert ids(tags=["nuoret"]) == {both.id}
+
+
+def test_tag_facets_and_legacy_backfill(archive: ArchiveService) -> None:
+    archive.save(ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        tags=["nuoret", "stea"],
+    ))
+    archive.save(ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="raportti",
+        agent_name="kirjoittaja",
+        tags=["nuoret"],
+    ))
+    archive.save(ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="raportti",
+        agent_name="kirjoittaja",
+        tags=["erasmus"],
+    ))
+
+    assert archive.tag_facets() == {"nuoret": 2, "erasmus": 1, "stea": 1}
+    assert archive.tag_facets(ArchiveSearchQuery(document_type="raportti")) == {
+        "erasmus": 1, "nuoret": 1
+    }
+
+    # A database from before entry_tags gets the table filled on open
+    archive._pool.write(lambda conn: conn.execute("DROP TABLE entry_tags"))
+    reopened = ArchiveService(db_path=str(archive.db_path))
+    assert reopened.tag_facets(limit=1) == {"nuoret": 2}
+
+
+@pytest.mark.parametrize("storage", ["file", "inline"])
+def test_save_many_one_transaction(tmp_path: Path, storage: str) -> None:
+    archive = ArchiveService(db_path=str(tmp_path / "archive.db"), storage=storage)
+    first = ArchiveEntry(
+        title="Versio 1",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        tags=["stea"],
+    )
+    second = ArchiveEntry(
+        title="Versio 2",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        parent_id=first.id,
+        version=2,
+        tags=["stea"],
+    )
+    other = ArchiveEntry(
+        title="Muistio",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Kumppanuusverkoston kokous.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        tags=["nuoret", "mielenterveys"],
+    )
+
+    generation = archive._pool.generation
+    assert archive.save_many([first, second, other]) == [first.id, second.id, other.id]
+    assert archive._pool.generation == generation + 1
+
+    latest = archive.search(ArchiveSearchQuery(latest_only=True), fields=["title"])
+    assert {e.title for e in latest.entries} == {"Versio 2", "Muistio"}
+    assert archive.tag_facets() == {"mielenterveys": 1, "nuoret": 1, "stea": 2}
+    assert archive.search(ArchiveSearchQuery(query="verkosto*")).entries[0].id == other.id
+    assert archive.get(second.id).content == second.content
+    close_pools()
+
+
+@pytest.mark.parametrize("storage", ["file", "inline"])
+def test_dedup_shares_bodies_between_versions(tmp_path: Path, storage: str) -> None:
+    archive = ArchiveService(db_path=str(tmp_path / "archive.db"), storage=storage, dedup=True)
+    draft = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Pitkä hakemusteksti. " * 200,
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save(draft)
+    # Identical draft from a retried call
+    retry = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content=draft.content,
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save(retry)
+    approved = archive.update(draft.id, {"status": "ready"})
+
+    stats = archive.blob_stats()
+    assert stats["count"] == 1
+    assert stats["bytes"] == len(draft.content.encode("utf-8"))
+    assert stats["entries"] == 3
+    for entry_id in (draft.id, retry.id, approved.id):
+        assert archive.get(entry_id).content == draft.content
+    assert archive.get(approved.id).status == "ready"
+    assert archive.search(ArchiveSearchQuery(query="hakemusteksti")).total_count == 3
+
+    # Unreferenced blobs go once the grace period has passed
+    archive._pool.write(lambda conn: conn.execute("DELETE FROM entries"))
+    assert archive.gc_blobs(grace_seconds=3600)["deleted"] == 0
+    assert archive.gc_blobs(grace_seconds=0) == {
+        "deleted": 1, "bytes": len(draft.content.encode("utf-8"))
+    }
+    assert archive.blob_stats()["count"] == 0
+    close_pools()
+
+
+@pytest.mark.parametrize("storage", ["file", "inline"])
+def test_delta_chain_versions_round_trip(tmp_path: Path, storage: str) -> None:
+    archive = ArchiveService(
+        db_path=str(tmp_path / "archive.db"), storage=storage, delta_chains=True
+    )
+    paragraphs = [f"Kappale {i}: hankkeen tavoitteet ja toimenpiteet nuorille." for i in range(200)]
+    entry = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="\n".join(paragraphs),
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save(entry)
+    versions = [entry]
+    for i in range(40):
+        paragraphs[i * 3] = f"Kappale {i * 3}: muokattu versiossa {i + 2}."
+        versions.append(archive.update(versions[-1].id, {"content": "\n".join(paragraphs)}))
+
+    for version in versions:
+        assert archive.get(version.id).content == version.content
+
+    stats = archive.blob_stats()
+    snapshots = stats["count"] - stats["deltas"]
+    assert snapshots == -(-len(versions) // ArchiveService.DELTA_SNAPSHOT_INTERVAL)
+    assert stats["stored_bytes"] < stats["bytes"] / 20
+    with archive._pool.read() as conn:
+        assert conn.execute("SELECT MAX(depth) FROM blobs").fetchone()[0] < (
+            ArchiveService.DELTA_SNAPSHOT_INTERVAL
+        )
+
+    assert [v.version for v in archive.lineage(versions[5].id)] == list(range(1, 42))
+    diff = archive.diff(versions[0].id, versions[2].id)
+    assert "-Kappale 0: hankkeen tavoitteet ja toimenpiteet nuorille." in diff
+    assert "+Kappale 3: muokattu versiossa 3." in diff
+    assert archive.diff(versions[1].id, versions[1].id) == ""
+    with pytest.raises(ValueError):
+        archive.diff(entry.id, archive.save(ArchiveEntry(
+            title="STEA-hakemus 2026",
+            summary="Hakemus nuorten mielenterveystyöhön.",
+            content="Hankkeen tavoitteena on tukea nuoria.",
+            document_type="hakemus",
+            agent_name="kirjoittaja",
+        )))
+
+    # Bases of live deltas are kept by gc even without a referencing entry
+    archive._pool.write(lambda conn: conn.execute(
+        "DELETE FROM entries WHERE id = ?", (versions[0].id,)
+    ))
+    assert archive.gc_blobs(grace_seconds=0)["deleted"] == 0
+    assert archive.get(versions[1].id).content == versions[1].content
+    close_pools()
+
+
+@pytest.mark.parametrize("storage", ["file", "inline"])
+def test_patch_metadata_in_place(tmp_path: Path, storage: str) -> None:
+    archive = ArchiveService(db_path=str(tmp_path / "archive.db"), storage=storage)
+    entry = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        tags=["nuoret"],
+    )
+    archive.save(entry)
+    artifact = archive.artifacts_dir / f"{entry.id}.json"
+    written = artifact.read_bytes() if storage == "file" else None
+
+    assert archive.patch_metadata(
+        entry.id, status="ready", qa_decision="approve", tags=["nuoret", "Paikka Auki", "mielenterveyspalvelut"]
+    )
+    assert archive.patch_metadata(entry.id, qa_report_id="qa_1")
+
+    loaded = archive.get(entry.id)
+    assert (loaded.status, loaded.qa_decision, loaded.qa_report_id) == ("ready", "approve", "qa_1")
+    assert loaded.tags == ["nuoret", "Paikka Auki", "mielenterveyspalvelut"]
+    assert loaded.content == entry.content
+    assert loaded.updated_at > entry.updated_at
+    # No new version, no artifact rewrite
+    assert archive.search(ArchiveSearchQuery()).total_count == 1
+    if storage == "file":
+        assert artifact.read_bytes() == written
+
+    assert archive.search(ArchiveSearchQuery(status="ready", tags=["paikka auki"])).total_count == 1
+    assert archive.search(ArchiveSearchQuery(approved_only=True)).total_count == 1
+    assert archive.search(ArchiveSearchQuery(query="palvelut")).total_count == 1
+    assert archive.tag_facets() == {"mielenterveyspalvelut": 1, "nuoret": 1, "paikka auki": 1}
+
+    # A new version starts from the patched metadata
+    updated = archive.update(entry.id, {"content": "Uusi sisältö."})
+    assert (updated.status, updated.qa_report_id) == ("ready", "qa_1")
+
+    with pytest.raises(ValueError):
+        archive.patch_metadata(entry.id, content="ei näin")
+    with pytest.raises(ValueError):
+        archive.patch_metadata(entry.id, status="valmis")
+    assert archive.patch_metadata("art_missing", status="ready") is False
+    close_pools()
+
+
+def test_materialized_stats_follow_writes(archive: ArchiveService) -> None:
+    first = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="yksi kaksi kolme",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        program="stea",
+    )
+    other = ArchiveEntry(
+        title="STEA-hakemus 2026",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="raportti",
+        agent_name="analyytikko",
+        program="stea",
+        project="jalma",
+    )
+    archive.save_many([first, other])
+    archive.update(first.id, {"content": "yksi kaksi"})
+    archive.patch_metadata(other.id, status="ready")
+    archive.save(first.model_copy(update={"program": "erasmus"}))  # upsert of an existing id
+
+    def aggregated() -> dict:
+        with archive._pool.read() as conn:
+            def group(column: str) -> dict:
+                return dict(conn.execute(
+                    f"SELECT {column}, COUNT(*) FROM entries GROUP BY {column}"
+                ).fetchall())
+            return {
+                "total_entries": conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+                "total_words": conn.execute("SELECT SUM(word_count) FROM entries").fetchone()[0],
+                "by_type": group("document_type"),
+                "by_status": group("status"),
+                "by_program": group("program"),
+                "by_project": group("project"),
+                "by_agent": group("agent_name"),
+            }
+
+    assert archive.get_stats() == aggregated()
+    assert archive.get_stats()["by_program"] == {"erasmus": 1, "stea": 2}
+    day = first.created_at.date().isoformat()
+    assert archive.daily_histogram() == [{"day": day, "entries": 3, "words": 3 + 2 + 5}]
+    assert archive.daily_histogram(date_from="2099-01-01") == []
+
+    archive._pool.write(lambda conn: conn.execute("DELETE FROM entries WHERE id = ?", (other.id,)))
+    assert archive.get_stats() == aggregated()
+
+    # A database from before entry_stats is counted on open
+    archive._pool.write(lambda conn: conn.execute("DROP TABLE entry_stats"))
+    for trigger in ("entry_stats_ai", "entry_stats_ad", "entry_stats_au"):
+        archive._pool.write(lambda conn: conn.execute(f"DROP TRIGGER {trigger}"))
+    reopened = ArchiveService(db_path=str(archive.db_path))
+    assert reopened.get_stats() == aggregated()
+
+
+@pytest.fixture
+def semantic(tmp_path: Path):
+    service = ArchiveService(db_path=str(tmp_path / "archive.db"), embedder=HashingEmbedder())
+    yield service
+    close_pools()
+
+
+def test_hybrid_search_finds_differently_worded_entries(
+    semantic: ArchiveService
+) -> None:
+    match = ArchiveEntry(
+        title="Nuorisotyön kehittämishanke",
+        summary="Syrjäytymisen ehkäiseminen",
+        content="Tuemme syrjäytymisvaarassa olevia nuoria kohtaamispaikoissa.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        tags=[],
+    )
+    other = ArchiveEntry(
+        title="Vuosiraportti",
+        summary="Talous",
+        content="Tilinpäätös ja budjetti.",
+        document_type="raportti",
+        agent_name="kirjoittaja",
+        tags=[],
+    )
+    semantic.save_many([match, other])
+    query = ArchiveSearchQuery(query="syrjäytyminen nuorisotyö")
+
+    assert semantic.search(query).entries == []
+    result = semantic.search(query, mode="hybrid")
+    assert result.entries[0].id == match.id
+    assert result.total_count == 2
+    # Filters apply to the vector leg too
+    filtered = semantic.search(query.model_copy(update={"document_type": "raportti"}), mode="vector")
+    assert [e.id for e in filtered.entries] == [other.id]
+
+
+def test_vector_index_is_incremental_and_trainable(semantic: ArchiveService) -> None:
+    entries = [
+        ArchiveEntry(
+            title=f"Hakemus {i}",
+            summary="Hakemus nuorten mielenterveystyöhön.",
+            content=f"Aihe {i}: " + " ".join(["nuoret"] * i),
+            document_type="hakemus",
+            agent_name="kirjoittaja",
+        )
+        for i in range(40)
+    ]
+    semantic.save_many(entries[:20])
+    semantic.save_many(entries[20:])
+    assert semantic.vector_stats()["vectors"] == 40
+
+    assert semantic.train_vector_index(lists=4) == 4
+    semantic.save(ArchiveEntry(
+        title="Kesäleiri",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Leiri lapsille",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ))
+    stats = semantic.vector_stats()
+    assert stats == {"vectors": 41, "lists": 4, "trained_count": 40}
+
+    result = semantic.search(ArchiveSearchQuery(query="kesäleirit", mode="vector", limit=1))
+    assert result.entries[0].title == "Kesäleiri"
+    with pytest.raises(ValueError):
+        semantic.search(ArchiveSearchQuery(query="leiri", cursor="x"), mode="hybrid")
+
+
+def test_search_never_trains_and_training_is_single_flight(
+    semantic: ArchiveService, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(archive_vectors, "IVF_MIN_VECTORS", 4)
+    release = threading.Event()
+    runs = []
+    train = VectorIndex._train
+
+    def slow_train(self, lists, seed):
+        runs.append(threading.current_thread().name)
+        release.wait(5)
+        return train(self, lists, seed)
+
+    monkeypatch.setattr(VectorIndex, "_train", slow_train)
+    semantic.save_many([ArchiveEntry(
+        title=f"Hakemus {i}",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ) for i in range(4)])
+    # Searches and saves while k-means runs: brute force, no second run
+    query = ArchiveSearchQuery(query="hakemus", mode="vector")
+    assert semantic.search(query).total_count == 4
+    semantic.save(ArchiveEntry(
+        title="Hakemus 4",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ))
+    release.set()
+    with semantic._vectors._training:
+        pass
+
+    assert runs == ["vector-index-train"]
+    assert semantic.vector_stats()["lists"] > 0
+
+
+def test_iter_search_pages_vector_results_by_offset(semantic: ArchiveService) -> None:
+    entries = [ArchiveEntry(
+        title=f"Hakemus {i}",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ) for i in range(5)]
+    semantic.save_many(entries)
+
+    found = list(semantic.iter_search(ArchiveSearchQuery(query="hakemus", mode="hybrid"), batch_size=2))
+
+    assert sorted(e.id for e in found) == sorted(e.id for e in entries)
+
+
+def test_reindex_vectors_backfills_existing_archive(tmp_path: Path) -> None:
+    db_path = str(tmp_path / "archive.db")
+    plain = ArchiveService(db_path=db_path)
+    entries = [ArchiveEntry(
+        title=f"Raportti {i}",
+        summary="Hakemus nuorten mielenterveystyöhön.",
+        content="Hankkeen tavoitteena on tukea nuoria.",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ) for i in range(5)]
+    plain.save_many(entries)
+    with pytest.raises(ValueError):
+        plain.search(ArchiveSearchQuery(query="raportti"), mode="hybrid")
+
+    semantic = ArchiveService(db_path=db_path, embedder=HashingEmbedder())
+    assert semantic.reindex_vectors(batch_size=2) == 5
+    assert semantic.reindex_vectors() == 0
+    assert semantic.reindex_vectors(rebuild=True) == 5
+    assert semantic.search(ArchiveSearchQuery(query="raportti"), mode="vector").total_count == 5
+    close_pools()
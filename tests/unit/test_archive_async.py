@@ -0,0 +1,79 @@
+"""Unit tests for the async archive wrapper and tools (app/archive_async.py)."""
+
+import asyncio
+import time
+
+import pytest
+
+from app import archive_async
+from app.archive import ArchiveEntry, ArchiveSearchQuery, ArchiveService
+from app.archive_async import AsyncArchiveService
+from app.archive_tools_async import (
+    get_archived_content,
+    save_to_archive,
+    search_archive,
+)
+
+
+def test_slow_upload_does_not_block_event_loop(archive: ArchiveService) -> None:
+    store_artifact = archive._store_artifact
+
+    def slow_store(entry: ArchiveEntry) -> str:
+        time.sleep(0.3)  # e.g. a slow GCS upload
+        return store_artifact(entry)
+
+    archive._store_artifact = slow_store
+    async_archive = AsyncArchiveService(archive)
+    entry = ArchiveEntry(
+        title="Hidas", summary="-", content="Sisältö", document_type="memo",
+        agent_name="kirjoittaja",
+    )
+
+    async def main() -> tuple:
+        ticks = 0
+
+        async def ticker() -> None:
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        save = asyncio.create_task(async_archive.save(entry))
+        # Reads use their own pool and finish while the upload is running
+        result = await async_archive.search(ArchiveSearchQuery(), fields=["title"])
+        saved_id = await save
+        task.cancel()
+        return ticks, saved_id, result
+
+    ticks, saved_id, result = asyncio.run(main())
+    async_archive.close()
+
+    assert saved_id == entry.id
+    assert result.total_count == 0
+    assert ticks >= 10
+
+
+def test_async_tools(archive: ArchiveService, monkeypatch: pytest.MonkeyPatch) -> None:
+    async_archive = AsyncArchiveService(archive)
+    monkeypatch.setattr(archive_async, "_async_archive_service", async_archive)
+
+    async def main() -> tuple:
+        saved = await save_to_archive(
+            title="Erasmus-raportti", summary="Väliraportti.", content="Raportin teksti.",
+            document_type="raportti", program="erasmus", tags="nuoret, erasmus",
+        )
+        entry_id = saved.rsplit(" ", 1)[-1]
+        found = await search_archive(query="väliraportti", tags="erasmus")
+        content = await get_archived_content(entry_id)
+        entries = [
+            e async for e in async_archive.iter_search(ArchiveSearchQuery(), batch_size=1)
+        ]
+        return found, content, entries
+
+    found, content, entries = asyncio.run(main())
+    async_archive.close()
+
+    assert "Erasmus-raportti" in found
+    assert content.startswith("# Erasmus-raportti")
+    assert [e.title for e in entries] == ["Erasmus-raportti"]
@@ -0,0 +1,50 @@
+"""Unit tests for the artifact LRU cache (app/archive_cache.py)."""
+
+import time
+from pathlib import Path
+
+from app.archive_cache import ArtifactCache
+
+
+def test_lru_evicts_by_bytes() -> None:
+    cache = ArtifactCache(max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"  # a is now most recently used
+    cache.put("c", b"cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["memory_bytes"] == 8
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["bytes_fetched"] == 12
+    assert stats["bytes_served"] == 8
+
+
+def test_ttl_expires_entries() -> None:
+    cache = ArtifactCache(ttl=0.05)
+    cache.put("a", b"data")
+    assert cache.get("a") == b"data"
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_restart(tmp_path: Path) -> None:
+    cache = ArtifactCache(disk_dir=tmp_path, disk_max_bytes=10)
+    cache.put("gs://b/a.json#1", b"aaaa")
+    cache.put("gs://b/b.json#1", b"bbbb")
+    cache.put("gs://b/c.json#1", b"cccc")  # over disk budget: a is evicted
+
+    restarted = ArtifactCache(disk_dir=tmp_path, disk_max_bytes=10)
+    assert restarted.get("gs://b/a.json#1") is None
+    assert restarted.get("gs://b/c.json#1") == b"cccc"
+    assert restarted.stats()["disk_hits"] == 1
+    # Promoted to memory on the disk hit
+    assert restarted.get("gs://b/c.json#1") == b"cccc"
+    assert restarted.stats()["memory_hits"] == 1
+
+    restarted.invalidate("gs://b/c.json#1")
+    assert restarted.get("gs://b/c.json#1") is None
+    assert restarted.stats()["disk_entries"] == 1
@@ -0,0 +1,145 @@
+"""Unit tests for the Parquet export (app/archive_export.py)."""
+
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+pa_dataset = pytest.importorskip("pyarrow.dataset")
+
+from app import archive_export  # noqa: E402
+from app.archive import ArchiveEntry, ArchiveService, ToolCallRecord  # noqa: E402
+
+
+def read_export(out_dir: Path) -> dict:
+    """id -> newest exported row, as an analytics reader would merge them."""
+    table = pa_dataset.dataset(out_dir / "entries", partitioning="hive").to_table()
+    rows = {}
+    for row in sorted(table.to_pylist(), key=lambda r: r["change_seq"]):
+        rows[row["id"]] = row
+    return rows
+
+
+def test_full_export_partitions_and_nests(
+    archive: ArchiveService, tmp_path: Path
+) -> None:
+    entries = [ArchiveEntry(
+        title=f"Raportti {i}",
+        summary="Kuukausiraportti.",
+        content=f"Raportin {i} sisältö.",
+        document_type="raportti" if i % 2 else "memo",
+        agent_name="kirjoittaja",
+        prompt_packs=["org_pack_v1"],
+        tool_calls=[ToolCallRecord(tool_name="search_archive", status="success", latency_ms=i)],
+        created_at=datetime(2026, 1 + i % 3, 1, tzinfo=timezone.utc),
+    ) for i in range(12)]
+    archive.save_many(entries)
+    out_dir = tmp_path / "export"
+
+    stats = archive.export_parquet(out_dir, batch_size=5, max_buffered_rows=4)
+
+    assert stats["mode"] == "full"
+    assert stats["exported"] == 12
+    assert {p.parent.parent.name for p in out_dir.glob("entries/*/*/part-*.parquet")} == {
+        "month=2026-01", "month=2026-02", "month=2026-03"
+    }
+    rows = read_export(out_dir)
+    row = rows[entries[5].id]
+    assert row["document_type"] == "raportti"
+    assert row["month"] == "2026-03"
+    assert row["prompt_packs"] == ["org_pack_v1"]
+    assert row["tool_calls"] == [{"tool_name": "search_archive", "status": "success", "latency_ms": 5}]
+    assert row["content"] == "Raportin 5 sisältö."
+    assert not list(out_dir.rglob("*.tmp"))
+
+
+def test_incremental_export_only_changes(
+    archive: ArchiveService, tmp_path: Path
+) -> None:
+    entries = [ArchiveEntry(
+        title=f"Raportti {i}",
+        summary="Kuukausiraportti.",
+        content=f"Raportin {i} sisältö.",
+        document_type="raportti" if i % 2 else "memo",
+        agent_name="kirjoittaja",
+        prompt_packs=["org_pack_v1"],
+        tool_calls=[ToolCallRecord(tool_name="search_archive", status="success", latency_ms=i)],
+        created_at=datetime(2026, 1 + i % 3, 1, tzinfo=timezone.utc),
+    ) for i in range(6)]
+    archive.save_many(entries)
+    out_dir = tmp_path / "export"
+    archive.export_parquet(out_dir, include_content=False)
+
+    assert archive.export_parquet(out_dir, incremental=True, include_content=False)["exported"] == 0
+
+    archive.patch_metadata(entries[0].id, status="published")
+    archive.save(ArchiveEntry(
+        title="Raportti 6",
+        summary="Kuukausiraportti.",
+        content="Raportin 6 sisältö.",
+        document_type="memo",
+        agent_name="kirjoittaja",
+        prompt_packs=["org_pack_v1"],
+        tool_calls=[ToolCallRecord(tool_name="search_archive", status="success", latency_ms=6)],
+        created_at=datetime(2026, 1, 1, tzinfo=timezone.utc),
+    ))
+    archive._pool.write(
+        lambda conn: conn.execute("DELETE FROM entries WHERE id = ?", (entries[1].id,))
+    )
+    stats = archive.export_parquet(out_dir, incremental=True, include_content=False)
+
+    assert (stats["exported"], stats["deleted"]) == (2, 1)
+    rows = read_export(out_dir)
+    assert rows[entries[0].id]["status"] == "published"
+    assert "content" not in rows[entries[0].id]
+    deleted = pa_dataset.dataset(out_dir / "deleted").to_table().column("entry_id").to_pylist()
+    assert deleted == [entries[1].id]
+
+    with pytest.raises(ValueError):
+        archive.export_parquet(out_dir, incremental=True, include_content=True)
+
+    # A full export replaces the incremental parts
+    archive.export_parquet(out_dir, include_content=False)
+    assert len(read_export(out_dir)) == 6
+    assert not (out_dir / "deleted").exists()
+
+
+def test_crash_before_manifest_keeps_previous_export(
+    archive: ArchiveService, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    entries = [ArchiveEntry(
+        title=f"Raportti {i}",
+        summary="Kuukausiraportti.",
+        content=f"Raportin {i} sisältö.",
+        document_type="raportti" if i % 2 else "memo",
+        agent_name="kirjoittaja",
+        prompt_packs=["org_pack_v1"],
+        tool_calls=[ToolCallRecord(tool_name="search_archive", status="success", latency_ms=i)],
+        created_at=datetime(2026, 1 + i % 3, 1, tzinfo=timezone.utc),
+    ) for i in range(4)]
+    archive.save_many(entries)
+    out_dir = tmp_path / "export"
+    archive.export_parquet(out_dir)
+    previous = json.loads((out_dir / "_snapshot.json").read_text(encoding="utf-8"))["files"]
+    archive.patch_metadata(entries[0].id, status="published")
+
+    def crash(out_dir: Path, state: dict) -> None:
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(archive_export, "_save_state", crash)
+    with pytest.raises(KeyboardInterrupt):
+        archive.export_parquet(out_dir)
+    monkeypatch.undo()
+
+    # The old manifest still lists complete files
+    assert all((out_dir / name).exists() for name in previous)
+    table = pa_dataset.dataset([str(out_dir / name) for name in previous]).to_table()
+    assert table.num_rows == 4
+
+    archive.export_parquet(out_dir)
+    current = json.loads((out_dir / "_snapshot.json").read_text(encoding="utf-8"))["files"]
+    assert sorted(
+        p.relative_to(out_dir).as_posix() for p in out_dir.rglob("part-*.parquet")
+    ) == current
+    assert read_export(out_dir)[entries[0].id]["status"] == "published"
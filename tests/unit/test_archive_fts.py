@@ -0,0 +1,23 @@
+"""Unit tests for FTS query building and Finnish compound splitting."""
+
+from app.archive_fts import build_fts_query, split_compounds
+from app.text_utils import fold
+
+
+def test_build_fts_query() -> None:
+    assert build_fts_query("hakemu*") == '"hakemu"*'
+    assert build_fts_query('STEA-hakemus "nuorten tuki"') == '"STEA-hakemus" "nuorten tuki"'
+    assert build_fts_query("stea OR erasmus") == '"stea" OR "erasmus"'
+    assert build_fts_query("OR stea NOT") == '"stea"'
+    assert build_fts_query('"" *') == ""
+
+
+def test_split_compounds() -> None:
+    parts = split_compounds("Avustushakemuksen hankesuunnitelma").split()
+    assert "hakemuksen" in parts
+    assert "suunnitelma" in parts
+    assert split_compounds("hakemus") == ""
+
+
+def test_fold() -> None:
+    assert fold("Äänestys Åbo") == "aanestys abo"
@@ -0,0 +1,436 @@
+"""GCSArchiveService against an in-memory fake bucket (no network)."""
+
+import itertools
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+from app.archive import ArchiveEntry, ArchiveSearchQuery, GCSArchiveService
+from app.archive_cache import ArtifactCache
+from app.archive_db import close_pools
+
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str, generation: Optional[int] = None):
+        self.bucket = bucket
+        self.name = name
+        self.generation = generation
+        self.size: Optional[int] = None
+
+    def upload_from_string(self, data, content_type: str = "") -> None:
+        self.bucket.uploading.set()
+        self.bucket.gate.wait()
+        if self.bucket.fail_uploads:
+            self.bucket.fail_uploads -= 1
+            raise ConnectionError("injected upload failure")
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.generation = next(self.bucket.generations)
+        self.bucket.objects[self.name] = (self.generation, data)
+
+    def _object(self, method: str) -> Optional[Tuple[int, bytes]]:
+        self.bucket.calls.append((method, self.name))
+        time.sleep(self.bucket.latency)
+        obj = self.bucket.objects.get(self.name)
+        if obj is None or (self.generation is not None and obj[0] != self.generation):
+            return None
+        return obj
+
+    def exists(self) -> bool:
+        return self._object("exists") is not None
+
+    def delete(self) -> None:
+        if self._object("delete") is None:
+            raise FileNotFoundError(self.name)
+        del self.bucket.objects[self.name]
+
+    def download_as_bytes(self) -> bytes:
+        obj = self._object("download")
+        if obj is None:
+            raise FileNotFoundError(self.name)
+        return obj[1]
+
+    def update_storage_class(self, new_class: str, if_generation_match: Optional[int] = None) -> None:
+        # Like GCS: rewrites the object, so the generation changes
+        obj = self._object("rewrite")
+        if obj is None or (if_generation_match is not None and obj[0] != if_generation_match):
+            raise ValueError(f"412 precondition failed: {self.name}")
+        self.generation = next(self.bucket.generations)
+        self.size = len(obj[1])
+        self.bucket.objects[self.name] = (self.generation, obj[1])
+        self.bucket.storage_classes[self.name] = new_class
+
+
+class FakeBucket:
+    """Just enough of google.cloud.storage.Bucket, with a per-call latency."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.objects: Dict[str, Tuple[int, bytes]] = {}
+        self.storage_classes: Dict[str, str] = {}
+        self.calls: List[Tuple[str, str]] = []
+        self.generations = itertools.count(1000)
+        # Upload controls: fail the next N uploads / hold uploads until set
+        self.fail_uploads = 0
+        self.uploading = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def blob(self, name: str, generation: Optional[int] = None) -> FakeBlob:
+        return FakeBlob(self, name, generation)
+
+
+@pytest.fixture
+def bucket() -> FakeBucket:
+    return FakeBucket()
+
+
+@pytest.fixture
+def archive(tmp_path: Path, bucket: FakeBucket):
+    service = GCSArchiveService(
+        bucket_name="samha-test",
+        db_path=str(tmp_path / "archive.db"),
+        bucket=bucket,
+        cache=ArtifactCache(),
+    )
+    yield service
+    close_pools()
+
+
+@pytest.fixture
+def spooled(tmp_path: Path, bucket: FakeBucket):
+    service = make_spooled(tmp_path, bucket)
+    yield service
+    bucket.gate.set()
+    service.close()
+    close_pools()
+
+
+def make_spooled(tmp_path: Path, bucket: FakeBucket, dedup: bool = False) -> GCSArchiveService:
+    service = GCSArchiveService(
+        bucket_name="samha-test",
+        db_path=str(tmp_path / "archive.db"),
+        bucket=bucket,
+        cache=ArtifactCache(),
+        write_behind=True,
+        dedup=dedup,
+    )
+    service.spool.base_delay = 0.01
+    return service
+
+
+def artifact_path(archive: GCSArchiveService, entry_id: str) -> str:
+    with archive._pool.read() as conn:
+        return conn.execute(
+            "SELECT artifact_path FROM entries WHERE id = ?", (entry_id,)
+        ).fetchone()[0]
+
+
+def test_artifact_path_pins_generation(
+    archive: GCSArchiveService, bucket: FakeBucket
+) -> None:
+    entry = ArchiveEntry(
+        title="Hakemus 1",
+        summary="-",
+        content="Sisältö 1",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save(entry)
+    assert artifact_path(archive, entry.id) == f"gs://samha-test/artifacts/{entry.id}.json#1000"
+
+
+def test_repeated_lookups_hit_cache(
+    archive: GCSArchiveService, bucket: FakeBucket
+) -> None:
+    entries = [ArchiveEntry(
+        title=f"Hakemus {i}",
+        summary="-",
+        content=f"Sisältö {i}",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ) for i in range(3)]
+    archive.save_many(entries)
+    archive.cache.clear()
+
+    for _ in range(3):
+        assert archive.get(entries[0].id).content == "Sisältö 0"
+        assert len(archive.search(ArchiveSearchQuery()).entries) == 3
+
+    # One download per artifact on the first pass, nothing after
+    assert sorted(bucket.calls) == sorted(
+        ("download", f"artifacts/{e.id}.json") for e in entries
+    )
+    stats = archive.get_stats()["artifact_cache"]
+    assert stats["misses"] == 3
+    assert stats["hits"] == 9
+
+
+def test_fresh_save_is_served_from_cache(
+    archive: GCSArchiveService, bucket: FakeBucket
+) -> None:
+    entry = ArchiveEntry(
+        title="Hakemus 1",
+        summary="-",
+        content="Sisältö 1",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save(entry)
+    assert archive.get(entry.id).title == "Hakemus 1"
+    assert bucket.calls == []
+
+
+def test_search_fetches_in_parallel_in_order(tmp_path: Path) -> None:
+    bucket = FakeBucket()
+    archive = GCSArchiveService(
+        bucket_name="samha-test",
+        db_path=str(tmp_path / "archive.db"),
+        bucket=bucket,
+        cache=ArtifactCache(max_bytes=0),  # every lookup goes to the bucket
+        fetch_workers=100,
+    )
+    entries = [ArchiveEntry(
+        title=f"Hakemus {i}",
+        summary="-",
+        content=f"Sisältö {i}",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ) for i in range(100)]
+    archive.save_many(entries)
+    bucket.latency = 0.02
+
+    def page_seconds(limit: int) -> float:
+        query = ArchiveSearchQuery(limit=limit)
+        # Projection reads SQLite only: the expected row order
+        expected = [e.id for e in archive.search(query, fields=["title"]).entries]
+        bucket.calls.clear()
+        start = time.perf_counter()
+        result = archive.search(query)
+        elapsed = time.perf_counter() - start
+        assert [e.id for e in result.entries] == expected
+        assert {method for method, _ in bucket.calls} == {"download"}
+        return elapsed
+
+    small, large = page_seconds(10), page_seconds(100)
+    # Serial fetching would take 100 x 20 ms = 2 s for the large page
+    assert large < 0.5
+    assert large < small * 5
+    close_pools()
+
+
+def test_missing_artifact_is_skipped(
+    archive: GCSArchiveService, bucket: FakeBucket
+) -> None:
+    kept = ArchiveEntry(
+        title="Hakemus 1",
+        summary="-",
+        content="Sisältö 1",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    lost = ArchiveEntry(
+        title="Hakemus 2",
+        summary="-",
+        content="Sisältö 2",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save_many([kept, lost])
+    archive.cache.clear()
+    del bucket.objects[f"artifacts/{lost.id}.json"]
+
+    result = archive.search(ArchiveSearchQuery())
+    assert [e.id for e in result.entries] == [kept.id]
+    assert archive.get(lost.id) is None
+    assert all(method == "download" for method, _ in bucket.calls)
+
+
+def test_write_behind_returns_before_upload(
+    spooled: GCSArchiveService, bucket: FakeBucket
+) -> None:
+    bucket.gate.clear()
+    entry = ArchiveEntry(
+        title="Hakemus 1",
+        summary="-",
+        content="Sisältö 1",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    assert spooled.save(entry) == entry.id
+    assert bucket.objects == {}
+
+    # Served from the spool until the upload lands
+    assert spooled.get(entry.id).content == "Sisältö 1"
+    assert spooled.get_stats()["upload_spool"]["pending"] == 1
+
+    bucket.gate.set()
+    assert spooled.flush_uploads(timeout=5)
+    assert artifact_path(spooled, entry.id).endswith(f"{entry.id}.json#1000")
+    assert list(spooled.spool.spool_dir.iterdir()) == []
+    spooled.cache.clear()
+    assert spooled.get(entry.id).content == "Sisältö 1"
+
+
+def test_write_behind_retries_failed_uploads(
+    spooled: GCSArchiveService, bucket: FakeBucket
+) -> None:
+    bucket.fail_uploads = 3
+    entries = [ArchiveEntry(
+        title=f"Hakemus {i}",
+        summary="-",
+        content=f"Sisältö {i}",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ) for i in range(3)]
+    spooled.save_many(entries)
+
+    assert spooled.flush_uploads(timeout=10)
+    assert len(bucket.objects) == 3
+    stats = spooled.get_stats()["upload_spool"]
+    assert stats["retries"] == 3
+    assert stats["uploaded"] == 3
+    assert "injected upload failure" in stats["last_error"]
+
+
+def test_write_behind_resumes_after_restart(tmp_path: Path, bucket: FakeBucket) -> None:
+    bucket.fail_uploads = 10**6
+    first = make_spooled(tmp_path, bucket)
+    entry = ArchiveEntry(
+        title="Hakemus 1",
+        summary="-",
+        content="Sisältö 1",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    first.save(entry)
+    first.close()  # "crash": the upload never succeeded
+    assert bucket.objects == {}
+
+    bucket.fail_uploads = 0
+    second = make_spooled(tmp_path, bucket)
+    try:
+        assert second.get(entry.id).content == "Sisältö 1"
+        assert second.flush_uploads(timeout=5)
+        assert f"artifacts/{entry.id}.json" in bucket.objects
+        assert "#" in artifact_path(second, entry.id)
+    finally:
+        second.close()
+        close_pools()
+
+
+def test_resave_during_upload_uploads_latest(
+    spooled: GCSArchiveService, bucket: FakeBucket
+) -> None:
+    bucket.gate.clear()
+    entry = ArchiveEntry(
+        title="Hakemus 1",
+        summary="-",
+        content="Sisältö 1",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    spooled.save(entry)
+    assert bucket.uploading.wait(5)
+
+    # Rewritten while the first copy is on its way
+    spooled.save(entry.model_copy(update={"content": "Uusi sisältö"}))
+    bucket.gate.set()
+    assert spooled.flush_uploads(timeout=5)
+
+    spooled.cache.clear()
+    assert spooled.get(entry.id).content == "Uusi sisältö"
+    assert b"Uusi sis" in bucket.objects[f"artifacts/{entry.id}.json"][1]
+
+
+def test_dedup_uploads_body_once(tmp_path: Path, bucket: FakeBucket) -> None:
+    archive = GCSArchiveService(
+        bucket_name="samha-test",
+        db_path=str(tmp_path / "archive.db"),
+        bucket=bucket,
+        cache=ArtifactCache(),
+        dedup=True,
+    )
+    entry = ArchiveEntry(
+        title="Hakemus 1",
+        summary="-",
+        content="Pitkä sisältö. " * 500,
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save(entry)
+    updated = archive.update(entry.id, {"status": "ready"})
+
+    bodies = [name for name in bucket.objects if name.endswith(".body")]
+    assert len(bodies) == 1
+    assert all(
+        len(data) < 2000 for name, (_, data) in bucket.objects.items() if name.endswith(".json")
+    )
+    archive.cache.clear()
+    assert archive.get(updated.id).content == entry.content
+
+    archive._pool.write(lambda conn: conn.execute("DELETE FROM entries"))
+    assert archive.gc_blobs(grace_seconds=0)["deleted"] == 1
+    assert not any(name.endswith(".body") for name in bucket.objects)
+    close_pools()
+
+
+def test_dedup_write_behind_serves_spooled_body(
+    tmp_path: Path, bucket: FakeBucket
+) -> None:
+    bucket.gate.clear()
+    archive = make_spooled(tmp_path, bucket, dedup=True)
+    try:
+        entry = ArchiveEntry(
+            title="Hakemus 1",
+            summary="-",
+            content="Sisältö 1",
+            document_type="hakemus",
+            agent_name="kirjoittaja",
+        )
+        archive.save(entry)
+        assert archive.get(entry.id).content == "Sisältö 1"
+
+        bucket.gate.set()
+        assert archive.flush_uploads(timeout=5)
+        with archive._pool.read() as conn:
+            path = conn.execute("SELECT path FROM blobs").fetchone()[0]
+        assert path.endswith(".body#1000") or path.endswith(".body#1001")
+        archive.cache.clear()
+        assert archive.get(entry.id).content == "Sisältö 1"
+    finally:
+        archive.close()
+        close_pools()
+
+
+def test_move_to_cold_changes_storage_class(
+    archive: GCSArchiveService, bucket: FakeBucket
+) -> None:
+    entry = ArchiveEntry(
+        title="Hakemus 1",
+        summary="-",
+        content="Sisältö 1",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    overwritten = ArchiveEntry(
+        title="Hakemus 2",
+        summary="-",
+        content="Sisältö 2",
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    )
+    archive.save_many([entry, overwritten])
+    # Someone replaced the object behind the row's pinned generation
+    bucket.blob(f"artifacts/{overwritten.id}.json").upload_from_string(b"{}")
+
+    stats = archive.move_to_cold([entry.id, overwritten.id])
+
+    assert (stats["moved"], stats["skipped"]) == (1, 1)
+    assert bucket.storage_classes == {f"artifacts/{entry.id}.json": "COLDLINE"}
+    assert artifact_path(archive, entry.id) == f"gs://samha-test/artifacts/{entry.id}.json#1003"
+    archive.cache.clear()
+    assert archive.get(entry.id).content == "Sisältö 1"
@@ -0,0 +1,99 @@
+"""Unit tests for the resumable JSONL importer (app/archive_import.py)."""
+
+from pathlib import Path
+
+import pytest
+
+from app import archive_import
+from app.archive import ArchiveEntry, ArchiveSearchQuery, ArchiveService
+from app.archive_import import default_state_path, import_jsonl
+
+
+def write_jsonl(path: Path, lines: list) -> None:
+    path.write_text("".join(f"{line}\n" for line in lines), encoding="utf-8")
+
+
+def test_import_skips_bad_lines(archive: ArchiveService, tmp_path: Path) -> None:
+    entries = [ArchiveEntry(
+        title=f"Luonnos {i}",
+        summary="Vanha luonnos.",
+        content=f"Luonnoksen {i} sisältö.",
+        document_type="memo",
+        agent_name="kirjoittaja",
+    ) for i in range(5)]
+    source = tmp_path / "drafts.jsonl"
+    write_jsonl(source, [e.model_dump_json() for e in entries[:3]] + ["{oops", ""]
+                + [e.model_dump_json() for e in entries[3:]])
+
+    stats = import_jsonl(archive, source, batch_size=2)
+
+    assert stats["imported"] == 5
+    assert stats["errors"] == 1
+    assert stats["error_messages"][0].startswith("line 4:")
+    assert stats["bytes_read"] == stats["total_bytes"]
+    assert archive.get(entries[4].id).title == "Luonnos 4"
+
+
+def test_import_resumes_after_crash(archive: ArchiveService, tmp_path: Path) -> None:
+    entries = [ArchiveEntry(
+        title=f"Luonnos {i}",
+        summary="Vanha luonnos.",
+        content=f"Luonnoksen {i} sisältö.",
+        document_type="memo",
+        agent_name="kirjoittaja",
+    ) for i in range(6)]
+    source = tmp_path / "drafts.jsonl"
+    write_jsonl(source, [e.model_dump_json() for e in entries[:5]])
+
+    def crash_after_first_batch(stats: dict) -> None:
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        import_jsonl(archive, source, batch_size=2, progress=crash_after_first_batch)
+    assert archive.get(entries[1].id) is not None
+    assert archive.get(entries[2].id) is None
+
+    # Rerun continues from the checkpoint; appended lines are picked up later
+    stats = import_jsonl(archive, source, batch_size=2)
+    assert stats["imported"] == 5
+    assert stats["lines"] == 5
+
+    with open(source, "a", encoding="utf-8") as f:
+        f.write(entries[5].model_dump_json())  # no trailing newline
+    stats = import_jsonl(archive, source, batch_size=2)
+    assert stats["imported"] == 6
+    assert archive.get(entries[5].id) is not None
+    assert default_state_path(source).exists()
+
+
+def test_resume_after_commit_before_checkpoint_does_not_duplicate(
+    archive: ArchiveService, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    entries = [ArchiveEntry(
+        title=f"Luonnos {i}",
+        summary="Vanha luonnos.",
+        content=f"Luonnoksen {i} sisältö.",
+        document_type="memo",
+        agent_name="kirjoittaja",
+    ) for i in range(4)]
+    source = tmp_path / "drafts.jsonl"
+    # No ids in the file: every run must still derive the same ids
+    write_jsonl(source, [e.model_dump_json(exclude={"id"}) for e in entries])
+    save_state = archive_import._save_state
+    calls = []
+
+    def crash_on_second_save(state_path: Path, state: dict) -> None:
+        calls.append(state["offset"])
+        if len(calls) == 2:
+            raise KeyboardInterrupt  # batch 2 is committed, its state is not
+        save_state(state_path, state)
+
+    monkeypatch.setattr(archive_import, "_save_state", crash_on_second_save)
+    with pytest.raises(KeyboardInterrupt):
+        import_jsonl(archive, source, batch_size=2)
+    monkeypatch.setattr(archive_import, "_save_state", save_state)
+
+    stats = import_jsonl(archive, source, batch_size=2)
+
+    assert stats["imported"] == 4
+    assert archive.search(ArchiveSearchQuery(document_type="memo")).total_count == 4
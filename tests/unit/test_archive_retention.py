@@ -0,0 +1,215 @@
+"""Unit tests for retention, tiering and compaction (app/archive_retention.py)."""
+
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+from app.archive import ArchiveEntry, ArchiveSearchQuery, ArchiveService
+from app.archive_db import SQLitePool, close_pools
+from app.archive_retention import (
+    DEFAULT_POLICY,
+    FileRule,
+    RetentionPolicy,
+    RetentionRule,
+    plan_retention,
+    run_retention,
+)
+
+NOW = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture(params=["file", "inline"])
+def archive(request, tmp_path: Path):
+    service = ArchiveService(db_path=str(tmp_path / "archive.db"), storage=request.param)
+    yield service
+    close_pools()
+
+
+def make_versions(archive: ArchiveService, count: int, days_old: int = 200) -> list:
+    versions = []
+    for i in range(count):
+        versions.append(ArchiveEntry(
+            title="Hakemusluonnos",
+            summary="Luonnos.",
+            content="Hankkeen tavoitteena on tukea nuoria. " * 50,
+            document_type="hakemus",
+            agent_name="kirjoittaja",
+            created_at=NOW - timedelta(days=days_old - i),
+            status="ready",
+            version=i + 1,
+            parent_id=versions[-1].id if versions else None,
+        ))
+    archive.save_many(versions)
+    return versions
+
+
+def test_policy_archives_tiers_and_prunes(archive: ArchiveService) -> None:
+    stale, fresh = (
+        ArchiveEntry(
+            title="Hakemusluonnos",
+            summary="Luonnos.",
+            content="Hankkeen tavoitteena on tukea nuoria. " * 50,
+            document_type="hakemus",
+            agent_name="kirjoittaja",
+            created_at=NOW - timedelta(days=days_old),
+        )
+        for days_old in (120, 10)
+    )
+    archive.save_many([stale, fresh])
+    versions = make_versions(archive, 5)
+    chart = archive.db_path.parent / "charts" / "chart_old.png"
+    chart.parent.mkdir()
+    chart.write_bytes(b"\x89PNG" + b"0" * 1000)
+    old = (NOW - timedelta(days=100)).timestamp()
+    os.utime(chart, (old, old))
+
+    policy = RetentionPolicy(
+        rules=[RetentionRule(name="drafts", status="draft", older_than_days=90, action="archive")],
+        keep_versions=2,
+        files=[FileRule(directory="charts", older_than_days=30)],
+    )
+    plan = plan_retention(archive, policy, now=NOW)
+    assert sorted(plan["delete"]) == sorted(v.id for v in versions[:3])
+    assert (plan["archive"], plan["cold"]) == ([stale.id], [])
+    assert run_retention(archive, policy, dry_run=True, now=NOW)["deleted"] == 3
+    assert archive.get(versions[0].id) is not None
+
+    report = run_retention(archive, policy, now=NOW, blob_grace_seconds=0)
+
+    assert (report["deleted"], report["archived"], report["cold"]) == (3, 1, 1)
+    assert report["files"] == {"charts": 1}
+    assert report["reclaimed_bytes"] > 1000
+    # Tiered entries read as before
+    loaded = archive.get(stale.id)
+    assert loaded.status == "archived"
+    assert loaded.content == stale.content
+    assert archive.get(fresh.id).status == "draft"
+    assert [e.id for e in archive.lineage(versions[-1].id)] == [v.id for v in versions[3:]]
+    assert (archive.cold_dir / "charts" / "chart_old.png").exists()
+    assert not chart.exists()
+    # Nothing left to do on a second run
+    assert plan_retention(archive, policy, now=NOW) == {"delete": [], "archive": [], "cold": []}
+
+
+def test_delete_many_hands_over_lineage_head(archive: ArchiveService) -> None:
+    versions = make_versions(archive, 3)
+    stats = archive.delete_many([versions[-1].id])
+
+    assert stats["deleted"] == 1
+    assert archive.get(versions[-1].id) is None
+    latest = archive.search(ArchiveSearchQuery(latest_only=True), fields=["title"])
+    assert [e.id for e in latest.entries] == [versions[1].id]
+    assert archive.get_stats()["total_entries"] == 2
+    assert archive.search(ArchiveSearchQuery(query="tavoitteena")).total_count == 2
+
+
+def test_lineage_order_follows_version_not_timestamp(archive: ArchiveService) -> None:
+    versions = make_versions(archive, 4)
+    # Version 3 was created before version 2 (e.g. an imported history)
+    archive.save(versions[2].model_copy(update={"created_at": NOW - timedelta(days=250)}))
+    archive.save(versions[3])
+
+    policy = RetentionPolicy(keep_versions=2)
+    assert sorted(plan_retention(archive, policy, now=NOW)["delete"]) == sorted(
+        v.id for v in versions[:2]
+    )
+    archive.delete_many([versions[3].id])
+    latest = archive.search(ArchiveSearchQuery(latest_only=True), fields=["title"])
+    assert [e.id for e in latest.entries] == [versions[2].id]
+
+
+def test_default_policy_deletes_nothing(archive: ArchiveService) -> None:
+    make_versions(archive, 30, days_old=400)
+    archive.save(ArchiveEntry(
+        title="Hakemusluonnos",
+        summary="Luonnos.",
+        content="Hankkeen tavoitteena on tukea nuoria. " * 50,
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        created_at=NOW - timedelta(days=400),
+        status="draft",
+    ))
+
+    plan = plan_retention(archive, DEFAULT_POLICY, now=NOW)
+
+    assert plan["delete"] == []
+    assert len(plan["archive"]) == 1 and len(plan["cold"]) == 29
+
+
+def test_move_to_cold_skips_concurrent_resave(archive: ArchiveService) -> None:
+    entry = ArchiveEntry(
+        title="Hakemusluonnos",
+        summary="Luonnos.",
+        content="Hankkeen tavoitteena on tukea nuoria. " * 50,
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+        created_at=NOW - timedelta(days=200),
+    )
+    archive.save(entry)
+    write_cold = archive._write_cold
+
+    def resave_while_copying(row):
+        copied = write_cold(row)
+        archive.save(entry.model_copy(update={"content": "Uusi sisältö"}))
+        return copied
+
+    archive._write_cold = resave_while_copying
+    stats = archive.move_to_cold([entry.id])
+
+    assert (stats["moved"], stats["skipped"]) == (0, 1)
+    assert archive.get(entry.id).content == "Uusi sisältö"
+    assert list(archive.cold_dir.iterdir()) == []
+
+
+def test_incremental_vacuum_shrinks_database(tmp_path: Path) -> None:
+    archive = ArchiveService(db_path=str(tmp_path / "archive.db"), storage="inline")
+    entries = [ArchiveEntry(
+        title="Hakemusluonnos",
+        summary="Luonnos.",
+        content=os.urandom(2000).hex(),
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ) for _ in range(300)]
+    archive.save_many(entries)
+    archive.vacuum()
+    size = archive.database_bytes()
+
+    archive.delete_many([e.id for e in entries[:250]])
+    # FTS segments keep the deleted terms until merged
+    archive.optimize_fts()
+    result = archive.vacuum()
+
+    assert result["mode"] == "incremental"
+    assert result["freed_pages"] > 0
+    assert result["bytes_after"] < size / 2
+    close_pools()
+
+
+def test_full_vacuum_converts_legacy_database_while_writing(tmp_path: Path) -> None:
+    db_path = tmp_path / "archive.db"
+    pool = SQLitePool(db_path, pragmas={"auto_vacuum": "NONE"})
+    archive = ArchiveService(db_path=str(db_path), pool=pool, storage="inline")
+    archive.save_many([ArchiveEntry(
+        title="Hakemusluonnos",
+        summary="Luonnos.",
+        content="Hankkeen tavoitteena on tukea nuoria. " * 50,
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ) for _ in range(50)])
+    assert archive.vacuum()["mode"] == "none"
+
+    assert archive.vacuum(full=True)["mode"] == "full"
+    with pool.read() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    # The writer keeps committing normal transactions afterwards
+    archive.save(ArchiveEntry(
+        title="Uusi",
+        summary="Luonnos.",
+        content="Hankkeen tavoitteena on tukea nuoria. " * 50,
+        document_type="hakemus",
+        agent_name="kirjoittaja",
+    ))
+    assert archive.get_stats()["total_entries"] == 51
+    pool.close()
@@ -0,0 +1,105 @@
+"""Unit tests for token-budgeted context packing (app/context_packer.py)."""
+
+from dataclasses import dataclass, field
+
+import pytest
+
+from app.agents_registry import AgentMetadata, get_context_token_budget
+from app.context_packer import (
+    DEFAULT_CONTEXT_TOKEN_BUDGET,
+    EMPTY,
+    estimate_tokens,
+    pack_context,
+    record_packing,
+)
+
+SHARED = "STEA-avustusta voi hakea yleishyödyllinen yhteisö kerran vuodessa."
+
+
+@dataclass
+class Doc:
+    page_content: str
+    metadata: dict[str, object] = field(default_factory=dict)
+
+
+def test_orders_by_score_dedupes_and_keeps_sources() -> None:
+    docs = [
+        Doc(f"Hakuaika päättyy maaliskuussa. {SHARED}", {"id": "a", "relevance_score": 0.4}),
+        Doc(f"{SHARED} Raportointi tehdään vuosittain.", {
+            "id": "b", "link": "gs://kb/stea/opas.pdf", "relevance_score": 0.9
+        }),
+        Doc(SHARED, {"id": "c", "relevance_score": 0.2}),
+    ]
+
+    packed = pack_context(docs, budget=1000)
+
+    assert packed.text.splitlines()[0] == "## Context provided:"
+    assert '<Document id="b" link="gs://kb/stea/opas.pdf">' in packed.text
+    assert packed.text.index('id="b"') < packed.text.index('id="a"')
+    assert packed.text.count(SHARED) == 1
+    assert 'id="c"' not in packed.text
+    assert (packed.documents_in, packed.documents_out) == (3, 2)
+    assert packed.tokens_saved > 0
+    # The input documents are not modified (they may be cached)
+    assert docs[0].page_content.endswith(SHARED)
+
+
+def test_trims_to_budget_at_sentence_boundary() -> None:
+    sentence = "Nuorten osallisuutta vahvistetaan ryhmätoiminnalla ja vertaistuella."
+    docs = [Doc(" ".join(f"{sentence[:-1]} {i}." for i in range(40)), {"id": f"d{n}"}) for n in range(5)]
+
+    packed = pack_context(docs, budget=600)
+
+    assert packed.tokens <= 600
+    assert estimate_tokens(packed.text) == packed.tokens
+    assert packed.documents_out == 1
+    body = packed.text.split(">\n", 1)[1].split("\n</Document>")[0]
+    assert body.endswith(". …")
+    assert packed.tokens_in > 5 * 600
+
+
+def test_unscored_documents_keep_retrieval_order() -> None:
+    docs = [Doc(f"Dokumentti numero {i} kertoo eri asiasta kuin muut.", {"id": str(i)}) for i in range(3)]
+
+    packed = pack_context(docs, budget=500)
+
+    assert [packed.text.index(f'id="{i}"') for i in range(3)] == sorted(
+        packed.text.index(f'id="{i}"') for i in range(3)
+    )
+    assert packed.tokens_saved == 0
+
+
+def test_empty_and_invalid() -> None:
+    assert pack_context([], budget=100).text == EMPTY
+    with pytest.raises(ValueError):
+        pack_context([Doc("x")], budget=0)
+
+
+def test_budget_from_agent_metadata() -> None:
+    assert get_context_token_budget("tutkija") == 8000
+    assert get_context_token_budget("koulutus_draft") == get_context_token_budget("koulutus")
+    assert get_context_token_budget("unknown") == DEFAULT_CONTEXT_TOKEN_BUDGET
+    with pytest.raises(ValueError):
+        AgentMetadata(
+            id="x", display_name="X", category="output", description="",
+            allowed_tools=[], prompt_pack_versions=[], context_token_budget=0,
+        )
+
+
+def test_record_packing_keeps_running_totals() -> None:
+    state: dict[str, object] = {"context_packing": [{"agent": "vanha lista"}]}
+    packed = pack_context([Doc(SHARED, {"id": "a"})], budget=1000)
+
+    for _ in range(50):
+        record_packing(state, "tutkija", packed)
+    record_packing(state, "sote", packed)
+
+    totals = state["context_packing"]
+    assert set(totals) == {"tutkija", "sote"}
+    assert totals["tutkija"] == {
+        "calls": 50,
+        "tokens": 50 * packed.tokens,
+        "tokens_saved": 0,
+        "documents": 50,
+    }
+    assert totals["sote"]["calls"] == 1
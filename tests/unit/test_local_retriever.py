@@ -0,0 +1,152 @@
+"""Unit tests for the offline kb_documents index (app/local_retriever.py)."""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.archive_vectors import HashingEmbedder
+from app.local_retriever import LocalKnowledgeIndex, chunk_text, get_local_retriever
+
+DOCUMENTS = {
+    "stea/raportointi.md": (
+        "# STEA-avustuksen raportointi\n\n"
+        "Avustuksen saaja raportoi vuosittain toiminnan tuloksista ja talouden käytöstä."
+    ),
+    "hr/tyoaikalaki.md": (
+        "# Työaikalaki\n\nSäännöllinen työaika on enintään kahdeksan tuntia vuorokaudessa."
+    ),
+    "erasmus/ohjelma.txt": "Erasmus+ rahoittaa nuorisovaihtoja ja nuorisotyöntekijöiden liikkuvuutta.",
+}
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self):
+        super().__init__(dim=64)
+        self.embedded: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def kb(tmp_path: Path) -> Path:
+    for name, text in DOCUMENTS.items():
+        path = tmp_path / "kb" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+    return tmp_path / "kb"
+
+
+def test_chunk_text_respects_paragraphs_and_size() -> None:
+    text = "\n\n".join(["Lyhyt kappale."] * 3 + ["sana " * 100])
+
+    chunks = chunk_text(text, size=120)
+
+    assert chunks[0] == "Lyhyt kappale.\n\nLyhyt kappale.\n\nLyhyt kappale."
+    assert all(len(chunk) <= 120 for chunk in chunks)
+    assert " ".join(chunks[1:]).split() == ["sana"] * 100
+
+
+def test_search_modes_find_inflected_words(kb: Path, tmp_path: Path) -> None:
+    index = LocalKnowledgeIndex(kb, tmp_path / "index", HashingEmbedder(dim=64))
+    assert index.refresh() == {
+        "added": 3, "updated": 0, "removed": 0, "unchanged": 0, "failed": 0, "chunks": 3
+    }
+
+    # "avustuksien" / "raportoinnista" only share stems with the document
+    bm25 = index.search("avustuksien raportoinnista", k=1, mode="bm25")
+    hybrid = index.search("työajan enimmäispituus", k=1)
+    vector = index.search("nuorisovaihto", k=1, mode="vector")
+
+    assert [h.path for h in bm25] == ["stea/raportointi.md"]
+    assert [h.path for h in hybrid] == ["hr/tyoaikalaki.md"]
+    assert [h.path for h in vector] == ["erasmus/ohjelma.txt"]
+    assert index.search("   ") == []
+    with pytest.raises(ValueError):
+        index.search("stea", mode="fuzzy")
+
+
+def test_index_persists_and_updates_by_mtime(kb: Path, tmp_path: Path) -> None:
+    embedder = CountingEmbedder()
+    LocalKnowledgeIndex(kb, tmp_path / "index", embedder).refresh()
+    assert len(embedder.embedded) == 3
+    vectors = tmp_path / "index" / "vectors.f16"
+    assert vectors.stat().st_size == 3 * 64 * 2
+
+    changed = kb / "hr" / "tyoaikalaki.md"
+    changed.write_text("# Vuosilomalaki\n\nLomaa kertyy kaksi arkipäivää kuukaudessa.", encoding="utf-8")
+    stat = changed.stat()
+    os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    (kb / "erasmus" / "ohjelma.txt").unlink()
+    (kb / "uusi.md").write_text("Yhdistyksen hallitus kokoontuu kuukausittain.", encoding="utf-8")
+
+    embedder = CountingEmbedder()
+    reopened = LocalKnowledgeIndex(kb, tmp_path / "index", embedder)
+    stats = reopened.refresh()
+
+    assert stats == {
+        "added": 1, "updated": 1, "removed": 1, "unchanged": 1, "failed": 0, "chunks": 3
+    }
+    assert len(embedder.embedded) == 2
+    assert [h.path for h in reopened.search("lomaa kertyy", k=1)] == ["hr/tyoaikalaki.md"]
+    assert [h.path for h in reopened.search("raportoi talouden", k=1)] == ["stea/raportointi.md"]
+    assert reopened.search("erasmus nuorisovaihto", mode="bm25") == []
+    # Unchanged rows were copied, not re-embedded
+    expected = np.asarray(HashingEmbedder(dim=64).embed_query(DOCUMENTS["stea/raportointi.md"]))
+    stea_row = [c["path"] for c in reopened._manifest["chunks"]].index("stea/raportointi.md")
+    assert np.allclose(np.asarray(reopened._vectors[stea_row], dtype=np.float32), expected, atol=1e-3)
+    assert reopened.refresh()["unchanged"] == 3
+
+
+def test_unreadable_file_is_retried(kb: Path, tmp_path: Path) -> None:
+    (kb / "rikki.pdf").write_bytes(b"not a pdf")
+    index = LocalKnowledgeIndex(kb, tmp_path / "index", HashingEmbedder(dim=64))
+
+    assert index.refresh()["failed"] == 1
+    assert "rikki.pdf" not in index._manifest["files"]
+    assert index.refresh()["failed"] == 1
+
+    (kb / "rikki.pdf").unlink()
+    assert index.refresh()["failed"] == 0
+
+
+def test_changed_embedder_rebuilds(kb: Path, tmp_path: Path) -> None:
+    LocalKnowledgeIndex(kb, tmp_path / "index", HashingEmbedder(dim=64)).refresh()
+
+    embedder = HashingEmbedder(dim=32)
+    index = LocalKnowledgeIndex(kb, tmp_path / "index", embedder)
+
+    assert index.refresh()["added"] == 3
+    assert index.stats()["vector_bytes"] == 3 * 32 * 2
+
+
+def test_langchain_retriever(kb: Path, tmp_path: Path) -> None:
+    pytest.importorskip("langchain_core")
+    retriever = get_local_retriever(kb, tmp_path / "index", HashingEmbedder(dim=64), max_documents=2)
+
+    docs = retriever.invoke("STEA raportointi")
+
+    assert docs[0].metadata["id"] == "stea/raportointi.md#0"
+    assert "raportoi vuosittain" in docs[0].page_content
+    assert len(docs) == 2
+    assert "degraded" not in docs[0].metadata
+
+    fallback = get_local_retriever(kb, tmp_path / "index", HashingEmbedder(dim=64), fallback=True)
+    assert fallback.refresh()["unchanged"] == 3
+    assert {doc.metadata["degraded"] for doc in fallback.invoke("STEA")} == {"local_fallback"}
+
+
+def test_queries_do_not_refresh_after_the_first_build(kb: Path, tmp_path: Path) -> None:
+    pytest.importorskip("langchain_core")
+    retriever = get_local_retriever(kb, tmp_path / "index", HashingEmbedder(dim=64))
+    assert retriever.invoke("STEA raportointi")  # first query builds the index
+
+    (kb / "uusi.md").write_text("Vuosilomalaki: lomaa kertyy kuukausittain.", encoding="utf-8")
+    assert "uusi.md" not in {doc.metadata["name"] for doc in retriever.invoke("vuosilomalaki")}
+
+    # The background builder (app.retrievers) picks the change up
+    assert retriever.refresh()["added"] == 1
+    assert retriever.invoke("vuosilomalaki")[0].metadata["name"] == "uusi.md"
@@ -0,0 +1,171 @@
+"""Unit tests for the async retrieve pipeline (app/retrieval_async.py)."""
+
+import asyncio
+from dataclasses import dataclass, field
+
+import pytest
+
+from app.rank_fusion import rrf_fuse
+from app.retrieval_async import (
+    RERANK_BATCH_SIZE,
+    RERANK_CANDIDATES,
+    compress_or_passthrough,
+    multi_search,
+    rerank,
+    search_and_rerank,
+    split_queries,
+)
+
+
+@dataclass
+class Doc:
+    page_content: str
+    metadata: dict[str, object] = field(default_factory=dict)
+
+
+def doc(doc_id: str) -> Doc:
+    return Doc(f"Sisältö {doc_id}", {"id": doc_id})
+
+
+class FakeRetriever:
+    """ainvoke(query) -> RESULTS[query] after a delay; tracks concurrency."""
+
+    def __init__(self, results: dict[str, list[str]], delay: float = 0.05):
+        self.results = results
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+
+    async def ainvoke(self, query: str) -> list[Doc]:
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if query not in self.results:
+                raise TimeoutError(query)
+            return [doc(doc_id) for doc_id in self.results[query]]
+        finally:
+            self.active -= 1
+
+
+class FakeCompressor:
+    """Scores documents by a fixed table; records every call."""
+
+    def __init__(self, scores: dict[str, float], top_n: int = 3):
+        self.scores = scores
+        self.top_n = top_n
+        self.calls = []
+
+    def compress_documents(self, documents: list[Doc], query: str) -> list[Doc]:
+        self.calls.append((query, [d.metadata["id"] for d in documents]))
+        for d in documents:
+            d.metadata["relevance_score"] = self.scores.get(d.metadata["id"], 0.0)
+        ranked = sorted(documents, key=lambda d: d.metadata["relevance_score"], reverse=True)
+        return ranked[:self.top_n]
+
+
+def test_split_queries() -> None:
+    assert split_queries("STEA-rahoitus", "antirasismi;  stea-rahoitus ;\nnuoret;") == [
+        "STEA-rahoitus", "antirasismi", "nuoret"
+    ]
+    assert len(split_queries("a", ";".join("bcdefgh"))) == 5
+    with pytest.raises(ValueError):
+        split_queries("  ", " ; ")
+
+
+def test_rrf_fuse_dedupes_and_rewards_agreement() -> None:
+    fused = rrf_fuse([
+        [doc("a"), doc("b"), doc("c"), doc("b")],
+        [doc("c"), doc("d")],
+        [doc("e"), doc("c")],
+    ])
+
+    assert [d.metadata["id"] for d in fused] == ["c", "a", "e", "b", "d"]
+
+
+def test_search_and_rerank_fans_out_and_reranks_once() -> None:
+    retriever = FakeRetriever({
+        "trauma nuorisotyössä": ["salto", "mielenterveys", "stea"],
+        "mielenterveys": ["mielenterveys", "strategia"],
+        "jaksaminen": ["strategia", "salto"],
+    })
+    compressor = FakeCompressor({"strategia": 0.9, "salto": 0.8, "stea": 0.1})
+    queries = ["trauma nuorisotyössä", "mielenterveys", "jaksaminen"]
+
+    ranked = asyncio.run(search_and_rerank(retriever, compressor, queries))
+
+    assert retriever.peak == 3
+    assert len(compressor.calls) == 1
+    query, candidates = compressor.calls[0]
+    assert query == "trauma nuorisotyössä; mielenterveys; jaksaminen"
+    assert sorted(candidates) == ["mielenterveys", "salto", "stea", "strategia"]
+    assert [d.metadata["id"] for d in ranked] == ["strategia", "salto", "stea"]
+
+
+def test_failed_sub_query_is_skipped_unless_all_fail(capsys) -> None:
+    retriever = FakeRetriever({"stea": ["a"]}, delay=0)
+
+    found = asyncio.run(multi_search(retriever, ["stea", "rikki"]))
+    assert [[d.metadata["id"] for d in docs] for docs in found] == [["a"]]
+    assert "rikki" in capsys.readouterr().out
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(multi_search(retriever, ["rikki"]))
+
+
+def test_rerank_batches_large_candidate_sets() -> None:
+    docs = [doc(str(i)) for i in range(7)]
+    compressor = FakeCompressor({str(i): i / 10 for i in range(7)}, top_n=3)
+
+    ranked = asyncio.run(rerank(compressor, "kysely", docs, batch_size=3))
+
+    assert len(compressor.calls) == 3
+    assert [d.metadata["id"] for d in ranked] == ["6", "5", "4"]
+
+
+def test_default_candidates_rerank_in_parallel_batches() -> None:
+    ids = [str(i) for i in range(2 * RERANK_CANDIDATES)]
+    retriever = FakeRetriever({"nuorisotyö": ids}, delay=0)
+    compressor = FakeCompressor({i: int(i) / 100 for i in ids}, top_n=3)
+
+    ranked = asyncio.run(search_and_rerank(retriever, compressor, ["nuorisotyö"]))
+
+    assert RERANK_BATCH_SIZE < RERANK_CANDIDATES
+    assert len(compressor.calls) == -(-RERANK_CANDIDATES // RERANK_BATCH_SIZE)
+    assert sorted(i for _, batch in compressor.calls for i in batch) == sorted(
+        ids[:RERANK_CANDIDATES]
+    )
+    top = sorted(ids[:RERANK_CANDIDATES], key=int, reverse=True)[:3]
+    assert [d.metadata["id"] for d in ranked] == top
+
+
+def test_failed_rerank_keeps_order_and_marks_unranked(capsys) -> None:
+    class BrokenCompressor(FakeCompressor):
+        def compress_documents(self, documents: list[Doc], query: str) -> list[Doc]:
+            raise ConnectionError("ranking api")
+
+    docs = [doc(str(i)) for i in range(5)]
+
+    ranked = compress_or_passthrough(BrokenCompressor({}, top_n=3), "kysely", docs)
+
+    assert [d.metadata["id"] for d in ranked] == ["0", "1", "2"]
+    assert {d.metadata["degraded"] for d in ranked} == {"unranked"}
+    assert "Rerank failed" in capsys.readouterr().out
+
+
+def test_failed_rerank_batch_keeps_fusion_order(capsys) -> None:
+    class FlakyCompressor(FakeCompressor):
+        def compress_documents(self, documents: list[Doc], query: str) -> list[Doc]:
+            if documents[0].metadata["id"] == "3":
+                raise ConnectionError("ranking api")
+            return super().compress_documents(documents, query)
+
+    docs = [doc(str(i)) for i in range(7)]
+    compressor = FlakyCompressor({str(i): i / 10 for i in range(7)}, top_n=3)
+
+    ranked = asyncio.run(rerank(compressor, "kysely", docs, batch_size=3))
+
+    # Scores of the ranked batches are not merged with the unranked one
+    assert [d.metadata["id"] for d in ranked] == ["0", "1", "2"]
+    assert {d.metadata["degraded"] for d in ranked} == {"unranked"}
+    assert "Rerank failed" in capsys.readouterr().out
@@ -0,0 +1,171 @@
+"""Unit tests for the retrieve_docs result cache (app/retrieval_cache.py)."""
+
+import asyncio
+from dataclasses import dataclass, field
+
+import pytest
+
+from app import retrieval_cache
+from app.retrieval_cache import DEGRADED, RetrievalCache, normalize_query
+
+# Toy embeddings: paraphrases share a direction, the unrelated query does not
+VECTORS = {
+    "mitä stea rahoittaa": [1.0, 0.0, 0.0],
+    "mihin stea myöntää rahoitusta": [0.98, 0.2, 0.0],
+    "mikä on erasmus+": [0.0, 0.0, 1.0],
+}
+
+
+@dataclass
+class Doc:
+    page_content: str
+    metadata: dict[str, object] = field(default_factory=dict)
+
+
+class Counter:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, label: str):
+        def compute():
+            self.calls.append(label)
+            return f"tulos: {label}"
+        return compute
+
+
+def test_normalize_query() -> None:
+    assert normalize_query("  Mitä STEA\n rahoittaa?? ") == "mitä stea rahoittaa"
+    # Fullwidth letters fold to ASCII
+    assert normalize_query("\uff33\uff34\uff25\uff21") == "stea"
+
+
+def test_exact_tier_lru_and_ttl(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr("app.retrieval_cache.time.time", lambda: now[0])
+    cache = RetrievalCache(max_entries=2, ttl=60)
+    search = Counter()
+
+    first = cache.get_or_compute("kb", "Mitä STEA rahoittaa?", search("a"))
+    assert cache.get_or_compute("kb", "mitä stea rahoittaa", search("b")) == first
+    cache.get_or_compute("kb", "toinen", search("c"))
+    cache.get_or_compute("kb", "mitä stea rahoittaa", search("d"))
+    cache.get_or_compute("kb", "kolmas", search("e"))  # evicts "toinen"
+    cache.get_or_compute("kb", "toinen", search("f"))
+    now[0] += 61
+    cache.get_or_compute("kb", "toinen", search("g"))
+
+    assert search.calls == ["a", "c", "e", "f", "g"]
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["misses"]) == (2, 5)
+    assert (stats["evictions"], stats["expirations"]) == (2, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 7)
+
+
+def test_semantic_tier_reuses_paraphrases() -> None:
+    cache = RetrievalCache(embed=lambda q: VECTORS[normalize_query(q)], semantic_threshold=0.95)
+    compute = Counter()
+
+    first = cache.get_or_compute("kb", "Mitä STEA rahoittaa?", compute("mitä stea rahoittaa"))
+    paraphrase = cache.get_or_compute(
+        "kb", "Mihin STEA myöntää rahoitusta", compute("mihin stea myöntää rahoitusta")
+    )
+    other = cache.get_or_compute("kb", "Mikä on Erasmus+", compute("mikä on erasmus+"))
+    # Other data stores never share results
+    elsewhere = cache.get_or_compute(
+        "toinen", "Mihin STEA myöntää rahoitusta", compute("toinen")
+    )
+
+    assert paraphrase == first
+    assert other != first and elsewhere == "tulos: toinen"
+    assert compute.calls == ["mitä stea rahoittaa", "mikä on erasmus+", "toinen"]
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_async_lookup_shares_entries() -> None:
+    cache = RetrievalCache(embed=lambda q: VECTORS[normalize_query(q)])
+    cache.get_or_compute("kb", "Mitä STEA rahoittaa?", lambda: "sync")
+
+    async def compute() -> str:
+        await asyncio.sleep(0)
+        return "async"
+
+    async def main():
+        return [
+            await cache.aget_or_compute("kb", "mitä stea rahoittaa", compute),
+            await cache.aget_or_compute("kb", "Mihin STEA myöntää rahoitusta", compute),
+            await cache.aget_or_compute("kb", "Mikä on Erasmus+", compute),
+        ]
+
+    assert asyncio.run(main()) == ["sync", "sync", "async"]
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 2)
+
+
+def test_failing_embedder_and_compute() -> None:
+    def broken(query: str):
+        raise RuntimeError("quota")
+
+    cache = RetrievalCache(embed=broken)
+
+    def fail():
+        raise TimeoutError("search")
+
+    with pytest.raises(TimeoutError):
+        cache.get_or_compute("kb", "kysely", fail)
+    assert cache.get_or_compute("kb", "kysely", lambda: "ok") == "ok"
+    assert cache.get_or_compute("kb", "kysely", fail) == "ok"
+    # The exact hit never embeds
+    assert cache.stats()["embed_errors"] == 2
+
+
+def test_degraded_results_are_not_kept(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr("app.retrieval_cache.time.time", lambda: now[0])
+    fallback = [Doc("paikallinen", {DEGRADED: "local_fallback"})]
+    ranked = [Doc("vertex")]
+
+    cache = RetrievalCache()
+    assert cache.get_or_compute("kb", "kysely", lambda: fallback) is fallback
+    assert cache.get_or_compute("kb", "kysely", lambda: ranked) is ranked
+    assert cache.get_or_compute("kb", "kysely", lambda: fallback) is ranked
+    assert cache.stats()["degraded_skips"] == 1
+
+    # A short TTL when configured
+    cache = RetrievalCache(degraded_ttl=30)
+    cache.get_or_compute("kb", "kysely", lambda: fallback)
+    assert cache.get_or_compute("kb", "kysely", lambda: ranked) is fallback
+    now[0] += 31
+    assert cache.get_or_compute("kb", "kysely", lambda: ranked) is ranked
+
+
+def test_invalidate_per_data_store() -> None:
+    cache = RetrievalCache()
+    cache.get_or_compute("kb", "a", lambda: "1")
+    cache.get_or_compute("kb", "b", lambda: "2")
+    cache.get_or_compute("muu", "a", lambda: "3")
+
+    assert cache.invalidate("kb") == 2
+    assert cache.get_or_compute("kb", "a", lambda: "uusi") == "uusi"
+    assert cache.get_or_compute("muu", "a", lambda: "uusi") == "3"
+    assert cache.invalidate() == 2
+    assert cache.invalidate("kb") == 0
+    assert cache.stats()["invalidations"] == 4
+    with pytest.raises(ValueError):
+        RetrievalCache(semantic_threshold=0)
+
+
+def test_shared_cache_attaches_a_later_embedder(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("RETRIEVAL_CACHE_SEMANTIC", "1")
+    monkeypatch.setattr(retrieval_cache, "_retrieval_cache", None)
+    embed = VECTORS.get
+
+    # e.g. /retrieval-cache/stats before the first agent is loaded
+    cache = retrieval_cache.get_retrieval_cache()
+    assert cache.embed is None
+    assert retrieval_cache.get_retrieval_cache(embed=embed) is cache
+    assert cache.embed is embed
+    assert retrieval_cache.get_retrieval_cache(embed=lambda q: [0.0]).embed is embed
+
+    monkeypatch.setenv("RETRIEVAL_CACHE_SEMANTIC", "0")
+    monkeypatch.setattr(retrieval_cache, "_retrieval_cache", None)
+    assert retrieval_cache.get_retrieval_cache(embed=embed).embed is None
@@ -0,0 +1,48 @@
+"""Unit tests for the retriever setup (app/retrievers.py)."""
+
+import asyncio
+import sys
+
+import pytest
+
+pytest.importorskip("langchain_google_community")
+pytest.importorskip("google.adk")
+
+from app import retrievers
+from app.retrieval_cache import RetrievalCache
+
+
+@pytest.fixture
+def failed_retriever(monkeypatch: pytest.MonkeyPatch):
+    """get_retriever whose Vertex AI Search client cannot be built."""
+    monkeypatch.delenv("RETRIEVER_BACKEND", raising=False)
+    monkeypatch.setenv("LOCAL_KB_FALLBACK", "0")
+    monkeypatch.setitem(sys.modules, "google.cloud.discoveryengine_v1", None)
+    return retrievers.get_retriever(
+        project_id="samha",
+        data_store_id="samha-knowledge-base",
+        data_store_region="global",
+        embedding=None,
+    )
+
+
+def test_failed_init_raises_on_invoke_and_ainvoke(failed_retriever) -> None:
+    with pytest.raises(Exception, match="Retriever not available"):
+        failed_retriever.invoke("stea")
+    with pytest.raises(Exception, match="Retriever not available"):
+        asyncio.run(failed_retriever.ainvoke("stea"))
+
+
+def test_async_retrieve_docs_reports_failed_init(
+    failed_retriever, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    try:
+        from app import retrieval_tools_async
+    except Exception as e:  # app.tools_base needs Google credentials
+        pytest.skip(f"app.tools_base unavailable: {type(e).__name__}: {e}")
+    monkeypatch.setattr(retrieval_tools_async, "retriever", failed_retriever)
+    monkeypatch.setattr(retrieval_tools_async, "retrieval_cache", RetrievalCache())
+
+    answer = asyncio.run(retrieval_tools_async.retrieve_docs("STEA-rahoitus", "nuoret"))
+
+    assert answer.startswith("Retrieval error: Exception: Retriever not available")